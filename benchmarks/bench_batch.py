@@ -0,0 +1,64 @@
+import io
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'remind_me'))
+import batch  # noqa: E402
+from main import AddressBook, Record  # noqa: E402
+from bench_memory import letters  # noqa: E402
+
+# Commands per second of "contact batch" on a journaled book
+# Usage: python benchmarks/bench_batch.py [count ...]   (default 10000 100000)
+
+WORDS = ('call', 'meet', 'buy', 'gift', 'project', 'work', 'home', 'trip')
+
+
+def make_commands(count: int, rnd: random.Random):
+    names = []
+    for i in range(count):
+        if not names or i % 4 == 0:
+            name = 'Contact ' + letters(i)
+            names.append(name)
+            command = {'op': 'add', 'name': name, 'phone': f'0{rnd.randrange(3, 10)}{rnd.randrange(10 ** 8):08d}',
+                       'birthday': f'{rnd.randint(1950, 2010)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}',
+                       'email': f'user{i}@mail.com', 'note': f'{rnd.choice(WORDS)} #{rnd.choice(WORDS)}'}
+        else:
+            name = rnd.choice(names)
+            command = rnd.choice((
+                {'op': 'edit-email', 'name': name, 'email': f'new{i}@mail.com'},
+                {'op': 'add-phone', 'name': name,
+                    'phone': f'0{rnd.randrange(3, 10)}{rnd.randrange(10 ** 8):08d}'},
+                {'op': 'add-note', 'name': name, 'note': rnd.choice(WORDS),
+                    'tag': rnd.choice(WORDS)},
+                {'op': 'add-tag', 'name': name,
+                    'keyword': rnd.choice(WORDS), 'tag': 'extra'},
+                {'op': 'find', 'query': name[-4:]},
+            ))
+        yield json.dumps(command) + '\n'
+
+
+def measure(count: int, checkpoint: int):
+    lines = list(make_commands(count, random.Random(count)))
+    with tempfile.TemporaryDirectory() as folder:
+        filename = Path(folder) / 'contacts.pkl'
+        book = AddressBook()
+        book.save_to_file(filename)
+        out = io.StringIO()
+        start = time.perf_counter()
+        done, failed = batch.run(book, Record, lines, out, checkpoint,
+                                 lambda: book.save_to_file(filename))
+        elapsed = time.perf_counter() - start
+        if book.compactor is not None:
+            book.compactor.join()
+    print(f'{count:>9} commands | checkpoint {checkpoint or "end":>5} | {count / elapsed:9.0f} ops/s | '
+          f'{done} done, {failed} failed')
+
+
+if __name__ == '__main__':
+    for count in map(int, sys.argv[1:] or (10000, 100000)):
+        measure(count, 0)
+        measure(count, 10000)
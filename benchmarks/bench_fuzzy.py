@@ -0,0 +1,49 @@
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'remind_me'))
+from indexes import FuzzyIndex  # noqa: E402
+from generators import make_names  # noqa: E402
+
+# Build time and query time of the fuzzy name index
+# Usage: python benchmarks/bench_fuzzy.py [count ...]   (default 100000 1000000)
+
+
+def typo(name: str, rnd: random.Random) -> str:  # swap two neighbour letters of a word
+    words = name.split()
+    i = rnd.randrange(len(words))
+    word = words[i]
+    if len(word) > 3:
+        j = rnd.randrange(1, len(word) - 1)
+        words[i] = word[:j] + word[j + 1] + word[j] + word[j + 2:]
+    return ' '.join(words)
+
+
+def measure(count: int):
+    rnd = random.Random(count)
+    names = make_names(count, rnd)
+    index = FuzzyIndex()
+    start = time.perf_counter()
+    for name in names:
+        index.add(name)
+    build_time = time.perf_counter() - start
+
+    times = []
+    hits = 0
+    for name in rnd.sample(names, 100):
+        query = typo(name, rnd)
+        start = time.perf_counter()
+        found = index.find(query, 10)
+        times.append(time.perf_counter() - start)
+        hits += any(found_name == name for edits, found_name in found)
+    print(f'{count:>9} names | {len(index.words):>7} words | build {build_time:6.2f} s | '
+          f'query median {statistics.median(times) * 1000:6.2f} ms, max {max(times) * 1000:6.2f} ms | '
+          f'found {hits}/100')
+
+
+if __name__ == '__main__':
+    for count in map(int, sys.argv[1:] or (100000, 1000000)):
+        measure(count)
@@ -0,0 +1,53 @@
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'remind_me'))
+import importer  # noqa: E402
+from main import AddressBook, Record  # noqa: E402
+from bench_memory import letters  # noqa: E402
+
+# Rows per second of "contact import" on a CSV file, without and with the process pool,
+# the import alone and with the snapshot written after it
+# Usage: python benchmarks/bench_import.py [count ...]   (default 10000 100000)
+# Exit code 1 if the import alone is slower than TARGET rows/s.
+
+TARGET = 100000
+WORDS = ('call', 'meet', 'buy', 'gift', 'project', 'work', 'home', 'trip')
+
+
+def make_csv(path: Path, count: int, rnd: random.Random):
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write('name,phone,birthday,email,address,note\n')
+        for i in range(count):
+            file.write(f'Contact {letters(i)},+380 {rnd.randrange(3, 10)}{rnd.randrange(10 ** 8):08d},'
+                       f'{rnd.randint(1950, 2010)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d},'
+                       f'user{i}@mail.com,Kyiv,{rnd.choice(WORDS)} #{rnd.choice(WORDS)}\n')
+
+
+def measure(count: int, workers: int) -> float:  # -> rows per second of the import alone
+    with tempfile.TemporaryDirectory() as folder:
+        rows = Path(folder) / 'contacts.csv'
+        make_csv(rows, count, random.Random(count))
+        book = AddressBook()
+        start = time.perf_counter()
+        imported, rejected, _ = importer.import_file(book, Record, rows, workers=workers)
+        imported_at = time.perf_counter()
+        book.save_to_file(Path(folder) / 'contacts.pkl')
+        saved_at = time.perf_counter()
+    speed = count / (imported_at - start)
+    print(f'{count:>9} rows | workers {workers or "-":>2} | import {speed:9.0f} rows/s | '
+          f'with save {count / (saved_at - start):9.0f} rows/s | {imported} imported, {rejected} rejected')
+    return speed
+
+
+if __name__ == '__main__':
+    slow = False
+    for count in map(int, sys.argv[1:] or (10000, 100000)):
+        slow |= measure(count, 0) < TARGET
+        measure(count, 4)
+    if slow:
+        print(f'Below the target of {TARGET} rows/s')
+        sys.exit(1)
@@ -0,0 +1,68 @@
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'remind_me'))
+from main import AddressBook, Record  # noqa: E402
+
+# Bytes per contact and load time of the contact book
+# Usage: python benchmarks/bench_memory.py [count ...]   (default 100000 1000000)
+
+WORDS = ('call', 'meet', 'buy', 'gift', 'project', 'work', 'home', 'trip')
+
+
+def letters(number: int) -> str:  # unique letter suffix, names allow letters only
+    suffix = ''
+    while True:
+        number, rest = divmod(number, 26)
+        suffix += chr(97 + rest)
+        if not number:
+            return suffix
+
+
+def make_record(i: int, rnd: random.Random) -> Record:
+    name = ''.join(rnd.choice('abcdefghijklmnopqrstuvwxyz')
+                   for _ in range(8)).capitalize() + ' ' + letters(i)
+    phone = f'0{rnd.choice("3456789")}{rnd.randrange(10 ** 8):08d}'
+    birthday = f'{rnd.randint(1950, 2010)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}'
+    note = f'{rnd.choice(WORDS)} {rnd.choice(WORDS)} #{rnd.choice(WORDS)}'
+    return Record(name, phone, birthday, f'user{i}@mail.com', note, f'Street {i % 500}')
+
+
+def measure(count: int):
+    rnd = random.Random(count)
+    tracemalloc.start()
+    records = {}
+    for i in range(count):
+        record = make_record(i, rnd)
+        records[record.name.value] = record
+    records_size = tracemalloc.get_traced_memory()[0]
+    book = AddressBook()
+    for record in records.values():
+        book.add_record(record)
+    book_size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del records
+
+    with tempfile.TemporaryDirectory() as folder:
+        filename = Path(folder) / 'contacts.pkl'
+        start = time.perf_counter()
+        book.save_to_file(filename)
+        save_time = time.perf_counter() - start
+        size = filename.stat().st_size
+        del book
+        start = time.perf_counter()
+        AddressBook().restore_from_file(filename)
+        load_time = time.perf_counter() - start
+
+    print(f'{count:>9} contacts | records {records_size / count:8.0f} B/contact | '
+          f'with indexes {book_size / count:8.0f} B/contact | file {size / count:6.0f} B/contact | '
+          f'save {save_time:6.2f} s | load {load_time:6.2f} s')
+
+
+if __name__ == '__main__':
+    for count in map(int, sys.argv[1:] or (100000, 1000000)):
+        measure(count)
@@ -0,0 +1,77 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'remind_me'))
+from transfer import move_file  # noqa: E402
+
+# Moves of the folder sorter between file systems: move_file (copy_file_range / sendfile)
+# against a naive copy through Python buffers, both with fsync and unlink of the source,
+# one file at a time and in a pool of threads like the mover runs them.
+# Usage: python benchmarks/bench_move.py [target folder] [files] [MB per file] [workers]
+# The target has to be on another file system than the temporary folder (default /dev/shm).
+
+BUFFER = 64 * 1024
+
+
+def naive_move(source, destination):
+    with open(source, 'rb') as reader, open(destination, 'wb') as writer:
+        while True:
+            data = reader.read(BUFFER)
+            if not data:
+                break
+            writer.write(data)
+        writer.flush()
+        os.fsync(writer.fileno())
+    shutil.copystat(source, destination)
+    os.unlink(source)
+
+
+def make_files(folder, files, size):
+    block = os.urandom(1024 * 1024)
+    paths = []
+    for number in range(files):
+        path = os.path.join(folder, f'video_{number}.mp4')
+        with open(path, 'wb') as file:
+            for _ in range(size):
+                file.write(block)
+        paths.append(path)
+    return paths
+
+
+def measure(name, move, target, files, size, workers):
+    with tempfile.TemporaryDirectory(dir=os.environ.get('TMPDIR')) as source:
+        paths = make_files(source, files, size)
+        folder = tempfile.mkdtemp(dir=target)
+        try:
+            if os.stat(source).st_dev == os.stat(folder).st_dev:
+                sys.exit(f'{target} is on the file system of {source}, give a target on another one')
+            jobs = [(path, os.path.join(folder, os.path.basename(path))) for path in paths]
+            start = time.perf_counter()
+            cpu = time.process_time()
+            if workers == 1:
+                for job in jobs:
+                    move(*job)
+            else:
+                with ThreadPoolExecutor(workers) as pool:
+                    list(pool.map(move, *zip(*jobs)))
+            elapsed = time.perf_counter() - start
+            cpu = time.process_time() - cpu
+        finally:
+            shutil.rmtree(folder)
+    print(f'{name:>10} | {workers:2} workers | {files} x {size} MB in {elapsed:6.2f} s '
+          f'({files * size / elapsed:7.0f} MB/s), CPU {cpu:6.2f} s')
+
+
+if __name__ == '__main__':
+    target = sys.argv[1] if len(sys.argv) > 1 else '/dev/shm'
+    files = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    size = int(sys.argv[3]) if len(sys.argv) > 3 else 64
+    workers = int(sys.argv[4]) if len(sys.argv) > 4 else os.cpu_count() or 1
+    for count in sorted({1, workers}):
+        for name, move in (('naive', naive_move), ('move_file', move_file)):
+            measure(name, move, target, files, size, count)
@@ -0,0 +1,28 @@
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+MAIN = Path(__file__).resolve().parent.parent / 'remind_me' / 'main.py'
+
+# Cold start of the menu with an empty book: start, show menu, "9. Save & Exit"
+# Usage: python benchmarks/bench_startup.py [runs]   (default 20)
+
+
+def start_once(book) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, str(MAIN), '--book', str(book)], input='9\n', text=True,
+                   stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    with tempfile.TemporaryDirectory() as folder:
+        book = Path(folder) / 'contacts.pkl'
+        start_once(book)  # first run creates the file and warms the disk cache
+        times = [start_once(book) for _ in range(runs)]
+    print(f'{runs} runs | median {statistics.median(times) * 1000:6.0f} ms | '
+          f'min {min(times) * 1000:6.0f} ms | max {max(times) * 1000:6.0f} ms')
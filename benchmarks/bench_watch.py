@@ -0,0 +1,78 @@
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'remind_me'))
+from watcher import Watcher  # noqa: E402
+
+# Latency and throughput of the watch mode of the folder sorter, with inotify and polling.
+# Latency: files are written one by one, time from closing a file to its appearance in
+# the category folder. Throughput: a burst of files, time until all of them are sorted.
+# Usage: python benchmarks/bench_watch.py [files] [burst] [settle]   (default 50 2000 0.5)
+
+STEP = 0.002  # seconds between two checks of the category folder
+
+
+def arrivals(target, names, times, stop):  # name -> time it appeared in target
+    while not stop.is_set():
+        try:
+            listed = os.listdir(target)
+        except FileNotFoundError:
+            listed = ()
+        now = time.perf_counter()
+        for name in listed:
+            if name in names and name not in times:
+                times[name] = now
+        if len(times) == len(names):
+            return
+        time.sleep(STEP)
+
+
+def measure(polling: bool, files: int, burst: int, settle: float):
+    with tempfile.TemporaryDirectory() as root:
+        target = os.path.join(root, 'documents', 'TXT')
+        stop = threading.Event()
+        watcher = Watcher(root, settle=settle, polling=polling)
+        thread = threading.Thread(target=watcher.run, args=(stop,))
+        thread.start()
+        time.sleep(0.2)
+
+        names = {f'late {i}.txt'.replace(' ', '_'): None for i in range(files)}
+        times = {}
+        observer = threading.Thread(target=arrivals, args=(target, names, times, stop))
+        observer.start()
+        for name in names:
+            with open(os.path.join(root, name.replace('_', ' ')), 'w') as file:
+                file.write('x' * 100)
+            names[name] = time.perf_counter()
+            time.sleep(0.05)
+        observer.join(timeout=files * 0.05 + 30)
+        latencies = [times[name] - created for name, created in names.items() if name in times]
+
+        burst_names = {f'burst_{i}.txt': None for i in range(burst)}
+        burst_times = {}
+        observer = threading.Thread(target=arrivals, args=(target, burst_names, burst_times, stop))
+        start = time.perf_counter()
+        for name in burst_names:
+            with open(os.path.join(root, name), 'w') as file:
+                file.write('y' * 100)
+        observer.start()
+        observer.join(timeout=60)
+        elapsed = max(burst_times.values(), default=start) - start
+        stop.set()
+        thread.join()
+    print(f'{"polling" if polling else "inotify":>8} | settle {settle:.2f} s | latency median '
+          f'{statistics.median(latencies) * 1000:7.1f} ms, max {max(latencies) * 1000:7.1f} ms | '
+          f'burst {len(burst_times)}/{burst} files in {elapsed:5.2f} s ({len(burst_times) / elapsed:7.0f} files/s)')
+
+
+if __name__ == '__main__':
+    files = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    burst = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    settle = float(sys.argv[3]) if len(sys.argv) > 3 else 0.5
+    for polling in (False, True):
+        measure(polling, files, burst, settle)
@@ -0,0 +1,100 @@
+import io
+import random
+import sys
+import tarfile
+import zipfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'remind_me'))
+from main import AddressBook, Record  # noqa: E402
+
+# Seeded generators of test data: contact books and messy folders for the cleaner.
+# The same seed gives the same data, so timings of different commits are comparable.
+
+FIRST = ('John', 'Anna', 'Olena', 'Andriy', 'Mykola', 'Iryna', 'Taras', 'Oksana', 'Petro', 'Maria',
+         'Dmytro', 'Sofia', 'Ivan', 'Yulia', 'Serhiy', 'Natalia', 'Bohdan', 'Kateryna', 'Oleh', 'Viktoria')
+SYLLABLES = ('ko', 'len', 'ko', 'shev', 'chen', 'ma', 'ri', 'bo', 'dan', 'yuk', 'tar', 'sen', 'ov',
+             'pe', 'tro', 'li', 'su', 'hor', 'vy', 'nyk', 'ra', 'zen', 'ka', 'mel')
+WORDS = ('call', 'meet', 'buy', 'gift', 'project', 'work',
+         'home', 'trip', 'зустріч', 'подарунок')
+TAGS = ('work', 'family', 'urgent', 'birthday', 'project', 'friends')
+OPERATORS = '3456789'
+
+KNOWN_EXTENSIONS = ('jpeg', 'jpg', 'png', 'svg', 'mp3', 'ogg', 'wav', 'amr', 'mp4', 'avi', 'mov', 'mkv',
+                    'doc', 'docx', 'txt', 'pdf', 'xlsx', 'pptx', 'py')
+OTHER_EXTENSIONS = ('exe', 'iso', 'md', 'JPG', 'Mp3', '')
+FILE_WORDS = ('звіт', 'фото', 'відпустка', 'Київ', 'report', 'photo', 'final', 'draft',
+              'копія (2)', 'new file', 'їжак', 'ґанок')
+
+
+def make_names(count: int, rnd: random.Random):  # unique "First Last" names
+    names = set()
+    while len(names) < count:
+        last = ''.join(rnd.choice(SYLLABLES)
+                       for _ in range(rnd.randint(2, 4))).capitalize()
+        names.add(f'{rnd.choice(FIRST)} {last}')
+    return sorted(names)
+
+
+def make_record(name: str, i: int, rnd: random.Random) -> Record:
+    phone = f'0{rnd.choice(OPERATORS)}{rnd.randrange(10 ** 8):08d}'
+    birthday = f'{rnd.randint(1950, 2010)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}'
+    email = f'{name.replace(" ", ".").lower()}{i}@mail.com'
+    note = f'{rnd.choice(WORDS)} {rnd.choice(WORDS)} #{rnd.choice(TAGS)}'
+    record = Record(name, phone, birthday, email, note, f'Street {i % 500}')
+    if rnd.random() < 0.3:
+        record.add_phone(f'0{rnd.choice(OPERATORS)}{rnd.randrange(10 ** 8):08d}')
+    if rnd.random() < 0.3:
+        record.add_note(f'{rnd.choice(WORDS)} #{rnd.choice(TAGS)}')
+    return record
+
+
+def make_book(count: int, seed: int = 0) -> AddressBook:
+    rnd = random.Random(seed)
+    book = AddressBook()
+    book.add_records([make_record(name, i, rnd)
+                      for i, name in enumerate(make_names(count, rnd))])
+    return book
+
+
+def archive_bytes(kind: str, rnd: random.Random) -> bytes:  # small zip, tar or tar.gz with two files
+    buffer = io.BytesIO()
+    members = {f'{rnd.choice(FILE_WORDS)} {i}.txt': rnd.randbytes(
+        rnd.randint(10, 2000)) for i in range(2)}
+    if kind == 'zip':
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            for name, data in members.items():
+                archive.writestr(name, data)
+    else:
+        with tarfile.open(fileobj=buffer, mode='w:gz' if kind == 'tar.gz' else 'w') as archive:
+            for name, data in members.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def make_tree(root, files: int, seed: int = 0, archives: float = 0.02):  # messy folder to sort
+    rnd = random.Random(seed)
+    root = Path(root)
+    folders = [root]
+    for i in range(max(1, files // 20)):  # nested folders up to 4 levels, Cyrillic names too
+        parent = rnd.choice(folders)
+        if len(parent.relative_to(root).parts) < 4:
+            folder = parent / f'{rnd.choice(FILE_WORDS)} {i}'
+            folder.mkdir(parents=True, exist_ok=True)
+            folders.append(folder)
+    for i in range(files):
+        folder = rnd.choice(folders)
+        stem = f'{rnd.choice(FILE_WORDS)} {i}'
+        if rnd.random() < archives:
+            kind = rnd.choice(('zip', 'tar', 'tar.gz', 'broken'))
+            if kind == 'broken':
+                (folder / f'{stem}.zip').write_bytes(rnd.randbytes(100))
+            else:
+                (folder / f'{stem}.{kind}').write_bytes(archive_bytes(kind, rnd))
+            continue
+        extension = rnd.choice(KNOWN_EXTENSIONS if rnd.random() < 0.8 else OTHER_EXTENSIONS)
+        path = folder / (f'{stem}.{extension}' if extension else stem)
+        path.write_bytes(rnd.randbytes(rnd.randint(0, 4096)))
+    return root
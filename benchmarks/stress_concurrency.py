@@ -0,0 +1,75 @@
+import multiprocessing
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'remind_me'))
+from main import AddressBook, Record  # noqa: E402
+from bench_memory import letters  # noqa: E402
+
+# N processes change the same book at once, no change may be lost.
+# Every process adds its own contacts and adds notes to one shared contact,
+# saving every few changes; the book is checked at the end.
+# Usage: python benchmarks/stress_concurrency.py [processes] [changes] [contacts.pkl|contacts.db]
+#        (default 8 200 contacts.pkl)
+
+SAVE_EVERY = 10
+
+
+def hammer(filename, worker: int, changes: int, queue):
+    book = AddressBook()
+    book.restore_from_file(filename)
+    conflicts = set()
+    for i in range(changes):
+        book.add_record(Record(f'Worker {letters(worker)} {letters(i)}', '0991234567', None,
+                               f'worker{worker}@mail.com'))
+        book.data['Shared'].add_note(f'note {worker} {i}')
+        if i % SAVE_EVERY == SAVE_EVERY - 1:
+            book.save_to_file(filename)
+            conflicts |= book.conflicts
+            book.conflicts.clear()
+    book.save_to_file(filename)
+    if book.compactor is not None:
+        book.compactor.join()
+    queue.put(len(conflicts | book.conflicts))
+
+
+def stress(processes: int, changes: int, name: str):
+    with tempfile.TemporaryDirectory() as folder:
+        filename = str(Path(folder) / name)
+        book = AddressBook()
+        book.add_record(Record('Shared', '0991234567', None, 'shared@mail.com'))
+        book.save_to_file(filename)
+        if hasattr(book.data, 'close'):
+            book.data.close()
+
+        queue = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=hammer, args=(filename, worker, changes, queue))
+                   for worker in range(processes)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        conflicts = sum(queue.get() for _ in workers)
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+
+        book = AddressBook()
+        book.restore_from_file(filename)
+        contacts = sum(1 for name in book.data if name.startswith('Worker '))
+        notes = {note.value for note in book.data['Shared'].notes}
+        expected = {f'note {worker} {i}' for worker in range(processes)
+                    for i in range(changes)}
+    lost = processes * changes - contacts + len(expected - notes)
+    print(f'{processes} processes x {changes} changes on {name} | {elapsed:6.2f} s | '
+          f'contacts {contacts}/{processes * changes} | shared notes {len(notes & expected)}/{len(expected)} | '
+          f'merged conflicts {conflicts} | {"OK" if not lost else f"LOST {lost}"}')
+    return not lost
+
+
+if __name__ == '__main__':
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    changes = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    name = sys.argv[3] if len(sys.argv) > 3 else 'contacts.pkl'
+    sys.exit(0 if stress(processes, changes, name) else 1)
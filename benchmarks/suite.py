@@ -0,0 +1,160 @@
+from contextlib import redirect_stdout
+from datetime import date
+from pathlib import Path
+import argparse
+import io
+import json
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'remind_me'))
+from main import AddressBook  # noqa: E402
+from cleaner import clean  # noqa: E402
+import generators  # noqa: E402
+
+# Benchmark suite: times every operation on generated data, tracks its peak memory
+# and compares the results with a stored baseline.
+# Usage: python benchmarks/suite.py [--contacts N] [--files N] [--repeat N] [--only NAME ...]
+#                                   [--save FILE] [--compare FILE] [--tolerance 0.2]
+
+BASELINE = Path(__file__).resolve().parent / 'baseline.json'
+TODAY = date(2024, 6, 15)  # fixed, so birthday queries do the same work every day
+
+
+class Case:  # setup() -> state once per run, run(state) is measured, teardown(state) after it
+    def __init__(self, name, run, setup=None, teardown=None):
+        self.name = name
+        self.run = run
+        self.setup = setup or (lambda: None)
+        self.teardown = teardown or (lambda state: None)
+
+
+def cases(book: AddressBook, folder: Path, files: int):
+    snapshot = folder / 'restore.pkl'
+    names = list(book.data)
+    queries = [names[i][:4].lower() for i in range(0, len(names), max(1, len(names) // 20))]
+    typos = [name[:2] + name[3] + name[2] + name[4:]
+             for name in names[::max(1, len(names) // 20)]]
+
+    def fresh_book():  # indexes are built on first use
+        copy = AddressBook()
+        copy.add_records(list(book.data.values()))
+        return copy
+
+    def warm_book():
+        copy = fresh_book()
+        for index in copy.indexes:
+            copy.fresh(index)
+        return copy
+
+    def unsaved_book():
+        return fresh_book(), Path(tempfile.mkdtemp(dir=folder)) / 'contacts.pkl'
+
+    def restored_book():
+        copy = AddressBook()
+        copy.restore_from_file(snapshot)
+        return copy
+
+    def tree():
+        root = Path(tempfile.mkdtemp(dir=folder))
+        return generators.make_tree(root, files, seed=files)
+
+    def remove(path):
+        shutil.rmtree(path, ignore_errors=True)
+
+    def quiet_clean(root):  # the cleaner prints folders it could not remove
+        with redirect_stdout(io.StringIO()):
+            clean(root)
+
+    fresh_book().save_to_file(snapshot)
+    return [
+        Case('search', lambda copy: [copy.search(query) for query in queries], warm_book),
+        Case('search_cold', lambda copy: copy.search(queries[0]), fresh_book),
+        Case('find_similar', lambda copy: [copy.find_similar(query) for query in typos], warm_book),
+        Case('find_similar_cold', lambda copy: copy.find_similar(typos[0]), fresh_book),
+        Case('birthdays_within', lambda copy: copy.birthdays_within(7, TODAY), warm_book),
+        Case('days_to_birthday', lambda copy: [record.days_to_birthday()
+             for record in copy.data.values()], fresh_book),
+        Case('save_to_file', lambda state: state[0].save_to_file(state[1]), unsaved_book,
+             lambda state: remove(state[1].parent)),
+        Case('restore_from_file', lambda state: restored_book()),
+        Case('clean', quiet_clean, tree, remove),
+    ]
+
+
+def measure(case: Case, repeat: int):
+    times = []
+    for _ in range(repeat):
+        state = case.setup()
+        start = time.perf_counter()
+        case.run(state)
+        times.append(time.perf_counter() - start)
+        case.teardown(state)
+    state = case.setup()  # separate run for memory, tracing slows the code down
+    tracemalloc.start()
+    case.run(state)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    case.teardown(state)
+    return {'median': statistics.median(times), 'min': min(times), 'peak_bytes': peak}
+
+
+def compare(results, baseline, tolerance):  # -> number of slower operations
+    slower = 0
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f'{name:<20} new')
+            continue
+        ratio = result['min'] / before['min'] if before['min'] else float('inf')  # min is the least noisy
+        memory = result['peak_bytes'] / before['peak_bytes'] if before['peak_bytes'] else 1
+        verdict = 'SLOWER' if ratio > 1 + tolerance else 'faster' if ratio < 1 - tolerance else 'same'
+        slower += verdict == 'SLOWER'
+        print(f'{name:<20} time x{ratio:5.2f}  memory x{memory:5.2f}  {verdict}')
+    return slower
+
+
+def run():
+    parser = argparse.ArgumentParser(description='RemindMe benchmark suite')
+    parser.add_argument('--contacts', type=int, default=20000)
+    parser.add_argument('--files', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', nargs='*', help='names of operations to run')
+    parser.add_argument('--save', nargs='?', const=BASELINE, help=f'store results as baseline (default {BASELINE.name})')
+    parser.add_argument('--compare', nargs='?', const=BASELINE, help='compare with a stored baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='relative change of time reported as slower or faster')
+    args = parser.parse_args()
+
+    book = generators.make_book(args.contacts, args.seed)
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        for case in cases(book, Path(folder), args.files):
+            if args.only and case.name not in args.only:
+                continue
+            results[case.name] = measure(case, args.repeat)
+            result = results[case.name]
+            print(f'{case.name:<20} median {result["median"] * 1000:9.2f} ms  min {result["min"] * 1000:9.2f} ms  '
+                  f'peak {result["peak_bytes"] / 2 ** 20:8.1f} MiB')
+
+    report = {'contacts': args.contacts, 'files': args.files, 'seed': args.seed,
+              'python': platform.python_version(), 'results': results}
+    if args.save:
+        Path(args.save).write_text(json.dumps(report, indent=2))
+        print(f'Baseline saved to {args.save}')
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        if (baseline['contacts'], baseline['files']) != (args.contacts, args.files):
+            print('Warning: baseline was measured on other sizes')
+        return 1 if compare(results, baseline['results'], args.tolerance) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(run())
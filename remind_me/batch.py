@@ -0,0 +1,131 @@
+from datetime import date
+import json
+
+# Non-interactive batch mode of the contact book.
+# Every input line is a JSON command, e.g.
+#   {"op": "add-phone", "name": "John", "phone": "0991234567"}
+# All commands are applied to one loaded book, the book is saved every
+# `checkpoint` commands and at the end. For every command one JSON line with
+# the result is written: {"line": 1, "op": "add-phone", "ok": true, "result": ...}
+# Clients of the daemon which show records themselves (the menu, import) also use
+# add-records, call (a method of a record), search, similar and page, which take and
+# return records as record_dict.
+
+OPS = ('add', 'edit-email', 'add-phone', 'add-note', 'add-tag', 'delete', 'find', 'get', 'birthdays',
+       'add-records', 'call', 'search', 'similar', 'page')
+RECORD_CALLS = ('add_phone', 'remove_phone', 'edit_email', 'add_note', 'edit_note', 'delete_note',
+                'add_tag', 'remove_tag', 'sort_notes')  # changes of a record a client may ask for
+
+
+def arg(command, key):
+    if command.get(key) is None:
+        raise ValueError(f'Missing argument {key}')
+    return command[key]
+
+
+def record_of(book, command):
+    name = arg(command, 'name')
+    record = book.data.get(name)
+    if record is None:
+        raise KeyError(f"Contact '{name}' not found.")
+    return record
+
+
+def record_dict(record):
+    return {'name': record.name.value, 'phones': [phone.value for phone in record.phones],
+            'birthday': record.birthday.value.isoformat() if record.birthday.value else None,
+            'email': record.email.value, 'address': record.address.value,
+            'notes': [note.value for note in record.notes]}
+
+
+def record_from(record_cls, values):  # record of a record_dict, the values were validated by its sender
+    birthday = values['birthday']
+    return record_cls.stored(values['name'], date.fromisoformat(birthday) if birthday else None, values['phones'],
+                             values['email'], values['address'], values['notes'])
+
+
+def cursor(after):  # cursors of sorted pages are tuples, JSON makes lists of them
+    return tuple(after) if isinstance(after, list) else after
+
+
+def execute(book, record_cls, command):  # -> result of the command, raises on error
+    op = command.get('op')
+    if op == 'add':
+        name = arg(command, 'name')
+        if name in book.data:
+            raise ValueError(f"Contact '{name}' already exists.")
+        book.add_record(record_cls(name, command.get('phone'), command.get('birthday'), command.get('email', ''),
+                                   command.get('note'), command.get('address')))
+        return name
+    if op == 'edit-email':
+        return record_of(book, command).edit_email(arg(command, 'email'))
+    if op == 'add-phone':
+        record = record_of(book, command)
+        record.add_phone(arg(command, 'phone'))
+        return [phone.value for phone in record.phones]
+    if op == 'add-note':
+        return record_of(book, command).add_note(arg(command, 'note'), command.get('tag'))
+    if op == 'add-tag':
+        return record_of(book, command).add_tag(arg(command, 'keyword'), arg(command, 'tag'))
+    if op == 'delete':
+        return book.delete(arg(command, 'name'))
+    if op == 'find':
+        return [record.name.value for record in book.search(arg(command, 'query'))]
+    if op == 'get':
+        return record_dict(record_of(book, command))
+    if op == 'birthdays':  # [days to birthday, name] for the next days, with "records": true record_dict for name
+        show = record_dict if command.get('records') else lambda record: record.name.value
+        return [[left, show(record)] for left, record in book.birthdays_within(int(arg(command, 'days')))]
+    if op == 'add-records':  # bulk add, existing names are merged -> [[name, why it was rejected]]
+        try:
+            from . import importer
+        except ImportError:  # started as a script: python main.py
+            import importer
+        records, rejects = importer.validate(arg(command, 'records'), record_cls)
+        book.add_records(records)
+        return [[row.get('name'), reason] for row, reason in rejects]
+    if op == 'call':  # -> {"result": text the method returned, "record": record_dict after the call}
+        method = arg(command, 'method')
+        if method not in RECORD_CALLS:
+            raise ValueError(f'Unknown method {method}, use one of: {", ".join(RECORD_CALLS)}')
+        record = record_of(book, command)
+        result = getattr(record, method)(*command.get('args', ()))
+        return {'result': result if isinstance(result, str) else None, 'record': record_dict(record)}
+    if op == 'search':
+        return [record_dict(record) for record in book.search(arg(command, 'query'))]
+    if op == 'similar':  # [edits, record_dict] closest first
+        return [[edits, record_dict(record)] for edits, record in book.find_similar(arg(command, 'query'))]
+    if op == 'page':  # {"records": [record_dict], "after": cursor of the next page}, "sort" as AddressBook.pages
+        sort = command.get('sort')
+        after = cursor(command.get('after'))
+        records = book.page(sort, after, int(command.get('size', 10)))
+        if records:
+            after = (after or 0) + len(records) if sort is None else book.sort_key(sort, records[-1])
+        return {'records': [record_dict(record) for record in records], 'after': after}
+    raise ValueError(f'Unknown op {op}, use one of: {", ".join(OPS)}')
+
+
+def run(book, record_cls, lines, out, checkpoint=0, save=None):  # -> (done, failed)
+    done = failed = 0
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        result = {'line': number}
+        try:
+            command = json.loads(line)
+            result['op'] = command.get('op')
+            result['result'] = execute(book, record_cls, command)
+            result['ok'] = True
+            done += 1
+        except KeyError as e:  # contact not found
+            result.update(ok=False, error=e.args[0])
+            failed += 1
+        except (ValueError, TypeError, AttributeError) as e:
+            result.update(ok=False, error=str(e))
+            failed += 1
+        out.write(json.dumps(result, ensure_ascii=False) + '\n')
+        if save and checkpoint and (done + failed) % checkpoint == 0:
+            save()
+    if save:
+        save()
+    return done, failed
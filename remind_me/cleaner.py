@@ -1,180 +1,589 @@
-from pathlib import Path
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
+from stat import S_ISREG
+import hashlib
+import os
 import shutil
+import signal
 import re
+import tarfile
+import threading
+import zipfile
+try:
+    from . import metrics
+    from .manifest import Manifest
+    from .movelog import BATCH, MoveLog, undo
+    from .transfer import move_file
+except ImportError:  # started as a script: python main.py
+    import metrics
+    from manifest import Manifest
+    from movelog import BATCH, MoveLog, undo
+    from transfer import move_file
 
+# Folder sorter: files are moved into category folders by extension, archives are
+# unpacked, emptied folders removed. The folder is walked once with os.scandir and
+# every file is handed to the move stage as soon as it is found. Archives are
+# unpacked afterwards in a pool of processes, decompression is CPU bound.
 
-def clean(folder: Path):
-    # normalize
-    CYRILLIC_SYMBOLS = 'абвгдеєжзіийклмнопрстуфхцчшщьюяєїґ'
-    TRANSLATION = ("a", "b", "v", "h", "d", "e", "ie", "j", "z", "i", "y", "j", "k", "l", "m", "n", "o", "p", "r", "s", "t", "u",
-                   "f", "kh", "ts", "ch", "sh", "shch", "", "iy", "ia", "e", "yi", "h")
-    ACCORD = dict()
-    for cyril, latin in zip(CYRILLIC_SYMBOLS, TRANSLATION):
-        ACCORD[ord(cyril)] = latin
-        ACCORD[ord(cyril.upper())] = latin.capitalize()
-
-    def normalize(name: str) -> str:
-        translate_name = re.sub(r'[^\w.]', '_', name.translate(ACCORD))
-        return translate_name
-    # parser
-    JPEG_IMG = []
-    JPG_IMG = []
-    PNG_IMG = []
-    SVG_IMG = []
-    # 'MP3', 'OGG', 'WAV', 'AMR'
-    MP3_AUDIO = []
-    OGG_AUDIO = []
-    WAV_AUDIO = []
-    AMR_AUDIO = []
-    # 'AVI', 'MP4', 'MOV', 'MKV'
-    MP4_VIDEO = []
-    AVI_VIDEO = []
-    MOV_VIDEO = []
-    MKV_VIDEO = []
-    # 'DOC', 'DOCX', 'TXT', 'PDF', 'XLSX', 'PPTX, PY
-    DOC_DOC = []
-    DOCX_DOC = []
-    TXT_DOC = []
-    PDF_DOC = []
-    XLSX_DOC = []
-    PPTX_DOC = []
-    PY_DOC = []
-    # 'ZIP', 'GZ', 'TAR'
-    ZIP_ARCH = []
-    GZ_ARCH = []
-    TAR_ARCH = []
-    NOT_DEFINED = []
-
-    REGISTER_EXTENSION = {
-        'JPEG': JPEG_IMG,
-        'JPG': JPG_IMG,
-        'PNG': PNG_IMG,
-        'SVG': SVG_IMG,
-        'OGG': OGG_AUDIO,
-        'WAV': WAV_AUDIO,
-        'AMR': AMR_AUDIO,
-        'MP3': MP3_AUDIO,
-        'MP4': MP4_VIDEO,
-        'AVI': AVI_VIDEO,
-        'MOV': MOV_VIDEO,
-        'MKV': MKV_VIDEO,
-        'DOC': DOC_DOC,
-        'DOCX': DOCX_DOC,
-        'TXT': TXT_DOC,
-        'PDF': PDF_DOC,
-        'XLSX': XLSX_DOC,
-        'PPTX': PPTX_DOC,
-        'PY': PY_DOC,
-        'ZIP': ZIP_ARCH,
-        'GZ': GZ_ARCH,
-        'TAR': TAR_ARCH
-    }
-
-    FOLDERS = []
-    EXTENSIONS = set()
-    UNKNOWN = set()
-
-    def get_extension(name: str) -> str:
-        return Path(name).suffix[1:].upper()
-    # folder
-
-    def scan(folder: Path):
-        for item in folder.iterdir():
-            if item.is_dir():
-                if item.name not in ('archives', 'video', 'audio', 'documents', 'images', 'not_defined'):
-                    FOLDERS.append(item)
-                    scan(item)
-                continue
-            extension = get_extension(item.name)  # gex file extention
-            full_name = folder / item.name  # full path to file
-            if not extension:
-                NOT_DEFINED.append(full_name)
+CATEGORIES = {  # category folder -> extensions, each gets its own subfolder
+    'images': ('JPEG', 'JPG', 'PNG', 'SVG'),
+    'audio': ('MP3', 'OGG', 'WAV', 'AMR'),
+    'video': ('AVI', 'MP4', 'MOV', 'MKV'),
+    'documents': ('DOC', 'DOCX', 'TXT', 'PDF', 'XLSX', 'PPTX', 'PY'),
+    'archives': ('ZIP', 'GZ', 'TAR'),
+}
+NOT_DEFINED = 'not_defined'  # folder of files with unknown or no extension
+TARGETS = {extension: os.path.join(category, extension)
+           for category, extensions in CATEGORIES.items() for extension in extensions}
+ARCHIVES = frozenset(CATEGORIES['archives'])
+SKIPPED = frozenset(CATEGORIES) | {NOT_DEFINED}  # sorted files are not scanned again
+IN_FLIGHT = 1024  # moves given to the pool and not finished yet
+MAX_UNPACKED = 1024 ** 3  # bytes one archive may unpack to
+ARCHIVE_TIMEOUT = 300  # seconds one archive may take to unpack
+TAR_FILTER = {'filter': 'data'} if hasattr(tarfile, 'data_filter') else {}  # no links or paths out of the folder
+BLOCK = 64 * 1024  # bytes hashed from the start and from the end to tell files of one size apart
+
+Event = namedtuple('Event', 'kind path target detail')  # what a run did, see events()
+
+# normalize
+CYRILLIC_SYMBOLS = 'абвгдеєжзіийклмнопрстуфхцчшщьюяєїґ'
+TRANSLATION = ("a", "b", "v", "h", "d", "e", "ie", "j", "z", "i", "y", "j", "k", "l", "m", "n", "o", "p", "r", "s", "t", "u",
+               "f", "kh", "ts", "ch", "sh", "shch", "", "iy", "ia", "e", "yi", "h")
+ACCORD = dict()
+for cyril, latin in zip(CYRILLIC_SYMBOLS, TRANSLATION):
+    ACCORD[ord(cyril)] = latin
+    ACCORD[ord(cyril.upper())] = latin.capitalize()
+NOT_WORD = re.compile(r'[^\w.]')
+
+
+def normalize(name: str) -> str:
+    return NOT_WORD.sub('_', name.translate(ACCORD))
+
+
+def get_extension(name: str) -> str:
+    return os.path.splitext(name)[1][1:].upper()
+
+
+def scan(root, folders, manifest=None, children=None, skipped=None):  # DirEntry of every file under root
+    # found folders are appended to folders and their subfolder names put in children;
+    # folders the manifest knows unchanged are not listed, only their subfolders walked,
+    # and appended to skipped
+    stack = [root]  # no recursion, depth of the tree is not limited
+    while stack:
+        folder = stack.pop()
+        subfolders = manifest.subfolders(folder) if manifest is not None else None
+        if subfolders is None:
+            subfolders = []
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):  # type from the directory listing, no stat
+                        if entry.name not in SKIPPED:
+                            subfolders.append(entry.name)
+                    else:
+                        yield entry
+        else:
+            metrics.count('clean.folders_skipped')
+            if skipped is not None:
+                skipped.append(folder)
+        if children is not None:
+            children[folder] = subfolders
+        for name in subfolders:
+            path = os.path.join(folder, name)
+            folders.append(path)
+            stack.append(path)
+
+
+def unique_name(name: str, taken) -> str:  # 'a.jpg' -> 'a_1.jpg', 'a_2.jpg', ... while the name is taken
+    if name not in taken:
+        return name
+    stem, suffix = os.path.splitext(name)
+    number = 1
+    while f'{stem}_{number}{suffix}' in taken:
+        number += 1
+    return f'{stem}_{number}{suffix}'
+
+# Class for a batch of moves in the move journal, marked done when all of them are
+
+
+class Batch:
+    def __init__(self, log, moves):
+        self.log = log
+        self.index = log.write(('move', moves))
+        self.left = len(moves)
+        self.failed = False
+        self.lock = threading.Lock()
+
+    def finished(self, future):  # callback of every move of the batch
+        with self.lock:
+            self.left -= 1
+            self.failed = self.failed or future.exception() is not None
+            if self.left == 0 and not self.failed:  # a failed batch is checked again by resume
+                self.log.done(self.index)
+
+# Class for the move stage, renames run in a pool of threads
+
+
+class Mover:
+    # names are chosen in the order files come, before moving, so the result does not
+    # depend on the order threads finish in; a name already taken gets a number
+    def __init__(self, workers=None, manifest=None, dry_run=False, log=None):
+        self.taken = {}  # target folder -> names in it
+        self.cached = {}  # target folder -> its files from the manifest, None if it changed
+        self.manifest = manifest
+        self.dry_run = dry_run  # names are chosen, nothing is moved
+        self.log = log  # MoveLog: moves wait until BATCH of them are written to it
+        self.batch = []
+        self.pool = None if workers == 1 or dry_run else ThreadPoolExecutor(workers)
+        self.pending = deque()
+        self.moved = 0
+        self.errors = []  # OSError of failed moves, taken by the caller
+        self.failed = set()  # folders files could not be moved out of, listed again by the next run
+
+    def names(self, target):  # names taken in the target folder
+        names = self.taken.get(target)
+        if names is None:  # every target folder is created and listed once
+            files = self.cached[target] = self.manifest.files(target) if self.manifest is not None else None
+            if files is not None:
+                names = set(files)
+            elif self.dry_run:
+                names = set(os.listdir(target)) if os.path.isdir(target) else set()
             else:
+                os.makedirs(target, exist_ok=True)
+                names = set(os.listdir(target))
+            self.taken[target] = names
+        return names
+
+    def move(self, path, target, name):
+        names = self.names(target)
+        name = unique_name(name, names)
+        names.add(name)
+        destination = os.path.join(target, name)
+        if self.dry_run:
+            pass
+        elif self.log is not None:
+            self.batch.append((path, destination))
+            if len(self.batch) >= BATCH:
+                self.submit()
+        elif self.pool is None:
+            try:
+                move_file(path, destination)
+            except OSError as e:
+                self.fail(path, e)
+        else:  # rename is a syscall, on network mounts most of the time is waiting for it;
+            # copies between file systems run in parallel the same way
+            self.pending.append((self.pool.submit(move_file, path, destination), path))
+            if len(self.pending) > IN_FLIGHT:
+                self.wait()
+        self.moved += 1
+        return destination
+
+    def fail(self, path, error):
+        self.errors.append(error)
+        self.failed.add(os.path.dirname(path))
+
+    def wait(self):  # for the oldest move in flight
+        future, path = self.pending.popleft()
+        try:
+            future.result()
+        except OSError as e:
+            self.fail(path, e)
+
+    def submit(self):  # write the batch to the journal, then move it
+        moves, self.batch = self.batch, []
+        if not moves:
+            return
+        if self.pool is None:
+            index = self.log.write(('move', moves))
+            errors = len(self.errors)
+            for path, destination in moves:
                 try:
-                    REGISTER_EXTENSION[extension].append(full_name)
-                    EXTENSIONS.add(extension)
-                except KeyError:
-                    UNKNOWN.add(extension)
-                    NOT_DEFINED.append(full_name)
-
-    def handle_media(file_name: Path, target_folder: Path):
-        target_folder.mkdir(exist_ok=True, parents=True)
-        file_name.replace(target_folder / normalize(file_name.name))
-
-    def handle_archive(file_name: Path, target_folder: Path):
-        target_folder.mkdir(exist_ok=True, parents=True)
-        folder_for_file = target_folder / \
-            normalize(file_name.name.replace(file_name.suffix, ''))
-        folder_for_file.mkdir(exist_ok=True, parents=True)
+                    move_file(path, destination)
+                except OSError as e:
+                    self.fail(path, e)
+            if len(self.errors) == errors:  # a failed batch is checked again by resume
+                self.log.done(index)
+            return
+        batch = Batch(self.log, moves)
+        for path, destination in moves:
+            future = self.pool.submit(move_file, path, destination)
+            future.add_done_callback(batch.finished)
+            self.pending.append((future, path))
+            if len(self.pending) > IN_FLIGHT:
+                self.wait()
+
+    def flush(self):  # wait for the moves given so far -> their errors
+        if self.log is not None:
+            self.submit()
+        while self.pending:
+            self.wait()
+        errors, self.errors = self.errors, []
+        return errors
+
+    def close(self):  # wait for all moves, their errors stay in errors
+        try:
+            if self.log is not None:
+                self.submit()
+            while self.pending:
+                self.wait()
+        finally:
+            if self.pool is not None:
+                self.pool.shutdown()
+
+
+def timed_out(signum, frame):
+    raise TimeoutError('unpacking took too long')
+
+
+def extract(path, folder, extension, max_size=MAX_UNPACKED, timeout=ARCHIVE_TIMEOUT):  # -> None or error
+    # runs in a worker process; sizes are checked member by member before writing,
+    # so an archive bomb stops at the limit
+    alarm = bool(timeout) and hasattr(signal, 'SIGALRM') and threading.current_thread() is threading.main_thread()
+    if alarm:
+        previous = signal.signal(signal.SIGALRM, timed_out)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        os.makedirs(folder, exist_ok=True)
+        size = 0
+        if extension == 'ZIP':
+            with zipfile.ZipFile(path) as archive:
+                for member in archive.infolist():
+                    size += member.file_size
+                    if size > max_size:
+                        return f'unpacks to more than {max_size} bytes'
+                    archive.extract(member, folder)
+        else:
+            with tarfile.open(path) as archive:
+                for member in archive:
+                    size += member.size
+                    if size > max_size:
+                        return f'unpacks to more than {max_size} bytes'
+                    archive.extract(member, folder, **TAR_FILTER)
+    except Exception as e:  # any broken archive is reported, not the whole run stopped
+        return str(e) or type(e).__name__
+    finally:
+        if alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+    return None
+
+
+def unpack(archives, root, mover, workers=None, max_size=MAX_UNPACKED, timeout=ARCHIVE_TIMEOUT):
+    # -> Event per archive; every archive is unpacked into a folder named after it next to
+    # the other archives of its type and then moved there; a broken one is moved there as it is
+    jobs = []
+    destinations = []
+    for path, extension in archives:  # folders and archives are named in order, like moved files
+        target = os.path.join(root, TARGETS[extension])
+        names = mover.names(target)
+        name = os.path.basename(path)
+        folder = unique_name(normalize(name.replace(os.path.splitext(name)[1], '')), names)
+        names.add(folder)
+        jobs.append((path, os.path.join(target, folder), extension))
+        name = unique_name(normalize(name), names)
+        names.add(name)
+        destinations.append(os.path.join(target, name))
+    if mover.dry_run:
+        for (path, folder, extension), destination in zip(jobs, destinations):
+            yield Event('unpack', path, folder, destination)
+        return
+    if mover.log is not None and jobs:
+        index = mover.log.write(('unpack', [(path, folder, destination)
+                                            for (path, folder, extension), destination in zip(jobs, destinations)]))
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(jobs) < 2:  # no processes to start
+        results = [extract(*job, max_size, timeout) for job in jobs]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(extract, *zip(*jobs), repeat(max_size), repeat(timeout)))
+    for (path, folder, extension), destination, error in zip(jobs, destinations, results):
+        if error is not None:
+            shutil.rmtree(folder, ignore_errors=True)
+            metrics.count('clean.unpack_errors')
         try:
-            shutil.unpack_archive(str(file_name.absolute()),
-                                  str(folder_for_file.absolute()))
-        except shutil.ReadError:
-            folder_for_file.rmdir()
-            return file_name.unlink()
-
-    def main_cleaner(folder: Path):
-        scan(folder)
-        for file in JPEG_IMG:
-            handle_media(file, folder / 'images' / 'JPEG')
-        for file in JPG_IMG:
-            handle_media(file, folder / 'images' / 'JPG')
-        for file in PNG_IMG:
-            handle_media(file, folder / 'images' / 'PNG')
-        for file in SVG_IMG:
-            handle_media(file, folder / 'images' / 'SVG')
-
-        for file in MP3_AUDIO:
-            handle_media(file, folder / 'audio' / 'MP3')
-        for file in OGG_AUDIO:
-            handle_media(file, folder / 'audio' / 'OGG')
-        for file in WAV_AUDIO:
-            handle_media(file, folder / 'audio' / 'WAV')
-        for file in AMR_AUDIO:
-            handle_media(file, folder / 'audio' / 'AMR')
-
-        for file in AVI_VIDEO:
-            handle_media(file, folder / 'video' / 'AVI')
-        for file in MP4_VIDEO:
-            handle_media(file, folder / 'video' / 'MP4')
-        for file in MOV_VIDEO:
-            handle_media(file, folder / 'video' / 'MOV')
-        for file in MKV_VIDEO:
-            handle_media(file, folder / 'video' / 'MKV')
-
-        for file in DOC_DOC:
-            handle_media(file, folder / 'documents' / 'DOC')
-        for file in DOCX_DOC:
-            handle_media(file, folder / 'documents' / 'DOCX')
-        for file in TXT_DOC:
-            handle_media(file, folder / 'documents' / 'TXT')
-        for file in PDF_DOC:
-            handle_media(file, folder / 'documents' / 'PDF')
-        for file in XLSX_DOC:
-            handle_media(file, folder / 'documents' / 'XLSX')
-        for file in PPTX_DOC:
-            handle_media(file, folder / 'documents' / 'PPTX')
-        for file in PY_DOC:
-            handle_media(file, folder / 'documents' / 'PY')
-
-        for file in NOT_DEFINED:
-            handle_media(file, folder / 'not_defined')
-
-        for file in ZIP_ARCH:
-            handle_archive(file, folder / 'archives' / 'ZIP')
-        for file in GZ_ARCH:
-            handle_archive(file, folder / 'archives' / 'GZ')
-        for file in TAR_ARCH:
-            handle_archive(file, folder / 'archives' / 'TAR')
-
-        for folder in FOLDERS[::-1]:  # delete empty folders
+            move_file(path, destination)
+        except OSError as e:
+            error = error or str(e)
+        mover.moved += 1
+        if error is None:
+            yield Event('unpack', path, folder, destination)
+        else:
+            yield Event('error', path, destination, f'unpack: {error}')
+    if mover.log is not None and jobs:
+        mover.log.done(index)
+
+
+# Duplicates: files are grouped by size, groups by a hash of the first and the last
+# block and only files still in one group are hashed whole, so rare duplicates cost
+# about one stat per file
+
+
+def digest(path, size, partial=False):  # blake2b of the file or of its first and last block, None if unreadable
+    hasher = hashlib.blake2b()
+    try:
+        with open(path, 'rb') as file:
+            if partial:
+                hasher.update(file.read(BLOCK))
+                file.seek(size - BLOCK)
+                hasher.update(file.read(BLOCK))
+            elif size <= 2 * BLOCK:
+                hasher.update(file.read())
+            else:
+                for block in iter(lambda: file.read(1024 * 1024), b''):
+                    hasher.update(block)
+    except OSError:
+        return None
+    return hasher.digest()
+
+
+def file_digests(group, partial):  # digests of [(path, file)] of one size, whole ones are kept in file
+    size, files = group
+    if partial:
+        return [digest(path, size, True) for path, file in files]
+    for path, file in files:
+        if file[2] is None:
+            file[2] = digest(path, size)
+    return [file[2] for path, file in files]
+
+
+def split(groups, pool, partial):  # [(size, [(path, file)])] -> the same with files of equal digest only
+    # one task per group, hashlib releases the GIL while hashing
+    same = {}
+    for (size, files), values in zip(groups, pool.map(file_digests, groups, repeat(partial))):
+        for item, value in zip(files, values):
+            if value is not None:
+                same.setdefault((size, value), []).append(item)
+    return [(size, files) for (size, value), files in same.items() if len(files) > 1]
+
+
+def listing(folder, names, cached=None):  # {name: [size, mtime, digest] or None for folders}
+    # only names the manifest does not know are stat'ed
+    files = {}
+    for name in names:
+        if cached is not None and name in cached:
+            files[name] = cached[name]
+            continue
+        try:
+            stat = os.lstat(os.path.join(folder, name))
+        except OSError:  # its move failed
+            continue
+        files[name] = [stat.st_size, stat.st_mtime_ns, None] if S_ISREG(stat.st_mode) else None
+    return files
+
+
+def find_duplicates(listings, new=(), workers=None):  # [[kept, duplicate, ...]] of {folder: listing}
+    # files not in new, sorted before this run, are kept first
+    by_size = {}
+    for folder, files in listings.items():
+        for name, file in files.items():
+            if file is not None and file[0]:
+                by_size.setdefault(file[0], []).append((os.path.join(folder, name), file))
+    candidates = [item for items in by_size.values() if len(items) > 1 for item in items]
+    by_size = {}
+    inodes = set()
+    for path, file in candidates:  # sizes from the manifest are checked, the file may have been edited
+        try:
+            stat = os.lstat(path)
+        except OSError:
+            continue
+        if (stat.st_size, stat.st_mtime_ns) != (file[0], file[1]):
+            file[:] = [stat.st_size, stat.st_mtime_ns, None]
+        if stat.st_size and (stat.st_dev, stat.st_ino) not in inodes:  # hard links are one file
+            inodes.add((stat.st_dev, stat.st_ino))
+            by_size.setdefault(stat.st_size, []).append((path, file))
+    groups = [(size, files) for size, files in by_size.items() if len(files) > 1]
+    if not groups:
+        return []
+    with ThreadPoolExecutor(workers) as pool:
+        small = [(size, files) for size, files in groups if size <= 2 * BLOCK]  # partial hash is the whole file
+        large = split([(size, files) for size, files in groups if size > 2 * BLOCK], pool, True)
+        same = split(small + large, pool, False)
+    return [sorted((path for path, file in files), key=lambda path: (path in new, path))
+            for size, files in same]
+
+
+def remove_duplicates(groups, link=False):  # -> Event per duplicate; link keeps the names as hard links to the kept file
+    freed = 0
+    for kept, *copies in groups:
+        for copy in copies:
+            try:
+                size = os.path.getsize(copy)
+                if link:
+                    temporary = f'{copy}.{os.getpid()}.link'
+                    os.link(kept, temporary)
+                    os.replace(temporary, copy)
+                else:
+                    os.unlink(copy)
+            except OSError as e:  # e.g. hard links between file systems
+                yield Event('error', copy, kept, f'dedup: {e}')
+                continue
+            freed += size
+            metrics.count('clean.duplicates')
+            yield Event('duplicate', copy, kept, 'linked' if link else 'removed')
+    metrics.count('clean.duplicate_bytes', freed)
+
+
+def clean(folder, workers=None, archive_workers=None, max_unpacked=MAX_UNPACKED, archive_timeout=ARCHIVE_TIMEOUT,
+          dedup=None, manifest=None, dry_run=False, journal=None, callback=None):
+    # -> summary of events(), see there for the arguments; callback(event) gets every event
+    summary = None
+    for event in events(folder, workers, archive_workers, max_unpacked, archive_timeout,
+                        dedup, manifest, dry_run, journal):
+        if callback is not None:
+            callback(event)
+        if event.kind == 'summary':
+            summary = event.detail
+    return summary
+
+
+def events(folder, workers=None, archive_workers=None, max_unpacked=MAX_UNPACKED, archive_timeout=ARCHIVE_TIMEOUT,
+           dedup=None, manifest=None, dry_run=False, journal=None):
+    # sorts the folder step by step, yielding Event(kind, path, target, detail) as it goes:
+    #   resume     path: the folder, an interrupted run of it was finished first
+    #   move       path -> target, detail: the extension; in a dry run only planned
+    #   unpack     path (archive) -> target (folder), detail: where the archive went
+    #   skip       path: folder not listed, the manifest knows it unchanged
+    #   duplicate  path, a copy of target, detail: 'removed' or 'linked'
+    #   error      path, target or None, detail: what failed
+    #   summary    detail: {'files', 'archives', 'duplicates', 'folders_removed', 'errors': count,
+    #              'extensions': {extension: count}, 'unknown': [extension]}, the last one
+    # workers: threads moving files, archive_workers: processes unpacking archives,
+    # None for the default of the pool; dedup: None, 'delete' or 'link' duplicates;
+    # manifest: True or its file to skip what did not change since the last run;
+    # dry_run changes nothing; journal: True or its file to log every change first,
+    # a stopped run is finished by the next one and undo() reverts the last run.
+    # Only counters are kept, not the paths, so memory does not grow with the number
+    # of files beyond the names of the target folders (needed to pick free names),
+    # the source folders (removed at the end) and the archives (unpacked at the end).
+    if not folder:
+        return
+    root = os.fspath(folder)
+    if manifest:
+        manifest = Manifest(root, None if manifest is True else manifest)
+    log = None
+    if journal and not dry_run:
+        log = MoveLog(root, None if journal is True else journal)
+        if log.open():
+            yield Event('resume', root, None, None)
+    try:
+        yield from sort_files(root, workers, archive_workers, max_unpacked, archive_timeout,
+                              dedup, manifest, dry_run, log)
+    except BaseException:  # also when the caller stops early
+        if log is not None:
+            log.close(finished=False)
+        raise
+    if log is not None:
+        log.close()
+
+
+def move_errors(mover, summary):
+    for error in mover.errors:
+        summary['errors'] += 1
+        yield Event('error', error.filename, error.filename2, f'move: {error.strerror or error}')
+    mover.errors.clear()
+
+
+def sort_files(root, workers, archive_workers, max_unpacked, archive_timeout, dedup, manifest, dry_run, log):
+    summary = {'files': 0, 'archives': 0, 'duplicates': 0, 'folders_removed': 0, 'errors': 0,
+               'extensions': {}, 'unknown': set()}
+    extensions = summary['extensions']
+    unknown = summary['unknown']
+    folders = []
+    children = {} if manifest else None  # folder -> subfolder names, for the manifest
+    skipped = []
+    archives = []
+    moved = set() if dedup else None  # files moved by this run, older copies are kept before them
+    mover = Mover(workers, manifest or None, dry_run, log)
+    with metrics.timer('clean.scan_move'):  # moves run while the walk goes on
+        try:
+            for entry in scan(root, folders, manifest or None, children, skipped):
+                if skipped:
+                    for path in skipped:
+                        yield Event('skip', path, None, 'unchanged')
+                    skipped.clear()
+                extension = get_extension(entry.name)
+                target = TARGETS.get(extension)
+                if target is None:
+                    if extension:
+                        unknown.add(extension)
+                    target = NOT_DEFINED
+                else:
+                    extensions[extension] = extensions.get(extension, 0) + 1
+                    if extension in ARCHIVES:
+                        archives.append((entry.path, extension))
+                        continue
+                destination = mover.move(entry.path, os.path.join(root, target), normalize(entry.name))
+                summary['files'] += 1
+                yield Event('move', entry.path, destination, extension)
+                if mover.errors:
+                    yield from move_errors(mover, summary)
+                if moved is not None:
+                    moved.add(destination)
+        finally:
+            mover.close()
+        for path in skipped:
+            yield Event('skip', path, None, 'unchanged')
+        yield from move_errors(mover, summary)
+    metrics.count('clean.files_moved', mover.moved)
+
+    archive_mover = Mover(1, manifest or None, dry_run, log)
+    with metrics.timer('clean.unpack'):
+        for event in unpack(archives, root, archive_mover, archive_workers, max_unpacked, archive_timeout):
+            summary['archives'] += 1
+            if event.kind == 'error':
+                summary['errors'] += 1
+                mover.failed.add(os.path.dirname(event.path))  # the archive is still there
+            yield event
+    metrics.count('clean.archives', len(archives))
+    archives.clear()
+    summary['unknown'] = sorted(unknown)
+    if dry_run:
+        yield Event('summary', root, None, summary)
+        return
+
+    # files of the folders this run moved files into
+    listings = {folder: listing(folder, names, mover.cached[folder])
+                for folder, names in mover.taken.items()} if dedup or manifest else {}
+    if dedup:
+        with metrics.timer('clean.dedup'):
+            groups = find_duplicates(listings, moved, workers)
+            if log is not None and groups:
+                log.write(('dedup', [(copy, kept) for kept, *copies in groups for copy in copies], dedup == 'link'))
+            for event in remove_duplicates(groups, dedup == 'link'):
+                if event.kind == 'error':
+                    summary['errors'] += 1
+                else:
+                    summary['duplicates'] += 1
+                    if dedup == 'delete':
+                        listings[os.path.dirname(event.path)].pop(os.path.basename(event.path), None)
+                yield event
+
+    with metrics.timer('clean.rmdir'):
+        if log is not None and folders:
+            log.write(('rmdir', folders[::-1]))
+        for path in reversed(folders):  # delete empty folders, children were found after parents
             try:
-                folder.rmdir()
-            except OSError:
-                print(f'Error during remove folder {folder}')
-        return REGISTER_EXTENSION, UNKNOWN
-
-    if folder:
-        folder_path = Path(folder)
-        exstention, unknown = main_cleaner(folder_path)
-        return {key: value for key, value in exstention.items() if value}, unknown
+                os.rmdir(path)
+                summary['folders_removed'] += 1
+            except OSError as e:
+                metrics.count('clean.rmdir_errors')
+                summary['errors'] += 1
+                yield Event('error', path, None, f'remove folder: {e.strerror or e}')
+
+    if manifest:  # recorded after the last change of every folder
+        for folder, names in archive_mover.taken.items():
+            listings[folder] = listing(folder, names, archive_mover.cached[folder])
+        for folder, files in listings.items():
+            manifest.record_files(folder, files)
+        failed = set()  # folders with files left by failed moves and the folders above them
+        for folder in mover.failed | archive_mover.failed:
+            while folder not in failed:
+                failed.add(folder)
+                if folder == root:
+                    break
+                folder = os.path.dirname(folder)
+        manifest.record_dirs({folder: [name for name in subfolders if os.path.isdir(os.path.join(folder, name))]
+                              for folder, subfolders in children.items()
+                              if folder not in failed and os.path.isdir(folder)})
+        manifest.save()
+    yield Event('summary', root, None, summary)
@@ -0,0 +1,339 @@
+from itertools import islice
+import asyncio
+import json
+import os
+import signal
+import socket
+import struct
+try:
+    from . import batch, exporter
+except ImportError:  # started as a script: python main.py
+    import batch
+    import exporter
+
+# Address book daemon: one loaded book served over a Unix socket.
+# Frames are a 4 byte big endian length followed by a JSON object. Requests are
+# the commands of batch mode, responses are {"ok": true, "result": ...} or
+# {"ok": false, "error": ...} in request order.
+# Changes are acknowledged after they are on disk, changes arriving within
+# COMMIT_DELAY share one journal flush (group commit).
+# {"op": "export", "format", "fields", "tag", "days", "query"} is answered by frames
+# {"ok": true, "chunk": text} and a last {"ok": true, "result": null}; other clients
+# are served between the frames. RemoteBook is the book of the command line client.
+
+HEADER = struct.Struct('>I')
+MAX_FRAME = 64 * 1024 * 1024
+COMMIT_DELAY = 0.005  # seconds changes wait for others to share the flush
+PIPELINE = 256  # requests the client sends before reading responses
+WRITES = {'add', 'edit-email', 'add-phone', 'add-note', 'add-tag', 'delete', 'add-records', 'call'}
+
+
+def socket_path(filename) -> str:
+    return f'{filename}.sock'
+
+
+def encode(message) -> bytes:
+    payload = json.dumps(message, ensure_ascii=False).encode('utf-8')
+    return HEADER.pack(len(payload)) + payload
+
+# Class for flushes shared by the changes of all clients
+
+
+class GroupCommit:
+    def __init__(self, save, delay=COMMIT_DELAY):
+        self.save = save
+        self.delay = delay
+        self.waiting = []  # futures of changes not flushed yet
+        self.task = None
+
+    def request(self):  # future done when the changes made so far are on disk
+        future = asyncio.get_running_loop().create_future()
+        self.waiting.append(future)
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.commit())
+        return future
+
+    async def commit(self):
+        await asyncio.sleep(self.delay)
+        waiting, self.waiting, self.task = self.waiting, [], None
+        try:
+            self.save()
+        except Exception as e:
+            for future in waiting:
+                future.set_exception(e)
+        else:
+            for future in waiting:
+                future.set_result(None)
+
+# Class for the daemon, requests are executed one by one in the event loop
+
+
+class Daemon:
+    def __init__(self, book, record_cls, save):
+        self.book = book
+        self.record_cls = record_cls
+        self.commits = GroupCommit(save)
+        self.save = save
+
+    def handle(self, command):  # -> (response, future of its commit or None, text chunks sent before it or None)
+        try:
+            if command.get('op') == 'export':
+                return {'ok': True, 'result': None}, None, self.export(command)
+            response = {'ok': True, 'result': batch.execute(
+                self.book, self.record_cls, command)}
+        except KeyError as e:  # contact not found
+            return {'ok': False, 'error': e.args[0]}, None, None
+        except (ValueError, TypeError, AttributeError) as e:
+            return {'ok': False, 'error': str(e)}, None, None
+        return response, self.commits.request() if command.get('op') in WRITES else None, None
+
+    def export(self, command):  # records are selected now, the book may change while the chunks are sent
+        chunks, fields = exporter.writer(command.get('format') or 'csv', command.get('fields'))
+        days = command.get('days')
+        return chunks(list(exporter.selected(self.book, command.get('tag'), int(days) if days is not None else None,
+                                             command.get('query'))), fields)
+
+    async def serve_client(self, reader, writer):
+        responses = asyncio.Queue()
+        sender = asyncio.ensure_future(self.send(responses, writer))
+        try:
+            while True:
+                header = await reader.readexactly(HEADER.size)
+                size, = HEADER.unpack(header)
+                if size > MAX_FRAME:
+                    break
+                try:
+                    command = json.loads(await reader.readexactly(size))
+                    if not isinstance(command, dict):
+                        raise ValueError('Command should be a JSON object')
+                except ValueError as e:
+                    responses.put_nowait(({'ok': False, 'error': str(e)}, None, None))
+                    continue
+                responses.put_nowait(self.handle(command))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            responses.put_nowait(None)
+            await sender
+            writer.close()
+
+    async def send(self, responses, writer):  # responses in request order, changes after their commit
+        while True:
+            item = await responses.get()
+            if item is None:
+                return
+            response, commit, chunks = item
+            if commit is not None:
+                try:
+                    await commit
+                except Exception as e:
+                    response = {'ok': False, 'error': f'Not saved: {e}'}
+            try:
+                if chunks is not None:
+                    try:
+                        for chunk in chunks:
+                            writer.write(encode({'ok': True, 'chunk': chunk}))
+                            await writer.drain()
+                    except (ValueError, TypeError, AttributeError) as e:
+                        response = {'ok': False, 'error': str(e)}
+                writer.write(encode(response))
+                if responses.empty():
+                    await writer.drain()
+            except ConnectionError:
+                pass
+
+    async def serve(self, path):
+        if os.path.exists(path):
+            client = connect(path)
+            if client is not None:
+                client.close()
+                raise RuntimeError(f'Daemon is already running on {path}')
+            os.unlink(path)  # left by a daemon which did not stop cleanly
+        server = await asyncio.start_unix_server(self.serve_client, path)
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        try:
+            async with server:
+                await stop.wait()
+        finally:
+            os.unlink(path)
+            if self.commits.task is not None:
+                await self.commits.task
+            self.save()
+
+
+def serve(book, record_cls, path, save):
+    asyncio.run(Daemon(book, record_cls, save).serve(path))
+
+# Class for the blocking client used by the command line
+
+
+class Client:
+    def __init__(self, sock):
+        self.sock = sock
+        self.file = sock.makefile('rb')
+
+    def send(self, command):
+        self.sock.sendall(encode(command))
+
+    def receive(self):
+        header = self.file.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ConnectionError('Daemon closed the connection')
+        size, = HEADER.unpack(header)
+        return json.loads(self.file.read(size))
+
+    def call(self, command):
+        self.send(command)
+        return self.receive()
+
+    def stream(self, command):  # chunks of a long answer, raises ValueError if it failed
+        self.send(command)
+        while True:
+            response = self.receive()
+            if 'chunk' not in response:
+                break
+            yield response['chunk']
+        if not response['ok']:
+            raise ValueError(response['error'])
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+
+def connect(path):  # client of the running daemon or None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        sock.close()
+        return None
+    return Client(sock)
+
+
+def run_batch(client, lines, out):  # batch mode through the daemon, same results as batch.run
+    done = failed = 0
+    numbered = ((number, line) for number, line in enumerate(lines, 1) if line.strip())
+    while True:
+        chunk = list(islice(numbered, PIPELINE))
+        if not chunk:
+            return done, failed
+        sent = []
+        for number, line in chunk:
+            result = {'line': number}
+            try:
+                command = json.loads(line)
+                result['op'] = command.get('op')
+            except (ValueError, AttributeError) as e:
+                result.update(ok=False, error=str(e))
+                sent.append((result, False))
+                continue
+            client.send(command)
+            sent.append((result, True))
+        for result, waiting in sent:
+            if waiting:
+                response = client.receive()
+                if response['ok']:
+                    result.update(result=response['result'], ok=True)
+                else:
+                    result.update(ok=False, error=response['error'])
+            if result['ok']:
+                done += 1
+            else:
+                failed += 1
+            out.write(json.dumps(result, ensure_ascii=False) + '\n')
+
+
+# Classes for the book of the daemon as the menu, import and export use AddressBook.
+# Records are copies sent by the daemon, their changes are made by the daemon and
+# the copy is replaced by the record it answers with.
+
+
+class RemoteRecord:
+    def __init__(self, book, values):
+        self.book = book
+        self.record = batch.record_from(book.record_cls, values)
+
+    def __getattr__(self, attr):  # fields and methods which only read go to the copy
+        if attr in batch.RECORD_CALLS:
+            return lambda *args: self.call(attr, args)
+        if 'record' not in self.__dict__:
+            raise AttributeError(attr)
+        return getattr(self.__dict__['record'], attr)
+
+    def call(self, method, args):
+        answer = self.book.call({'op': 'call', 'name': self.record.name.value, 'method': method, 'args': list(args)})
+        self.record = batch.record_from(self.book.record_cls, answer['record'])
+        return self.record.notes if method == 'sort_notes' else answer['result']
+
+    def __str__(self):
+        return str(self.record)
+
+
+class RemoteBook:
+    conflicts = frozenset()  # changes of other clients are merged by the daemon
+
+    def __init__(self, client, record_cls, form):
+        self.client = client
+        self.record_cls = record_cls
+        self.form = form  # asks for a new contact, the form of AddressBook
+        self.data = self  # the menu looks up records in book.data
+
+    def call(self, command):  # -> result, raises ValueError with the error of the daemon
+        response = self.client.call(command)
+        if not response['ok']:
+            raise ValueError(response['error'])
+        return response['result']
+
+    def records(self, values):
+        return [RemoteRecord(self, item) for item in values]
+
+    def get(self, name, default=None):
+        response = self.client.call({'op': 'get', 'name': name})
+        return RemoteRecord(self, response['result']) if response['ok'] else default
+
+    def get_contact(self):
+        return self.form()
+
+    def add_record(self, record):
+        self.add_records([record])
+
+    def add_records(self, records):  # the importer adds its chunks
+        rejected = self.call({'op': 'add-records', 'records': [batch.record_dict(record) for record in records]})
+        if rejected:
+            raise ValueError(f'Rejected by the daemon: {rejected[0][0]}: {rejected[0][1]}')
+
+    def delete(self, name):
+        return self.call({'op': 'delete', 'name': name})
+
+    def search(self, query):
+        return self.records(self.call({'op': 'search', 'query': query}))
+
+    def find_similar(self, query):
+        return [(edits, RemoteRecord(self, values)) for edits, values in self.call({'op': 'similar', 'query': query})]
+
+    def birthdays_within(self, days):
+        return [(left, RemoteRecord(self, values))
+                for left, values in self.call({'op': 'birthdays', 'days': days, 'records': True})]
+
+    def __iter__(self, page_size=2):  # pages by name, a name cursor is found in the index at once
+        after = None
+        while True:
+            page = self.call({'op': 'page', 'sort': 'name', 'after': after, 'size': page_size})
+            if not page['records']:
+                return
+            yield self.records(page['records'])
+            after = page['after']
+
+    def export(self, fmt, fields=None, tag=None, days=None, query=None):  # text chunks written by the daemon
+        return self.client.stream({'op': 'export', 'format': fmt, 'fields': fields, 'tag': tag, 'days': days,
+                                   'query': query})
+
+    def save_to_file(self, filename):  # every change is on disk when the daemon answers it
+        return 'exit'
+
+    def close(self):
+        self.client.close()
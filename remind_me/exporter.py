@@ -0,0 +1,152 @@
+from datetime import datetime
+import csv
+import io
+import json
+import sys
+
+# Streaming export of the contact book to CSV, JSONL and vCard.
+# Records are read from the book one by one and the text is produced in chunks,
+# so memory does not depend on the size of the book. Columns of CSV are the same
+# the importer reads.
+
+CHUNK_SIZE = 1000  # records per written chunk
+FIELDS = ('name', 'phones', 'birthday', 'email', 'address', 'notes')
+FORMATS = ('csv', 'jsonl', 'vcf')
+
+
+def record_values(record, fields):
+    values = {}
+    for field in fields:
+        if field == 'phones':
+            values[field] = [phone.value for phone in record.phones]
+        elif field == 'notes':
+            values[field] = [note.value for note in record.notes]
+        elif field == 'birthday':
+            birthday = record.birthday.value if record.birthday else None
+            values[field] = birthday.isoformat() if birthday else None
+        else:
+            values[field] = getattr(record, field).value
+    return values
+
+
+def selected(book, tag=None, days=None, query=None):  # records passing all given filters
+    today = datetime.now().date()
+    if tag is not None:  # the narrowest source is taken from an index
+        source = unique(record for record, note in book.find_tags([tag]))
+    elif query is not None:
+        source = book.search(query)
+    elif days is not None:
+        source = (record for left, record in book.birthdays_within(days, today))
+    else:
+        source = book.data.values()
+    for record in source:
+        if tag is not None and not any(tag in note.tags for note in record.notes):
+            continue
+        if query is not None and not book.matches(record, query.lower()):
+            continue
+        if days is not None:
+            left = record.days_to_birthday()
+            if left is None or left > days:
+                continue
+        yield record
+
+
+def unique(records):
+    seen = set()
+    for record in records:
+        if record.name.value not in seen:
+            seen.add(record.name.value)
+            yield record
+
+
+def csv_chunks(records, fields):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for i, record in enumerate(records, 1):
+        values = record_values(record, fields)
+        writer.writerow([';'.join(value) if field == 'phones' else '\n'.join(value) if field == 'notes'
+                         else value or '' for field, value in values.items()])
+        if i % CHUNK_SIZE == 0:
+            yield flush(buffer)
+    yield flush(buffer)
+
+
+def jsonl_chunks(records, fields):
+    lines = []
+    for record in records:
+        lines.append(json.dumps(record_values(
+            record, fields), ensure_ascii=False) + '\n')
+        if len(lines) >= CHUNK_SIZE:
+            yield ''.join(lines)
+            lines = []
+    yield ''.join(lines)
+
+
+def vcard_chunks(records, fields):
+    lines = []
+    for i, record in enumerate(records, 1):
+        values = record_values(record, fields)
+        lines += ['BEGIN:VCARD', 'VERSION:3.0']
+        if 'name' in values:
+            lines.append(f'FN:{escape(values["name"])}')
+        for phone in values.get('phones', ()):
+            lines.append(f'TEL;TYPE=CELL:{phone}')
+        if values.get('email'):
+            lines.append(f'EMAIL:{values["email"]}')
+        if values.get('birthday'):
+            lines.append(f'BDAY:{values["birthday"]}')
+        if values.get('address'):
+            lines.append(f'ADR:;;{escape(values["address"])};;;;')
+        if values.get('notes'):
+            lines.append(f'NOTE:{escape(chr(10).join(values["notes"]))}')
+        lines.append('END:VCARD')
+        if i % CHUNK_SIZE == 0:
+            yield '\r\n'.join(lines) + '\r\n'
+            lines = []
+    if lines:
+        yield '\r\n'.join(lines) + '\r\n'
+
+
+def escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace(',', '\\,').replace(';', '\\;').replace('\n', '\\n')
+
+
+def flush(buffer: io.StringIO) -> str:
+    text = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return text
+
+
+def writer(fmt, fields=None):  # -> (chunks(records, fields), fields); raises before anything is written
+    fields = tuple(fields or FIELDS)
+    unknown = set(fields) - set(FIELDS)
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(sorted(unknown))}, use some of: {", ".join(FIELDS)}')
+    if fmt == 'csv':
+        return csv_chunks, fields
+    if fmt == 'jsonl':
+        return jsonl_chunks, fields
+    if fmt == 'vcf':
+        return vcard_chunks, fields
+    raise ValueError(f'Unknown format {fmt}, use one of: {", ".join(FORMATS)}')
+
+
+def export(book, fmt, fields=None, tag=None, days=None, query=None):  # generator of text chunks
+    chunks, fields = writer(fmt, fields)
+    return chunks(selected(book, tag, days, query), fields)
+
+
+def export_to_file(book, path, fmt, **options):  # '-' writes to stdout
+    write(export(book, fmt, **options), path)
+
+
+def write(chunks, path):
+    if path == '-':
+        for chunk in chunks:
+            sys.stdout.write(chunk)
+        return
+    with open(path, 'w', newline='', encoding='utf-8') as file_write:
+        for chunk in chunks:
+            file_write.write(chunk)
@@ -0,0 +1,170 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import csv
+import gc
+import re
+
+# Bulk import of contacts from CSV and vCard files.
+# Files are read as a stream of rows, every chunk of rows is validated at once
+# (optionally in a process pool) and valid records are added to the book in bulk.
+# Rejected rows are written with the reason to a side CSV file.
+
+CHUNK_SIZE = 10000
+FIELDS = ('name', 'phones', 'birthday', 'email', 'address', 'notes')
+PHONE_NOISE = re.compile(r'[\s()-]')
+PHONE_SEPARATOR = re.compile(r'\s*[;,]\s*')
+VCARD_ESCAPES = re.compile(r'\\([nN,;\\])')
+VCARD_PARTS = re.compile(r'(?:\\.|[^\\;])+')  # parts of a value split at unescaped ';'
+UNDECODED = re.compile('[\udc80-\udcff]')  # bytes which are not UTF-8, kept by surrogateescape
+
+
+def normalize_phone(phone: str) -> str:  # +38 (099) 123-45-67 -> 0991234567
+    phone = PHONE_NOISE.sub('', phone)
+    return '0' + phone[4:] if phone.startswith('+380') else phone
+
+
+def read_csv(path):  # columns: name, phone(s), birthday, email, address, note(s)
+    with open(path, newline='', encoding='utf-8-sig', errors='surrogateescape') as file_read:
+        reader = csv.reader(file_read)
+        header = [column.strip().lower() for column in next(reader, [])]
+        name, phones, birthday, email, address, notes = (
+            next((i for i, column in enumerate(header) if column in names), None)
+            for names in (('name',), ('phone', 'phones'), ('birthday',), ('email',), ('address',), ('note', 'notes')))
+        for row in reader:
+            row += [''] * (len(header) - len(row))
+            yield {
+                'name': row[name].strip() if name is not None else '',
+                'phones': PHONE_SEPARATOR.split(row[phones].strip()) if phones is not None and row[phones].strip() else [],
+                'birthday': row[birthday].strip() if birthday is not None else '',
+                'email': row[email].strip() if email is not None else '',
+                'address': row[address].strip() if address is not None else '',
+                'notes': [note for note in row[notes].splitlines() if note.strip()] if notes is not None else [],
+            }
+
+
+def read_vcard(path):
+    card = None
+    for line in unfold(path):
+        key, _, value = line.partition(':')
+        prop = key.split(';')[0].split('.')[-1].upper()
+        if prop == 'BEGIN':
+            card = {'name': '', 'phones': [], 'birthday': '',
+                    'email': '', 'address': '', 'notes': []}
+        elif card is None:
+            continue
+        elif prop == 'END':
+            yield card
+            card = None
+        elif prop == 'FN':
+            card['name'] = unescape(value)
+        elif prop == 'TEL':
+            card['phones'].append(value.removeprefix('tel:'))
+        elif prop == 'EMAIL' and not card['email']:
+            card['email'] = value
+        elif prop == 'BDAY':
+            birthday = value.replace('-', '')[:8]
+            card['birthday'] = f'{birthday[:4]}-{birthday[4:6]}-{birthday[6:8]}' if len(
+                birthday) == 8 else value
+        elif prop == 'ADR' and not card['address']:
+            card['address'] = ', '.join(part for part in (
+                unescape(part) for part in VCARD_PARTS.findall(value)) if part)
+        elif prop == 'NOTE':
+            card['notes'].extend(unescape(value).splitlines())
+
+
+def unfold(path):  # join vCard continuation lines
+    with open(path, encoding='utf-8-sig', errors='surrogateescape') as file_read:
+        current = None
+        for line in file_read:
+            line = line.rstrip('\r\n')
+            if line[:1] in (' ', '\t') and current is not None:
+                current += line[1:]
+                continue
+            if current is not None:
+                yield current
+            current = line
+        if current is not None:
+            yield current
+
+
+def unescape(value: str) -> str:
+    return VCARD_ESCAPES.sub(lambda match: '\n' if match.group(1) in 'nN' else match.group(1), value)
+
+
+def read_rows(path):
+    return read_vcard(path) if Path(path).suffix.lower() in ('.vcf', '.vcard') else read_csv(path)
+
+
+def chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def validate(rows, record_cls):  # -> (records, [(row, reason)])
+    records = []
+    rejects = []
+    for row in rows:
+        try:
+            if UNDECODED.search(''.join((row['name'], row['birthday'] or '', row['email'], row['address'] or '',
+                                         *row['phones'], *row['notes']))):
+                raise ValueError('Text is not UTF-8')
+            phones = [normalize_phone(phone) for phone in row['phones']]
+            notes = row['notes']
+            record = record_cls(row['name'], phones[0] if phones else None, row['birthday'] or None,
+                                row['email'], notes[0] if notes else None, row['address'] or None)
+            for phone in phones[1:]:
+                record.add_phone(phone)
+            for note in notes[1:]:
+                record.add_note(note)
+        except (ValueError, TypeError) as e:
+            rejects.append((row, str(e)))
+        else:
+            records.append(record)
+    return records, rejects
+
+
+def validated(batches, record_cls, workers):  # validate chunks in order, at most 2 per worker queued
+    if not workers:
+        for batch in batches:
+            yield validate(batch, record_cls)
+        return
+    with ProcessPoolExecutor(workers) as pool:
+        pending = []
+        for batch in batches:
+            pending.append(pool.submit(validate, batch, record_cls))
+            if len(pending) >= workers * 2:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+
+def import_file(book, record_cls, path, rejects_path=None, workers=0, chunk_size=CHUNK_SIZE):
+    rejects_path = rejects_path or f'{path}.rejects.csv'
+    imported = rejected = 0
+    rejects_file = None
+    gc.disable()  # millions of new objects, nothing to collect until the end
+    try:
+        for records, rejects in validated(chunks(read_rows(path), chunk_size), record_cls, workers):
+            book.add_records(records)
+            imported += len(records)
+            if rejects:
+                if rejects_file is None:
+                    rejects_file = open(
+                        rejects_path, 'w', newline='', encoding='utf-8', errors='surrogateescape')
+                    writer = csv.writer(rejects_file)
+                    writer.writerow(FIELDS + ('reason',))
+                for row, reason in rejects:
+                    writer.writerow([row['name'], ';'.join(row['phones']), row['birthday'], row['email'],
+                                     row['address'], '\n'.join(row['notes']), reason])
+                rejected += len(rejects)
+    finally:
+        gc.enable()
+        if rejects_file is not None:
+            rejects_file.close()
+    return imported, rejected, rejects_path if rejected else None
@@ -0,0 +1,393 @@
+from collections import defaultdict
+from datetime import date, timedelta
+import bisect
+import heapq
+
+# In-memory indexes of the AddressBook.
+# Every index is kept up to date by the book: update(record) after the record was
+# added or changed, discard(name) after it was deleted. A stale index is not
+# maintained and gets rebuilt by the book on its next use with build(records),
+# one pass over the records instead of an update per record.
+
+EMPTY = frozenset()
+SCANS_BEFORE_BUILD = 8  # building the trigram index costs about 8 linear searches
+
+
+def trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+# Class for substring search over names, phone digits and notes.
+# Postings are lists of record numbers, one number object shared by all lists of the
+# record, so an entry costs a list slot. Entries are never removed: a changed record
+# is appended under its new trigrams, a deleted one loses its number. Candidates are
+# a superset of the matches, the caller checks every one of them.
+
+
+class TrigramIndex:
+    stale = False
+    scans = 0  # searches done by scanning the book while the index was stale
+
+    def __init__(self):
+        self.postings = {}  # trigram -> numbers of records, ascending but for changed records
+        self.numbers = {}  # name -> number, results keep the order of the book
+        self.names = []  # number -> name, None once deleted
+
+    @staticmethod
+    def texts(record):  # the same texts AddressBook.search looks into
+        yield record.name.value.lower()
+        for phone in record.phones:
+            yield phone.value
+        for note in record.notes:
+            yield note.value.lower()
+
+    def update(self, record):
+        name = record.name.value
+        number = self.numbers.get(name)
+        if number is None:
+            number = self.numbers[name] = len(self.names)
+            self.names.append(name)
+        postings = self.postings
+        grams = set()
+        for text in self.texts(record):
+            grams.update(text[i:i + 3] for i in range(len(text) - 2))
+        for gram in grams:
+            posting = postings.get(gram)
+            if posting is None:
+                postings[gram] = [number]
+            elif posting[-1] != number:
+                posting.append(number)
+
+    def build(self, records):
+        postings = self.postings
+        for record in records:
+            name = record.name.value
+            number = self.numbers[name] = len(self.names)
+            self.names.append(name)
+            text = '\0'.join(self.texts(record))  # grams across two texts have \0, no query has it
+            for gram in {text[i:i + 3] for i in range(len(text) - 2)}:
+                posting = postings.get(gram)
+                if posting is None:
+                    postings[gram] = [number]
+                else:
+                    posting.append(number)
+
+    def discard(self, name):
+        number = self.numbers.pop(name, None)
+        if number is not None:
+            self.names[number] = None
+
+    def clear(self):
+        self.postings.clear()
+        self.numbers.clear()
+        self.names.clear()
+
+    def candidates(self, query):  # names which may contain query, None if query is too short
+        grams = trigrams(query)
+        if not grams:
+            return None
+        postings = sorted((self.postings.get(gram, ()) for gram in grams), key=len)
+        found = set(postings[0])
+        for posting in postings[1:]:
+            if not found:
+                break
+            found.intersection_update(posting)
+        names = self.names
+        return [names[number] for number in sorted(found) if names[number] is not None]
+
+# Class for tag -> (record name, note) pairs, built from tags parsed in Note
+
+
+class TagIndex:
+    stale = False
+
+    def __init__(self):
+        self.postings = defaultdict(set)  # tag -> pairs (name, note)
+        self.by_name = {}  # name -> pairs (tag, note) of the record
+
+    def update(self, record):
+        name = record.name.value
+        self.discard(name)
+        pairs = []
+        for note in record.notes:
+            for tag in set(note.tags):
+                self.postings[tag].add((name, note))
+                pairs.append((tag, note))
+        self.by_name[name] = pairs
+
+    def build(self, records):
+        for record in records:
+            self.update(record)
+
+    def discard(self, name):
+        for tag, note in self.by_name.pop(name, ()):
+            posting = self.postings[tag]
+            posting.discard((name, note))
+            if not posting:
+                del self.postings[tag]
+
+    def clear(self):
+        self.postings.clear()
+        self.by_name.clear()
+
+    def find(self, tags, match_all=False):  # pairs with all (AND) or any (OR) of tags
+        postings = sorted((self.postings.get(tag, EMPTY)
+                          for tag in set(tags)), key=len)
+        if not postings:
+            return set()
+        found = set(postings[0])
+        for posting in postings[1:]:
+            if match_all:
+                found &= posting
+            else:
+                found |= posting
+        return found
+
+    def counts(self):
+        return {tag: len(posting) for tag, posting in self.postings.items()}
+
+
+# Birthdays, leap years are handled only here
+
+
+def birthday_in(year: int, birthday: date) -> date:  # Feb 29 is celebrated on Mar 1 in common years
+    try:
+        return birthday.replace(year=year)
+    except ValueError:
+        return date(year, 3, 1)
+
+
+def days_to_birthday(birthday: date, today: date) -> int:
+    next_birthday = birthday_in(today.year, birthday)
+    if next_birthday < today:
+        next_birthday = birthday_in(today.year + 1, birthday)
+    return (next_birthday - today).days
+
+
+def birthday_windows(today: date, days: int):  # (month, day) ranges covering the next days
+    if days >= 363:
+        return [((1, 1), (12, 31))]
+    # one day of margin on both sides for Feb 29, exact days are checked by caller
+    start = today - timedelta(days=1)
+    end = today + timedelta(days=days + 1)
+    if start.year == end.year:
+        return [((start.month, start.day), (end.month, end.day))]
+    return [((start.month, start.day), (12, 31)), ((1, 1), (end.month, end.day))]
+
+# Class for names sorted by birthday month and day
+
+
+class BirthdayIndex:
+    stale = False
+
+    def __init__(self):
+        self.keys = []  # sorted (month, day, name)
+        self.by_name = {}  # name -> key
+
+    def update(self, record):
+        name = record.name.value
+        birthday = record.birthday.value if record.birthday else None
+        key = (birthday.month, birthday.day, name) if birthday else None
+        if self.by_name.get(name) == key:
+            return
+        self.discard(name)
+        if key:
+            bisect.insort(self.keys, key)
+            self.by_name[name] = key
+
+    def build(self, records):  # one sort, not an insort per record
+        by_name = self.by_name
+        for record in records:
+            birthday = record.birthday.value if record.birthday else None
+            if birthday:
+                by_name[record.name.value] = (birthday.month, birthday.day, record.name.value)
+        self.keys = sorted(by_name.values())
+
+    def discard(self, name):
+        key = self.by_name.pop(name, None)
+        if key:
+            del self.keys[bisect.bisect_left(self.keys, key)]
+
+    def clear(self):
+        self.keys.clear()
+        self.by_name.clear()
+
+    def between(self, windows):  # names with birthday inside (month, day) ranges
+        for (start_month, start_day), (end_month, end_day) in windows:
+            lo = bisect.bisect_left(self.keys, (start_month, start_day))
+            hi = bisect.bisect_left(self.keys, (end_month, end_day + 1))
+            for month, day, name in self.keys[lo:hi]:
+                yield name
+
+# Class for names of the book in sorted order
+
+
+class NameIndex:
+    stale = False
+
+    def __init__(self):
+        self.names = []
+
+    def update(self, record):
+        name = record.name.value
+        i = bisect.bisect_left(self.names, name)
+        if i == len(self.names) or self.names[i] != name:
+            self.names.insert(i, name)
+
+    def build(self, records):  # names are the keys of the book, so they are unique
+        self.names = sorted(record.name.value for record in records)
+
+    def discard(self, name):
+        i = bisect.bisect_left(self.names, name)
+        if i < len(self.names) and self.names[i] == name:
+            del self.names[i]
+
+    def clear(self):
+        self.names.clear()
+
+# Fuzzy name lookup, typos within one or two edits
+
+
+def distance(a: str, b: str) -> int:  # edit distance, swap of two neighbour letters is one edit
+    if a == b:
+        return 0
+    if len(a) < len(b):
+        a, b = b, a
+    if not b:
+        return len(a)
+    before = None
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            value = min(previous[j] + 1, current[j - 1] + 1,
+                        previous[j - 1] + (char_a != char_b))
+            if before is not None and j > 1 and char_a == b[j - 2] and a[i - 2] == char_b:
+                value = min(value, before[j - 2] + 1)
+            current.append(value)
+        before, previous = previous, current
+    return previous[-1]
+
+
+def max_edits(word: str) -> int:  # allowed typos grow with the word
+    return 0 if len(word) <= 2 else 1 if len(word) <= 5 else 2
+
+
+def deletions(word: str):  # the word and the word without one of its letters
+    yield word
+    for i in range(len(word)):
+        yield word[:i] + word[i + 1:]
+
+# Class for typo tolerant lookup of the words of names.
+# Every word is kept under itself and under its variants without one letter, so a
+# query word finds the words one edit away (also two neighbour letters swapped) by
+# a few dict lookups. A word two edits away is one edit away from a string one edit
+# away from the query, so for two edits the strings one letter changed, added or
+# swapped are looked up too, with the letters of the indexed words only.
+
+
+class FuzzyIndex:
+    stale = False
+
+    def __init__(self):
+        self.words = {}  # word -> names of records, words are not removed
+        self.variants = {}  # word without a letter -> word or set of words
+        self.letters = set()  # letters of the indexed words
+        self.by_name = {}  # name -> words of the name
+
+    def update(self, record):
+        self.add(record.name.value)
+
+    def add(self, name):
+        words = frozenset(name.lower().split())
+        if self.by_name.get(name) == words:
+            return
+        self.discard(name)
+        for word in words:
+            names = self.words.get(word)
+            if names is None:
+                names = self.words[word] = set()
+                self.insert(word)
+            names.add(name)
+        self.by_name[name] = words
+
+    def discard(self, name):
+        for word in self.by_name.pop(name, ()):
+            self.words[word].discard(name)
+
+    def clear(self):
+        self.words.clear()
+        self.variants.clear()
+        self.letters.clear()
+        self.by_name.clear()
+
+    def insert(self, word):
+        self.letters.update(word)
+        variants = self.variants
+        for variant in deletions(word):
+            found = variants.get(variant)
+            if found is None:
+                variants[variant] = word  # most variants belong to one word, no set for them
+            elif isinstance(found, str):
+                if found != word:
+                    variants[variant] = {found, word}
+            else:
+                found.add(word)
+
+    def edited(self, word):  # word with one letter changed, added or two neighbours swapped
+        for i in range(len(word) + 1):
+            head, tail = word[:i], word[i:]
+            for letter in self.letters:
+                yield head + letter + tail
+                if tail:
+                    yield head + letter + tail[1:]
+            if len(tail) > 1:
+                yield head + tail[1] + tail[0] + tail[2:]
+
+    def within(self, word, edits):  # {word of the index: distance} for words not further than edits
+        keys = set(deletions(word)) if edits else {word}
+        if edits > 1:
+            keys.update(variant for key in list(keys) for variant in deletions(key))
+            near = set(self.edited(word))
+            keys.update(near)
+            keys.update({text[:i] + text[i + 1:] for text in near for i in range(len(text))})
+        candidates = set()
+        for key in keys:
+            words = self.variants.get(key)
+            if isinstance(words, str):
+                candidates.add(words)
+            elif words:
+                candidates.update(words)
+        found = {}
+        for candidate in candidates:
+            if abs(len(candidate) - len(word)) <= edits and self.words[candidate]:
+                current = distance(word, candidate)
+                if current <= edits:
+                    found[candidate] = current
+        return found
+
+    def find(self, query, limit=10):  # [(edits, name)] closest first, every word of query has to match
+        matches = []  # for every word of query: [(edits, names)] closest first
+        for word in query.lower().split():
+            found = sorted(((edits, self.words[found]) for found, edits in self.within(word, max_edits(word)).items()),
+                           key=lambda item: item[0])
+            if not found:
+                return []
+            matches.append(found)
+        if not matches:
+            return []
+        # names of the rarest word are checked against the others, common first names are not walked
+        matches.sort(key=lambda found: sum(len(names) for edits, names in found))
+        scores = {}
+        for edits, names in matches[0]:
+            for name in names:
+                if name in scores:
+                    continue
+                total = edits
+                for found in matches[1:]:
+                    more = next((edits for edits, names in found if name in names), None)
+                    if more is None:
+                        break
+                    total += more
+                else:
+                    scores[name] = total
+        return heapq.nsmallest(limit, ((edits, name) for name, edits in scores.items()))
@@ -0,0 +1,221 @@
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+import pickle
+import os
+import re
+import threading
+try:
+    import fcntl
+except ImportError:  # Windows, files are not locked there
+    fcntl = None
+
+# Append-only change journal for the contact book.
+# The snapshot file (contacts.pkl) holds, as a small first pickle frame, the number
+# of the last journal segment already folded into it and then the pickled records dict
+# (older snapshots have the number as a second frame after the records).
+# Changes are appended to segments "contacts.pkl.journal.<seq>" and replayed on load,
+# an entry is (op, name, args, version before the change, time of the change), entries
+# written by older versions end after args or after the version.
+# Folded segments are deleted, so a new segment is numbered after both the last one
+# left and the last one folded, or it would be taken as folded already.
+# Every session writes its own segment and holds a lock on it while it is open,
+# "contacts.pkl.lock" serializes creating segments and replacing the snapshot.
+
+COMPACT_THRESHOLD = 1000  # journal entries after which the snapshot is rebuilt
+COMPACT_RATIO = 2  # ... or one entry per this many records of bigger books
+
+
+def segment_path(filename, seq: int) -> Path:
+    return Path(f'{filename}.journal.{seq}')
+
+
+def segments(filename):  # all journal segments of the file, oldest first
+    filename = Path(filename)
+    pattern = re.compile(re.escape(filename.name) + r'\.journal\.(\d+)$')
+    found = []
+    if filename.parent.is_dir():
+        for item in filename.parent.iterdir():
+            match = pattern.match(item.name)
+            if match:
+                found.append((int(match.group(1)), item))
+    return sorted(found)
+
+
+def last_segment(filename) -> int:
+    found = segments(filename)
+    return found[-1][0] if found else 0
+
+
+held = threading.local()  # lock files this thread holds, flock on a second fd would wait for itself
+
+
+@contextmanager
+def locked(filename):  # exclusive lock of the book among processes and threads, reentrant in a thread
+    path = os.path.abspath(f'{filename}.lock')
+    holding = held.__dict__.setdefault('paths', set())
+    if fcntl is None or path in holding:
+        yield
+        return
+    with open(path, 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        holding.add(path)
+        try:
+            yield
+        finally:
+            holding.discard(path)
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def in_use(path) -> bool:  # segment another session still appends to
+    if fcntl is None:
+        return False
+    try:
+        with open(path, 'rb') as file_read:
+            try:
+                fcntl.flock(file_read, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return True
+            fcntl.flock(file_read, fcntl.LOCK_UN)
+    except FileNotFoundError:
+        pass
+    return False
+
+
+def sealed_upto(filename, upto) -> int:  # last segment <= upto with no open segment before it
+    sealed = 0
+    for seq, path in segments(filename):
+        if seq > upto or in_use(path):
+            break
+        sealed = seq
+    return sealed
+
+
+def snapshot_id(filename):  # changes whenever the snapshot is replaced
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class NotHeader(pickle.UnpicklingError):
+    pass
+
+
+class HeaderUnpickler(pickle.Unpickler):  # first frame only, records of an older snapshot stop it at once
+    def find_class(self, module, name):
+        raise NotHeader('not a snapshot header')
+
+
+def is_header(frame) -> bool:
+    return isinstance(frame, tuple) and len(frame) == 2 and frame[0] == 'covered'
+
+
+def read_covered(filename):  # last segment folded into the snapshot, None if unknown without loading it
+    try:
+        with open(filename, 'rb') as file_read:
+            header = HeaderUnpickler(file_read).load()
+    except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+        return None
+    return header[1] if is_header(header) else None
+
+
+def has_snapshot(filename) -> bool:  # an empty or torn file left by a crash is no snapshot
+    try:
+        with open(filename, 'rb') as file_read:
+            HeaderUnpickler(file_read).load()
+    except NotHeader:  # records of a snapshot written before the header existed
+        return True
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        return False
+    return True
+
+
+def read_snapshot(filename, unpickler=pickle.Unpickler, wrap=None):  # wrap(file) may report progress
+    with open(filename, 'rb') as file_read, (wrap(file_read) if wrap else nullcontext(file_read)) as source:
+        data = unpickler(source).load()
+        if is_header(data):
+            return unpickler(source).load(), data[1]
+        try:
+            covered = unpickler(source).load()
+        except EOFError:  # plain pickle written before the journal existed
+            covered = 0
+    return data, covered
+
+
+def write_snapshot(filename, data, covered=None):
+    # write-rename, so a crash never leaves a half written snapshot behind
+    if covered is None:
+        covered = last_segment(filename)
+    tmp_name = f'{filename}.tmp'
+    with open(tmp_name, 'wb') as file_write:
+        pickle.dump(('covered', covered), file_write)
+        pickle.dump(data, file_write)
+        file_write.flush()
+        os.fsync(file_write.fileno())
+    os.replace(tmp_name, filename)
+    for seq, path in segments(filename):  # folded into the snapshot, not needed anymore
+        if seq <= covered:
+            path.unlink(missing_ok=True)
+
+
+def read_entries(path, unpickler=pickle.Unpickler, start=0):  # (entry, position after it)
+    try:
+        file_read = open(path, 'rb')
+    except FileNotFoundError:  # folded into the snapshot meanwhile
+        return
+    with file_read:
+        file_read.seek(start)
+        while True:
+            try:  # every entry is a separate pickle with its own memo, one unpickler would mix them up
+                entry = unpickler(file_read).load()
+            except (EOFError, pickle.UnpicklingError):  # end of segment or torn last entry
+                return
+            yield entry, file_read.tell()
+
+# Class for the segment the current session appends its changes to
+
+
+class Journal:
+    def __init__(self, filename, covered=0):
+        self.filename = filename
+        self.covered = covered  # last segment folded into the snapshot the session loaded
+        self.seq = None  # segment is created on the first change
+        self.own = set()  # segments written by this session
+        self.entries = 0  # entries not folded into the snapshot yet
+        self.file = None
+
+    def open(self):  # new segment after all existing and folded ones, locked while it is written
+        with locked(self.filename):
+            covered = read_covered(self.filename)  # the snapshot may have been compacted since the load
+            seq = max(last_segment(self.filename), self.covered, covered or 0) + 1
+            while True:
+                try:
+                    self.file = open(segment_path(self.filename, seq), 'xb')
+                    break
+                except FileExistsError:
+                    seq += 1
+            if fcntl is not None:
+                fcntl.flock(self.file, fcntl.LOCK_EX)
+        self.seq = seq
+        self.own.add(seq)
+
+    def append(self, entry):
+        if self.file is None:  # sessions without changes do not create a segment
+            self.open()
+        pickle.dump(entry, self.file)
+        self.entries += 1
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def seal(self):  # close active segment for compaction, next entries go to a new one
+        self.flush()
+        if self.file is not None:
+            self.file.close()  # closing releases the lock
+            self.file = None
+        sealed = self.seq if self.seq is not None else last_segment(self.filename)
+        self.entries = 0
+        return sealed
@@ -1,25 +1,69 @@
 from _collections_abc import Iterator
-from datetime import datetime
+from datetime import date, datetime, timedelta
 from collections import UserDict
+from itertools import islice
+import argparse
+import bisect
+import heapq
 import pickle
 import os
 import re
+import sys
 import time
+import threading
 from pathlib import Path
-from rich import print
-from rich.console import Console
-from rich.theme import Theme
-from rich.progress import track
-from cleaner import clean
+try:
+    from . import journal, storage, indexes, metrics
+except ImportError:  # started as a script: python main.py
+    import journal
+    import storage
+    import indexes
+    import metrics
+
+# Validation patterns, compiled once
+NAME_INVALID = re.compile(r'[^a-zA-Z\s]')
+DATE_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}')
+PHONE_PATTERN_UA = re.compile(r"^0[3456789]\d{8}$")
+EMAIL_PATTERN = re.compile(r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$")
+TAG_PATTERN = re.compile(r'#(\w+)')
+
+PROGRESS_MIN_SIZE = 8 * 1024 * 1024  # show loading progress for bigger files
+UNCHECKED = object()  # version of journal entries written before records had versions
+
+custom_theme = {"success": "bold green", "error": "bold red", "warning": "bold yellow",
+                "menu": "yellow", "row": "bright_blue", "note": "bold magenta"}
+
+# rich is imported on first output, it takes most of the start time
+
+
+def rich_console():
+    global console
+    if isinstance(console, LazyConsole):
+        from rich.console import Console
+        from rich.theme import Theme
+        console = Console(theme=Theme(custom_theme))
+    return console
+
+
+class LazyConsole:
+    def __getattr__(self, name):
+        return getattr(rich_console(), name)
+
+
+console = LazyConsole()
+
+
+def print(*args, **kwargs):
+    from rich import print as rich_print
+    rich_print(*args, **kwargs)
 
-custom_theme = Theme(
-    {"success": "bold green", "error": "bold red", "warning": "bold yellow", "menu": "yellow", "row": "bright_blue", "note": "bold magenta"})
-console = Console(theme=custom_theme)
 
 # Parrent class for all fields
 
 
 class Field:
+    __slots__ = ('__value',)
+
     def __init__(self, value=None):
         self.__value = None
         self.value = value
@@ -35,13 +79,28 @@ class Field:
     def __repr__(self):
         return f"{self.__class__.__name__}({self.value})"
 
+    @classmethod
+    def stored(cls, value):  # field from already validated value, skips the setter
+        field = cls.__new__(cls)
+        field.__value = value
+        return field
+
+    def __getstate__(self):  # tuple, None state would not be restored
+        return (self.__value,)
+
+    def __setstate__(self, state):  # also loads fields pickled before __slots__
+        self.__value = state['_Field__value'] if isinstance(
+            state, dict) else state[0]
+
 # Class for contact name, allow letters and space characters
 
 
 class Name(Field):
+    __slots__ = ()
+
     @Field.value.setter
     def value(self, value: str):
-        if not re.findall(r'[^a-zA-Z\s]', value):
+        if not NAME_INVALID.search(value):
             self._Field__value = value
         else:
             raise ValueError('Name should include only letter characters')
@@ -50,11 +109,14 @@ class Name(Field):
 
 
 class Birthday(Field):
+    __slots__ = ()
+
     @Field.value.setter
     def value(self, value=None):
         if value:
             try:
-                self._Field__value = datetime.strptime(
+                # fromisoformat is the fast path for the usual zero padded dates
+                self._Field__value = date.fromisoformat(value) if DATE_PATTERN.fullmatch(value) else datetime.strptime(
                     value, '%Y-%m-%d').date()
             except Exception:
                 raise ValueError("Date should be in the format YYYY-MM-DD")
@@ -63,10 +125,11 @@ class Birthday(Field):
 
 
 class Phone(Field):
+    __slots__ = ()
+
     @Field.value.setter
     def value(self, value):
-        phone_pattern_ua = re.compile(r"^0[3456789]\d{8}$")
-        if phone_pattern_ua.match(value):
+        if PHONE_PATTERN_UA.match(value):
             self._Field__value = value
         else:
             raise ValueError('Phone is not valid')
@@ -75,11 +138,11 @@ class Phone(Field):
 
 
 class Email(Field):
+    __slots__ = ()
+
     @Field.value.setter
     def value(self, value):
-        email_pattern = re.compile(
-            "^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$")
-        if email_pattern.match(value):
+        if EMAIL_PATTERN.match(value):
             self._Field__value = value
         else:
             raise ValueError("Email is not valid")
@@ -88,48 +151,122 @@ class Email(Field):
 
 
 class Address(Field):
+    __slots__ = ()
+
     @Field.value.setter
     def value(self, value):
         self._Field__value = value
 
-# Class for contact notes, any string
+# Class for contact notes, any string, tags are parsed once on assignment
 
 
 class Note(Field):
+    __slots__ = ('tags',)
+
     @Field.value.setter
     def value(self, value):
         self._Field__value = value
+        self.tags = TAG_PATTERN.findall(value or '')
+
+    def __setstate__(self, state):  # tags are not pickled, parse them again
+        super().__setstate__(state)
+        self.tags = TAG_PATTERN.findall(self.value or '')
+
+    @classmethod
+    def stored(cls, value):
+        return cls(value)
 
 # Class for contacts main information
 
 
 class Record:
+    # book is AddressBook which journals changes of the record, modified is time of last change,
+    # version counts the changes and detects concurrent changes of other sessions
+    __slots__ = ('name', 'birthday', 'phones', 'email',
+                 'address', 'notes', 'modified', 'version', 'book', '__weakref__')
+    STATE = ('name', 'birthday', 'phones', 'email', 'address', 'notes')
+
     def __init__(self, name, phone, birthday, email, notes=None, address=None) -> None:
         self.name = Name(name)
         self.birthday = Birthday(birthday)
-        self.phone = Phone(phone) if phone else None
-        self.phones = [self.phone] if phone else []
+        self.phones = [Phone(phone)] if phone else []
         self.email = Email(email)
         self.address = Address(address)
         self.notes = [Note(notes)] if notes else []
+        self.modified = time.time()
+        self.version = 0
+        self.book = None
+
+    @property
+    def phone(self):  # first phone of the contact
+        return self.phones[0] if self.phones else None
+
+    def _changed(self, op, *args):  # report applied change to the book
+        self.modified = time.time()
+        self.version += 1
+        if self.book is not None:
+            self.book.record_changed(self, op, args)
+
+    def __reduce__(self):  # pickled as plain values, book is not a part of the record
+        return (Record.stored, (self.name.value, self.birthday.value, [phone.value for phone in self.phones],
+                                self.email.value, self.address.value, [note.value for note in self.notes], self.modified,
+                                self.version))
+
+    @classmethod
+    def stored(cls, name, birthday, phones, email, address, notes, modified=0, version=0):  # values were validated when saved
+        record = cls.__new__(cls)
+        record.name = Name.stored(name)
+        record.birthday = Birthday.stored(birthday)
+        record.phones = [Phone.stored(phone) for phone in phones]
+        record.email = Email.stored(email)
+        record.address = Address.stored(address)
+        record.notes = [Note.stored(note) for note in notes]
+        record.modified = modified
+        record.version = version
+        record.book = None
+        return record
+
+    def __setstate__(self, state):  # loads records pickled as objects by older versions
+        if isinstance(state, dict):
+            state = [state[key] for key in self.STATE]
+        self.name, self.birthday, self.phones, self.email, self.address, self.notes = state
+        self.modified = 0
+        self.version = 0
+        self.book = None
+
+    def merge(self, other):  # same contact once more: new phones and notes are added, empty fields filled
+        phones = {phone.value for phone in self.phones}
+        self.phones += [phone for phone in other.phones if phone.value not in phones]
+        notes = {note.value for note in self.notes}
+        self.notes += [note for note in other.notes if note.value not in notes]
+        if not self.birthday.value:
+            self.birthday = other.birthday
+        if not self.address.value:
+            self.address = other.address
+        self.modified = max(self.modified, other.modified)
+        self.version += 1
+        return self
 
 # Methods for phone processing
     def add_phone(self, phone_number):
         phone = Phone(phone_number)
         if phone not in self.phones:
             self.phones.append(phone)
+            self._changed('add_phone', phone_number)
 
     def remove_phone(self, phone_number):
         phone = Phone(phone_number)
         for i in self.phones:
             if phone.value == i.value:
                 self.phones.remove(i)
+                self._changed('remove_phone', phone_number)
                 return "phone is removed"
 
 # Methods for email changing
     def edit_email(self, new_email):
         new_email = Email(new_email)
         self.email = new_email
+        self._changed('edit_email', new_email.value)
         return f"email:{self.email.value}"
 
 # Methods for notes and tags processing
@@ -145,59 +282,60 @@ class Record:
         for note in self.notes:
             if keyword.lower() in note.value:
                 self.notes.remove(note)
+                self._changed('delete_note', keyword)
                 return f"Note was removed"
 
     def add_note(self, note, tag=None):
         new_note = Note(f"{note} #{tag}" if tag else f'{note}')
         self.notes.append(new_note)
+        self._changed('add_note', note, tag)
         return f'notes: {"; ".join(note.value for note in self.notes) if self.notes else "N/A"}'
 
     def edit_note(self, keyword, note, tag=None):
         new_note_obj = Note(f"{note} #{tag}" if tag else f'{note}')
+        change = (keyword, note, tag)
         for i, note in enumerate(self.notes):
             if keyword.lower() in note.value:
                 self.notes.pop(i)
                 self.notes.insert(i, new_note_obj)
+                self._changed('edit_note', *change)
                 return f"Note was edited"
         return "Note not found."
 
     def add_tag(self, keyword, tag):
         for note in self.notes:
             if keyword.lower() in note.value:
-                existing_tags = re.findall(r'#(\w+)', note.value)
+                existing_tags = list(note.tags)
                 existing_tags.append(tag)
                 tags = "#".join(existing_tags)
                 note.value = f"{note.value.split('#')[0]}#{tags}"
+                self._changed('add_tag', keyword, tag)
                 return f"Tag was added"
         return f"Tag not found"
 
     def remove_tag(self, keyword, tag):
         for note in self.notes:
             if keyword.lower() in note.value:
-                existing_tags = re.findall(r'#(\w+)', note.value)
+                existing_tags = list(note.tags)
                 if tag in existing_tags:
                     existing_tags.remove(tag)
                     tags = "#".join(existing_tags)
                     note.value = f"{note.value.split('#')[0]}#{tags}"
+                    self._changed('remove_tag', keyword, tag)
                     return f"Tag was removed from the note"
         return f"Tag not found"
 
     def sort_notes(self):
         sorted_notes = sorted(
-            self.notes, key=lambda note: re.findall(r'#(\w+)', note.value))
+            self.notes, key=lambda note: note.tags)
         self.notes = sorted_notes
+        self._changed('sort_notes')
         return sorted_notes
 
 # Methods defines days to birthdays of the contact
     def days_to_birthday(self):
-        if self.birthday:
-            date_now = datetime.now().date()
-            user_next_birthday = datetime(
-                date_now.year, self.birthday.value.month, self.birthday.value.day).date()
-            user_next_year = user_next_birthday.replace(year=date_now.year + 1)
-            delta = user_next_birthday - \
-                date_now if user_next_birthday >= date_now else user_next_year - date_now
-            return delta.days
+        if self.birthday and self.birthday.value:
+            return indexes.days_to_birthday(self.birthday.value, datetime.now().date())
 
     def __str__(self) -> str:
         return (
@@ -212,38 +350,296 @@ class Record:
 
 
 class AddressBook(UserDict):
+    storage = None  # journal or SQLite storage of the file the book was restored from
+    compactor = None  # background thread folding the journal into the snapshot
+    compacted = None  # id of the snapshot the compactor wrote from changes this session saw
+    snapshot_id = None  # id of the snapshot the book was loaded from
+    covered = 0  # last journal segment folded into that snapshot
+
+    def __init__(self, *args, **kwargs):
+        self.search_index = indexes.TrigramIndex()
+        self.tag_index = indexes.TagIndex()
+        self.birthday_index = indexes.BirthdayIndex()
+        self.name_index = indexes.NameIndex()
+        self.fuzzy_index = indexes.FuzzyIndex()
+        # in-memory indexes, only the fuzzy one is kept with SQLite
+        self.indexes = [self.search_index, self.tag_index,
+                        self.birthday_index, self.name_index, self.fuzzy_index]
+        self.seen = {}  # journal segment of other sessions -> position read up to
+        self.changed = set()  # names changed by this session
+        self.conflicts = set()  # names changed by this and another session at once
+        super().__init__(*args, **kwargs)
+
     def add_record(self, record: Record):  # add record in dictionary
         key = record.name.value
         self.data[key] = record
+        record.book = self
+        self.index(record)
+        self.changed.add(key)
+        self.log('add', key, record, base=None)
+
+    def add_records(self, records):  # bulk add, one journal entry for all records
+        # a name already in the book is merged into its record, the journal gets the merged one
+        added = []
+        for record in records:
+            key = record.name.value
+            existing = self.data.get(key)
+            if existing is not None:
+                record = existing.merge(record)
+            self.data[key] = record
+            record.book = self
+            self.changed.add(key)
+            added.append(record)
+        self.reindex()
+        self.log('add_records', None, added)
 
     def find(self, name):   # get record in dictionary
         return self.data.get(name)
 
     def delete(self, name):  # delete contact in dictionary
         if name in self.data:
+            version = self.data[name].version
             del self.data[name]
+            for index in self.indexes:
+                if not index.stale:
+                    index.discard(name)
+            self.changed.add(name)
+            self.log('delete', name, base=version)
             return f'Record {name} deleted'
         else:
             raise KeyError(f"Contact '{name}' not found.")
 
-    def save_to_file(self, filename):     # serialization data to file
-        with open(filename, 'wb') as file_write:
-            pickle.dump(self.data, file_write)
-            return f'exit'
+# Methods for the change journal, save cost depends on the size of the change only
+    def log(self, op, name, *args, base=None, modified=None):  # base is the version of the record before the change
+        # modified is the time of the change, replay keeps it instead of the time of the replay
+        if self.storage is not None:
+            self.storage.append((op, name, args, base, modified))
+
+    def record_changed(self, record: Record, op, args):
+        self.index(record)
+        self.changed.add(record.name.value)
+        self.log(op, record.name.value, *args, base=record.version - 1, modified=record.modified)
+
+    def index(self, record: Record):
+        for index in self.indexes:
+            if not index.stale:
+                index.update(record)
+
+    def reindex(self):  # after load or bulk add, indexes are rebuilt on first use
+        for index in self.indexes:
+            index.clear()
+            index.stale = True
+
+    def fresh(self, index):  # index with all records of the book
+        if index.stale:
+            if index is self.fuzzy_index:  # needs names only, SQLite does not have to load the records
+                for name in self.data:
+                    index.add(name)
+            else:
+                index.build(self.data.values())
+            index.stale = False
+        return index
+
+    def apply(self, op, name, args, base=UNCHECKED, modified=None):  # replay journal entry, True if it was concurrent
+        record = self.data.get(name)
+        # base is the version the writer changed, another version means another session changed it too
+        conflict = base is not UNCHECKED and op != 'add_records' and (
+            record.version if record is not None else None) != base
+        if op == 'add':
+            self.data[name] = args[0]
+            args[0].book = self
+        elif op == 'add_records':
+            for record in args[0]:
+                self.data[record.name.value] = record
+                record.book = self
+        elif op == 'delete':
+            self.data.pop(name, None)
+        elif record is not None:
+            book, record.book = record.book, None  # replayed change is not journaled again
+            getattr(record, op)(*args)
+            record.book = book
+            if modified is not None:  # entries of older versions do not have it
+                record.modified = modified
+        return conflict
+
+    def replay(self, filename, upto=None, wrap=None):  # load snapshot and journal segments after it
+        while True:
+            self.snapshot_id = journal.snapshot_id(filename)
+            self.data, self.covered = journal.read_snapshot(
+                filename, RecordUnpickler, wrap)
+            self.seen = {}  # segment -> position read up to
+            replayed = 0
+            for seq, path in journal.segments(filename):
+                if self.covered < seq and (upto is None or seq <= upto):
+                    for (op, name, args, *rest), position in journal.read_entries(path, RecordUnpickler):
+                        if self.apply(op, name, args, *rest) and name in self.changed:
+                            self.conflicts.add(name)
+                        self.seen[seq] = position
+                        replayed += 1
+            if journal.snapshot_id(filename) == self.snapshot_id:  # not compacted by another process meanwhile
+                return replayed
+
+    def sync(self):  # merge changes other sessions saved, caller holds the lock
+        filename = self.storage.filename
+        current = journal.snapshot_id(filename)
+        if current != self.snapshot_id:
+            if current is None or current != self.compacted:  # folded changes this session did not see
+                return self.reload()
+            self.snapshot_id = current
+        merged = []
+        for seq, path in journal.segments(filename):
+            if seq in self.storage.own:
+                continue
+            for (op, name, args, *rest), position in journal.read_entries(path, RecordUnpickler, self.seen.get(seq, 0)):
+                if self.apply(op, name, args, *rest) and name in self.changed:
+                    # both sessions changed the record, take the order every later load will replay
+                    return self.reload()
+                self.seen[seq] = position
+                merged.append(name)
+        for name in merged:
+            if name is None:  # bulk add
+                self.reindex()
+            elif name in self.data:
+                self.index(self.data[name])
+            else:
+                for index in self.indexes:
+                    if not index.stale:
+                        index.discard(name)
+
+    def reload(self):  # whole book again, own changes are already in the journal
+        self.replay(self.storage.filename)
+        for record in self.data.values():
+            record.book = self
+        self.reindex()
+
+    def compact(self):  # rebuild snapshot from sealed segments in background
+        if self.compactor is not None and self.compactor.is_alive():
+            return
+        filename = self.storage.filename
+        sealed = self.storage.seal()
+        self.compactor = threading.Thread(target=self.compact_in_background, args=(
+            filename, sealed, set(self.storage.own), dict(self.seen)))
+        self.compactor.start()
+
+    def compact_in_background(self, filename, sealed, own, seen):
+        self.compacted = self.compact_file(filename, sealed, own, seen)
+
+    @classmethod
+    def compact_file(cls, filename, sealed, own=(), seen=None):  # -> new snapshot id if the caller saw all of it
+        with journal.locked(filename):
+            upto = journal.sealed_upto(filename, sealed)
+        book = cls()
+        book.replay(filename, upto=upto)
+        with journal.locked(filename):
+            if journal.snapshot_id(filename) != book.snapshot_id:  # compacted by another process meanwhile
+                return None
+            folded = [(seq, path) for seq, path in journal.segments(filename) if seq <= upto]
+            known = seen is not None and all(seq in own or seen.get(seq) == path.stat().st_size
+                                             for seq, path in folded)
+            journal.write_snapshot(filename, book.data, upto)
+            return journal.snapshot_id(filename) if known else None
 
-    def restore_from_file(self, filename):  # deserialization data from file
-        with open(filename, 'rb') as file_read:
-            self.data = pickle.load(file_read)
+    def save_to_file(self, filename):     # serialization data to file
+        if self.storage is not None and self.storage.filename == filename:
+            self.storage.flush()
+            if isinstance(self.storage, journal.Journal):
+                with journal.locked(filename):
+                    self.sync()
+                # rebuilding costs the whole book, so big books collect more entries before it
+                if self.storage.entries >= max(journal.COMPACT_THRESHOLD, len(self.data) // journal.COMPACT_RATIO):
+                    self.compact()
+        elif storage.is_sqlite(filename):  # move records into the SQLite file
+            records = storage.SQLiteStorage(filename, self, Record)
+            for record in self.data.values():
+                records.put(record)
+            records.flush()
+            self.data = self.storage = records
+            self.indexes = [self.fuzzy_index]
+        else:
+            with journal.locked(filename):
+                self.storage = journal.Journal(filename)
+                if journal.has_snapshot(filename):  # another session created the file meanwhile, merge into it
+                    self.log('add_records', None, list(self.data.values()))
+                    self.storage.flush()
+                    self.reload()
+                else:  # first save writes full snapshot
+                    journal.write_snapshot(filename, self.data)
+                    self.snapshot_id = journal.snapshot_id(filename)
+        return f'exit'
+
+    def restore_from_file(self, filename, wrap=None):  # deserialization data from file, wrap(file) may show progress
+        if storage.is_sqlite(filename):  # records are fetched lazily on access
+            self.data = self.storage = storage.SQLiteStorage(
+                filename, self, Record)
+            self.indexes = [self.fuzzy_index]
+            self.reindex()
+            return
+        replayed = self.replay(filename, wrap=wrap)
+        for record in self.data.values():
+            record.book = self
+        self.reindex()
+        self.storage = journal.Journal(filename, self.covered)
+        self.storage.entries = replayed
 
     def search(self, query):
+        if isinstance(self.data, storage.SQLiteStorage):
+            return self.data.search(query)
         query = query.lower()
-        results = []
-        for record in self.data.values():
-            if (query in record.name.value.lower() or
+        if self.search_index.stale and self.search_index.scans < indexes.SCANS_BEFORE_BUILD:
+            self.search_index.scans += 1  # a session with a few searches does not pay for the index
+            names = None
+        else:
+            names = self.fresh(self.search_index).candidates(query)  # trigram postings intersection
+        records = self.data.values() if names is None else (
+            self.data[name] for name in names)
+        return [record for record in records if self.matches(record, query)]
+
+    def find_tags(self, tags, match_all=False):  # (record, note) pairs with all or any of tags
+        if isinstance(self.data, storage.SQLiteStorage):
+            return self.data.find_tags(tags, match_all)
+        found = self.fresh(self.tag_index).find(tags, match_all)
+        pairs = []
+        for name in sorted({name for name, note in found}):
+            record = self.data[name]
+            pairs.extend((record, note)
+                         for note in record.notes if (name, note) in found)
+        return pairs
+
+    def tag_counts(self):  # tag -> quantity of notes with it
+        if isinstance(self.data, storage.SQLiteStorage):
+            return self.data.tag_counts()
+        return self.fresh(self.tag_index).counts()
+
+    def birthdays_within(self, days, today=None):  # (days to birthday, record) sorted by days
+        today = today or datetime.now().date()
+        windows = indexes.birthday_windows(today, days)
+        if isinstance(self.data, storage.SQLiteStorage):
+            records = self.data.born_between(windows)
+        else:
+            records = (self.data[name]
+                       for name in self.fresh(self.birthday_index).between(windows))
+        found = []
+        for record in records:
+            left = indexes.days_to_birthday(record.birthday.value, today)
+            if left <= days:
+                found.append((left, record))
+        return sorted(found, key=lambda item: (item[0], item[1].name.value))
+
+    def birthday_digest(self, days, today=None):  # date -> records with birthday on it
+        today = today or datetime.now().date()
+        digest = {}
+        for left, record in self.birthdays_within(days, today):
+            digest.setdefault(today + timedelta(days=left), []).append(record)
+        return digest
+
+    def find_similar(self, query, limit=10):  # [(edits, record)] names closest to query, for typos
+        return [(edits, self.data[name]) for edits, name in self.fresh(self.fuzzy_index).find(query, limit)]
+
+    @staticmethod
+    def matches(record: Record, query):
+        return (query in record.name.value.lower() or
                 any(query in phone.value for phone in record.phones) or
-                    any(query in note.value.lower() for note in record.notes)):
-                results.append(record)
-        return results
+                any(query in note.value.lower() for note in record.notes))
 
 # Methods for user interaction, to retrieve contact record
     def validate_input(self, prompt, validation_func):
@@ -268,41 +664,104 @@ class AddressBook(UserDict):
         message = f"{note} #{tag}" if tag else f"{note}"
         return Record(name, phone, birthday, email, message, address)
 
-# Method for page view of the contact list
+# Methods for page view of the contact list
     def __iter__(self) -> Iterator:
         # Iterable class
-        return AddressBookIterator(self.data.values(), page_size=2)
+        return AddressBookIterator(self, page_size=2)
+
+    def pages(self, page_size=10, sort=None, after=None, page=0):
+        # sort: None (book order), 'name', 'birthday' or 'modified' (last changed first)
+        # after: cursor of the previous page or a name to continue from, page: page to jump to
+        return AddressBookIterator(self, page_size, sort, after, page)
+
+    @staticmethod
+    def sort_key(sort, record: Record):
+        if sort == 'name':
+            return record.name.value
+        if sort == 'birthday':
+            birthday = record.birthday.value if record.birthday else None
+            return (birthday.month, birthday.day, record.name.value) if birthday else (13, 0, record.name.value)
+        if sort == 'modified':
+            return (-record.modified, record.name.value)
+        raise ValueError(f'Unknown sort key {sort}')
+
+    def page(self, sort, after, size, skip=0):  # records of the page after cursor
+        if isinstance(self.data, storage.SQLiteStorage):
+            return self.data.page(sort, after, size, skip)
+        if sort is None:  # cursor is a position in the book
+            return list(islice(self.data.values(), (after or 0) + skip, (after or 0) + skip + size))
+        if sort == 'name':
+            names = self.fresh(self.name_index).names
+            start = bisect.bisect_right(names, after) if after else 0
+            return [self.data[name] for name in names[start + skip:start + skip + size]]
+        if sort == 'birthday':
+            keys = self.fresh(self.birthday_index).keys
+            start = bisect.bisect_right(keys, after) if after else 0
+            records = [self.data[name] for month, day, name in keys[start + skip:start + skip + size]]
+            if len(records) == size:
+                return records
+            # records without birthday go last, sorted by name
+            skip = max(0, skip - (len(keys) - start))
+            after = max(after, (13, 0, '')) if after else (13, 0, '')
+            undated = (record for record in self.data.values()
+                       if not (record.birthday and record.birthday.value) and self.sort_key(sort, record) > after)
+            return records + heapq.nsmallest(skip + size - len(records), undated,
+                                             key=lambda record: record.name.value)[skip:]
+        candidates = (record for record in self.data.values()
+                      if after is None or self.sort_key(sort, record) > after)
+        return heapq.nsmallest(skip + size, candidates, key=lambda record: self.sort_key(sort, record))[skip:]
 # Methods readeble view
 
     def __repr__(self):
         return f"AddressBook({self.data})"
 
 
+# Class for loading pickles written either by "python main.py" (classes in __main__)
+# or by the contact script (classes in remind_me.main)
+
+
+class RecordUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        if module in ('__main__', 'main', 'remind_me.main') and name in globals():
+            return globals()[name]
+        return super().find_class(module, name)
+
+
 # Class iterator
 
 
+# Keyset paging: every page is read from the book after the cursor of the previous one,
+# records are not copied, so memory per page is O(page_size)
+
+
 class AddressBookIterator:
-    def __init__(self, records_list, page_size):
-        self.records = list(records_list)
+    def __init__(self, book, page_size, sort=None, after=None, page=0):
+        self.book = book
         self.page_size = page_size
-        self.counter = 0  # quantity on page
-        # use for showing part of the reccords that size < page_size
-        self.page = len(self.records) // self.page_size
+        self.sort = sort
+        self.cursor = after  # position in the book or sort key of the last shown record
+        self.skip = page * page_size  # records to skip for jump to the page
+        self.records = None  # live iterator over the dict for pages in book order
+
+    def __iter__(self):
+        return self
 
     def __next__(self):
-        if self.counter >= len(self.records):
+        if self.sort is None and isinstance(self.book.data, dict):
+            if self.records is None:
+                self.records = islice(
+                    self.book.data.values(), (self.cursor or 0) + self.skip, None)
+            result = list(islice(self.records, self.page_size))
+        else:
+            result = self.book.page(
+                self.sort, self.cursor, self.page_size, self.skip)
+        if not result:
             raise StopIteration
+        if self.sort is None:
+            self.cursor = (self.cursor or 0) + self.skip + len(result)
         else:
-            if self.page > 0:
-                # slice reccords on the page
-                result = list(
-                    self.records[self.counter:self.counter + self.page_size])
-                self.page -= 1
-                self.counter += self.page_size
-            else:
-                # the rest of the records on the page
-                result = list(self.records[self.counter:])
-                self.counter = len(self.records)
+            self.cursor = self.book.sort_key(self.sort, result[-1])
+        self.skip = 0
         return result
 
 # Error handler
@@ -320,24 +779,37 @@ def error_handler(func):
     return inner
 
 
-@error_handler
-def main():
+def load_book(progress=False):
+    if not isinstance(address_book, AddressBook):  # the daemon has it loaded
+        return
     try:
-        if os.path.getsize(filename) > 0:  # check if file of data not empty
+        size = os.path.getsize(filename)
+        if size >= PROGRESS_MIN_SIZE and progress and not storage.is_sqlite(filename):
+            from rich.progress import wrap_file  # progress of the real file reading
+            address_book.restore_from_file(filename, lambda file: wrap_file(
+                file, size, description="Loading data...", console=rich_console()))
+        elif size > 0:  # check if file of data not empty
             address_book.restore_from_file(filename)
     except Exception:
         f'First run, will be create file'
 
-    for i in track(range(5), description="Loading data..."):
-        print(f"loading {i}")
-        time.sleep(0.5)
+
+MENU_CHOICES = {str(number) for number in range(1, 10)}
+
+
+@error_handler
+def main():
+    load_book(progress=True)
+    action = metrics.NULL_TIMER  # time of the chosen menu action, prompts inside it included
     while True:
+        action.stop()
         console.print(
             f'{"-" * 50}Main menu of contacts:{"-" * 53}', style="row")
         console.print(
             "| 1. Add | 2.All contacts | 3.Edit | 4.Delete | 5.Find | 6.Birthday soon! | 7.Note menu | 8.Sort directory | 9. Save & Exit |", style="menu")
         console.print(f'{"-" * 125}', style="row")
         choice = input("Choose an option: ")
+        action = metrics.timer(f'menu.{choice}' if choice in MENU_CHOICES else 'menu.invalid').start()  # one series per item
 
         if choice == '1':  # add contact
             address_book.add_record(address_book.get_contact())
@@ -363,7 +835,7 @@ def main():
                     contact = input("Input whose contact to edit: ")
                     record = address_book.data.get(contact)
                     if record:
-                        del address_book.data[contact]
+                        address_book.delete(contact)
                         new_reccord = address_book.get_contact()
                         address_book.add_record(new_reccord)
                         console.print(
@@ -406,7 +878,7 @@ def main():
 
         elif choice == '4':  # Delete contact
             contact_name = input("Enter contact name to delete: ")
-            del address_book.data[contact_name]
+            address_book.delete(contact_name)
             console.print('Contact was removed', style="success")
 
         elif choice == '5':  # Find contact
@@ -416,16 +888,19 @@ def main():
                 for result in results:
                     console.print(result, style="success")
             else:
-                console.print("Contact not found.", style="error")
+                similar = address_book.find_similar(query)
+                if similar:
+                    console.print("Contact not found, did you mean:", style="warning")
+                    for edits, result in similar:
+                        console.print(result, style="success")
+                else:
+                    console.print("Contact not found.", style="error")
 
         elif choice == '6':  # display_contacts_n_day_to birthday
             n = int(input("Input quantity days to birthday: "))
-            for page in address_book:
-                for record in page:
-                    m = record.days_to_birthday()
-                    if m <= n:
-                        console.print(
-                            f"To {record.name.value}s birthday {m} days", style='success')
+            for m, record in address_book.birthdays_within(n):
+                console.print(
+                    f"To {record.name.value}s birthday {m} days", style='success')
 
 # /////////////////////// NOTES MENU /////////////////////////
 
@@ -518,26 +993,333 @@ def main():
 
         elif choice == '8':  # sort folder
             folder = input("Enter folder path to sort: ")
-            ext_find, unknown = clean(folder)
-            exten_list = ', '.join(ext_find.keys())
-
-            console.print(
-                f"Directory was sorted, extensions: {exten_list}, files:", style="note")
-            for item in ext_find.items():
-                file_name_match = re.search(r'[^\/]+$', str(item))
-                file_name = file_name_match.group() if file_name_match else None
-                console.print(re.sub(r'\'\)\]\)', '',
-                              file_name), style="success")
-            console.print(f'{unknown}', style="note")
+            sort_folder(folder)
 
         elif choice == '9':
             address_book.save_to_file(filename)
+            if address_book.conflicts:
+                console.print(
+                    f'Merged with changes of another session: {", ".join(sorted(address_book.conflicts))}', style="warning")
             console.print(
                 f'Contactbook saved, have a nice day! :D', style="success")
+            action.stop()
             break
 
 
-if __name__ == '__main__':
+def sort_folder(folder, workers=None, archive_workers=None, max_unpacked=None, archive_timeout=None, dedup=None,
+                manifest=None, dry_run=False, journal=True):
+    # menu 8 and contact clean FOLDER; shown while the cleaner goes, nothing is kept per file
+    try:
+        from . import cleaner
+    except ImportError:
+        import cleaner
+    from rich.progress import Progress, SpinnerColumn, TextColumn
+    summary = None
+    sorted_files = 0
+    with Progress(SpinnerColumn(), TextColumn('{task.description}'), console=rich_console(),
+                  transient=True) as progress:
+        task = progress.add_task('Sorting...', total=None)
+        for event in cleaner.events(
+                folder, workers, archive_workers,
+                max_unpacked * 1024 ** 2 if max_unpacked else cleaner.MAX_UNPACKED,
+                archive_timeout or cleaner.ARCHIVE_TIMEOUT, dedup, manifest, dry_run, journal):
+            kind = event.kind
+            if kind in ('move', 'unpack'):
+                sorted_files += 1
+                if dry_run:
+                    planned = f'{event.path} -> {event.target}'
+                    progress.console.print(planned if kind == 'move' else f'{planned}{os.sep} (unpack)',
+                                           markup=False, highlight=False, soft_wrap=True)
+                progress.update(task, description=f'Sorting... {sorted_files} files')
+            elif kind == 'error':
+                progress.console.print(f'Error during {event.detail}: {event.path}', markup=False,
+                                       style="error", soft_wrap=True)
+            elif kind == 'duplicate':
+                progress.console.print(f'Duplicate {event.path} of {event.target} {event.detail}', markup=False,
+                                       soft_wrap=True)
+            elif kind == 'resume':
+                progress.console.print(f'Finished the interrupted run of {event.path}', style="warning")
+            elif kind == 'summary':
+                summary = event.detail
+    if summary is None:
+        return
+    console.print(f"Directory was sorted: {summary['files']} files, {summary['archives']} archives, "
+                  f"{summary['duplicates']} duplicates, {summary['folders_removed']} folders removed, "
+                  f"{summary['errors']} errors", style="note")
+    for extension, count in summary['extensions'].items():
+        console.print(f'{extension}: {count}', style="success")
+    if summary['unknown']:
+        console.print(f"Unknown extensions: {', '.join(summary['unknown'])}", style="note")
+    if dry_run:
+        console.print('Dry run, nothing was changed', style="warning")
+
+
+def undo_sort(folder):  # contact clean FOLDER --undo
+    try:
+        from . import cleaner
+    except ImportError:
+        import cleaner
+    undone, failed = cleaner.undo(folder)
+    if not undone and not failed:
+        console.print(f'No sorting of {folder} to undo', style="warning")
+        return
+    for message in failed:
+        console.print(message, style="error")
+    console.print(f'Undone {undone} changes of the last sorting of {folder}', style="success")
+    if failed:
+        console.print(f'{len(failed)} changes could not be undone, they are tried again by the next undo',
+                      style="error")
+
+
+def watch_folder(folder, workers=None, archive_workers=None, max_unpacked=None, archive_timeout=None,
+                 settle=None, polling=False):  # contact clean FOLDER --watch
+    try:
+        from . import cleaner, watcher
+    except ImportError:
+        import cleaner
+        import watcher
+
+    def show(event):
+        if event.kind == 'move':
+            console.print(f'{event.path} -> {event.target}', markup=False, highlight=False, soft_wrap=True)
+        elif event.kind == 'unpack':
+            console.print(f'{event.path} -> {event.target}{os.sep} (unpack)', markup=False, highlight=False,
+                          soft_wrap=True)
+        elif event.kind == 'error':
+            console.print(f'Error during {event.detail}: {event.path}', markup=False, style="error", soft_wrap=True)
+        elif event.kind == 'polling':
+            console.print(f'Watching with polling: {event.detail}', markup=False, style="warning")
+
+    sys.stderr.write(f'Watching {folder}, Ctrl+C to stop\n')
+    count = watcher.watch(folder, workers, archive_workers,
+                          max_unpacked * 1024 ** 2 if max_unpacked else cleaner.MAX_UNPACKED,
+                          archive_timeout or cleaner.ARCHIVE_TIMEOUT, settle or watcher.SETTLE, polling, show)
+    console.print(f'Sorted {count} files', style="success")
+
+
+def import_contacts(files, rejects=None, workers=0):  # contact import FILE...
+    try:
+        from . import importer
+    except ImportError:
+        import importer
+    load_book()
+    for file in files:
+        imported, rejected, rejects_path = importer.import_file(
+            address_book, Record, file, rejects, workers)
+        console.print(
+            f'{file}: imported {imported} contacts', style="success")
+        if rejected:
+            console.print(
+                f'{file}: rejected {rejected} rows, see {rejects_path}', style="warning")
+    address_book.save_to_file(filename)
+
+
+def export_contacts(output, fmt=None, fields=None, tag=None, days=None, query=None):  # contact export OUTPUT
+    try:
+        from . import exporter
+    except ImportError:
+        import exporter
+    fmt = fmt or Path(output).suffix[1:].lower() or 'csv'
+    fields = fields.split(',') if fields else None
+    exporter.writer(fmt, fields)  # unknown format or fields stop before the output is created
+    if not isinstance(address_book, AddressBook):  # the daemon writes the text
+        exporter.write(address_book.export(fmt, fields, tag, days, query), output)
+        return
+    load_book()
+    exporter.export_to_file(address_book, output, fmt, fields=fields, tag=tag, days=days, query=query)
+
+
+def batch_commands(commands, results='-', checkpoint=0):  # contact batch [FILE]
+    try:
+        from . import batch, daemon
+    except ImportError:
+        import batch
+        import daemon
+    client = daemon.connect(daemon.socket_path(filename))
+    if client is None:  # no daemon, the book is loaded by this process
+        load_book()
+    lines = sys.stdin if commands == '-' else open(commands, encoding='utf-8')
+    out = sys.stdout if results == '-' else open(results, 'w', encoding='utf-8')
+    try:
+        if client is not None:
+            done, failed = daemon.run_batch(client, lines, out)
+        else:
+            done, failed = batch.run(address_book, Record, lines, out, checkpoint,
+                                     lambda: address_book.save_to_file(filename))
+    finally:
+        if client is not None:
+            client.close()
+        for file in (lines, out):
+            if file not in (sys.stdin, sys.stdout):
+                file.close()
+    sys.stderr.write(f'{done} commands done, {failed} failed\n')
+    return failed
+
+
+def serve_book():  # contact serve
+    try:
+        from . import daemon
+    except ImportError:
+        import daemon
+    load_book()
+    path = daemon.socket_path(filename)
+    sys.stderr.write(f'Serving {filename} on {path}\n')
+    try:
+        daemon.serve(address_book, Record, path,
+                     lambda: address_book.save_to_file(filename))
+    except RuntimeError as e:
+        console.print(f'Error: {e}', style="error")
+        sys.exit(1)
+
+
+def served_book():  # the book of a daemon serving the file, None if none does
+    try:
+        from . import daemon
+    except ImportError:
+        import daemon
+    client = daemon.connect(daemon.socket_path(filename))
+    if client is None:
+        return None
+    return daemon.RemoteBook(client, Record, AddressBook().get_contact)  # the form does not use its book
+
+
+def enable_metrics():  # time book operations and storage I/O, methods are wrapped only now
+    metrics.enable()
+    metrics.instrument(AddressBook, ('add_record', 'add_records', 'delete', 'search', 'find_tags',
+                                     'tag_counts', 'birthdays_within', 'find_similar', 'save_to_file',
+                                     'restore_from_file', 'replay', 'sync', 'reload', 'compact_file'), 'book')
+    metrics.instrument(journal, ('read_snapshot', 'write_snapshot'), 'journal')
+    metrics.instrument(journal.Journal, ('append', 'flush'), 'journal')
+    metrics.instrument(storage.SQLiteStorage, ('read', 'put', 'flush', 'search', 'find_tags',
+                                               'page', 'born_between'), 'sqlite')
+
+
+def run_command(args):
+    global address_book
+    if args.command in ('import', 'export', None):  # go through the daemon when one serves the book
+        address_book = served_book() or address_book
+    try:
+        run_book_command(args)
+    except ValueError as e:  # bad arguments, e.g. an unknown export format or field
+        sys.exit(f'contact {args.command}: {e}')
+    finally:
+        if not isinstance(address_book, AddressBook):
+            address_book.close()
+
+
+def run_book_command(args):
+    if args.command == 'import':
+        import_contacts(args.files, args.rejects, args.workers)
+    elif args.command == 'export':
+        export_contacts(args.output, args.format, args.fields,
+                        args.tag, args.days, args.query)
+    elif args.command == 'serve':
+        serve_book()
+    elif args.command == 'clean' and args.watch:
+        watch_folder(args.folder, args.workers, args.archive_workers, args.max_unpacked,
+                     args.archive_timeout, args.settle, args.poll)
+    elif args.command == 'clean' and args.undo:
+        undo_sort(args.folder)
+    elif args.command == 'clean':
+        sort_folder(args.folder, args.workers, args.archive_workers, args.max_unpacked,
+                    args.archive_timeout, args.dedup, args.manifest, args.dry_run, not args.no_journal)
+    elif args.command == 'batch':
+        sys.exit(1 if batch_commands(args.commands, args.results, args.checkpoint) else 0)
+    else:
+        main()
+
+
+def run():  # entry point of the contact script
+    global address_book, filename
+    parser = argparse.ArgumentParser(
+        prog='contact', description='RemindMe contact book, without a command opens the menu')
+    parser.add_argument('--book', default=os.environ.get('CONTACTS_FILE', 'contacts.pkl'),
+                        help='contacts file, *.db keeps contacts in SQLite')
+    parser.add_argument('--metrics', default=os.environ.get('CONTACTS_METRICS'),
+                        help='write timings and counters of the run to FILE (*.json or Prometheus text)')
+    parser.add_argument('--metrics-format', choices=('json', 'prometheus'),
+                        help='default from the file extension')
+    parser.add_argument('--profile', help='run the command under cProfile and dump the stats to FILE')
+    commands = parser.add_subparsers(dest='command')
+    importing = commands.add_parser(
+        'import', help='import contacts from CSV or vCard files')
+    importing.add_argument('files', nargs='+')
+    importing.add_argument(
+        '--rejects', help='file for rejected rows (default FILE.rejects.csv)')
+    importing.add_argument('--workers', type=int, default=0,
+                           help='validate in a pool of processes')
+    exporting = commands.add_parser(
+        'export', help='export contacts to CSV, JSONL or vCard')
+    exporting.add_argument('output', help="file, '-' for stdout")
+    exporting.add_argument('--format', choices=('csv', 'jsonl', 'vcf'),
+                           help='default from the file extension')
+    exporting.add_argument(
+        '--fields', help='comma separated: name,phones,birthday,email,address,notes')
+    exporting.add_argument('--tag', help='only contacts with the tag')
+    exporting.add_argument('--days', type=int,
+                           help='only contacts with birthday in the next days')
+    exporting.add_argument(
+        '--query', help='only contacts found by the query')
+    batching = commands.add_parser(
+        'batch', help='apply JSON commands, one per line, and write JSON results')
+    batching.add_argument('commands', nargs='?', default='-',
+                          help="file of commands, '-' for stdin (default)")
+    batching.add_argument('--results', default='-',
+                          help="file for results, '-' for stdout (default)")
+    batching.add_argument('--checkpoint', type=int, default=0,
+                          help='save the book every N commands (default only at the end)')
+    commands.add_parser(
+        'serve', help='keep the book loaded and serve it on FILE.sock, the menu, import, export and batch '
+                      'then go through it')
+    cleaning = commands.add_parser(
+        'clean', help='sort files of a folder into images, video, audio, documents and archives')
+    cleaning.add_argument('folder')
+    cleaning.add_argument('--workers', type=int,
+                          help='threads moving files (default depends on the CPU count)')
+    cleaning.add_argument('--archive-workers', type=int,
+                          help='processes unpacking archives (default the CPU count)')
+    cleaning.add_argument('--max-unpacked', type=int, metavar='MB',
+                          help='archives unpacking to more are not unpacked (default 1024)')
+    cleaning.add_argument('--archive-timeout', type=float, metavar='SECONDS',
+                          help='archives taking longer are not unpacked (default 300)')
+    cleaning.add_argument('--dedup', choices=('delete', 'link'),
+                          help='delete files with the same content as another sorted file or replace them with hard links')
+    cleaning.add_argument('--manifest', nargs='?', const=True, metavar='FILE',
+                          help='remember the sorted folder and skip what did not change on the next run '
+                               '(default file in ~/.cache/remind_me)')
+    cleaning.add_argument('--dry-run', action='store_true',
+                          help='print the planned moves, change nothing')
+    cleaning.add_argument('--no-journal', action='store_true',
+                          help='do not log the changes first; a stopped run cannot be finished or undone')
+    cleaning.add_argument('--undo', action='store_true',
+                          help='move the files of the last run back and restore removed folders')
+    cleaning.add_argument('--watch', action='store_true',
+                          help='keep running and sort files as they arrive')
+    cleaning.add_argument('--settle', type=float, metavar='SECONDS',
+                          help='with --watch, sort a file after it did not change for SECONDS (default 0.5)')
+    cleaning.add_argument('--poll', action='store_true',
+                          help='with --watch, poll folders instead of using inotify')
+    args = parser.parse_args()
+
+    if args.metrics:
+        enable_metrics()
     address_book = AddressBook()  # create object
-    filename = 'contacts.pkl'
-    main()
+    filename = args.book
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        run_command(args)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            sys.stderr.write(f'Profile saved to {args.profile}, see python -m pstats {args.profile}\n')
+        if args.metrics:
+            metrics.export(args.metrics, args.metrics_format)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,71 @@
+import hashlib
+import os
+import pickle
+
+# Manifest of a sorted folder, kept between runs of the cleaner in the user cache.
+# A folder is trusted while its mtime is the one recorded after the last run, the
+# mtime changes whenever a name is added to or removed from the folder:
+# - category folders keep their names, sizes and hashes, so they are not listed,
+#   stat'ed or hashed again;
+# - source folders the cleaner could not remove keep their subfolders, so they are
+#   not listed again, only the subfolders are checked.
+
+VERSION = 1
+
+
+def default_path(root, suffix='.pkl') -> str:  # not inside the folder being sorted, it would be sorted too
+    cache = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    key = hashlib.sha1(os.path.abspath(root).encode('utf-8', 'surrogateescape')).hexdigest()[:16]
+    return os.path.join(cache, 'remind_me', f'clean-{key}{suffix}')
+
+
+def mtime(path):  # None if there is no such folder
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class Manifest:
+    def __init__(self, root, path=None):
+        self.root = root
+        self.path = path or default_path(root)
+        self.folders = {}  # category folder -> (mtime, {name: [size, mtime, digest] or None for folders})
+        self.dirs = {}  # source folder left after the run -> (mtime, [subfolder names])
+        try:
+            with open(self.path, 'rb') as file:
+                version, root, folders, dirs = pickle.load(file)
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            return  # first run or unreadable manifest, everything is listed again
+        if version == VERSION and root == os.path.abspath(self.root):
+            self.folders, self.dirs = folders, dirs
+
+    def key(self, folder) -> str:
+        return os.path.relpath(folder, self.root)
+
+    def files(self, folder):  # files of the folder if it did not change since the last run, else None
+        recorded = self.folders.get(self.key(folder))
+        if recorded is not None and recorded[0] == mtime(folder):
+            return recorded[1]
+        return None
+
+    def subfolders(self, folder):  # subfolder names if the folder did not change since the last run, else None
+        recorded = self.dirs.get(self.key(folder))
+        if recorded is not None and recorded[0] == mtime(folder):
+            return recorded[1]
+        return None
+
+    def record_files(self, folder, files):  # after the last change of the folder in the run
+        self.folders[self.key(folder)] = (mtime(folder), files)
+
+    def record_dirs(self, dirs):  # {folder: subfolder names} of all source folders left
+        self.dirs = {self.key(folder): (mtime(folder), subfolders)
+                     for folder, subfolders in dirs.items()}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temporary = f'{self.path}.{os.getpid()}.tmp'
+        with open(temporary, 'wb') as file:
+            pickle.dump((VERSION, os.path.abspath(self.root), self.folders, self.dirs),
+                        file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, self.path)
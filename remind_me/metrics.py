@@ -0,0 +1,137 @@
+from functools import wraps
+import json
+import threading
+import time
+
+# Timers and counters of the slow parts: book operations, storage I/O and cleaner phases.
+# Disabled by default. Then timer() returns a shared object that does nothing and
+# methods are not wrapped at all, so the cost is one function call per cleaner phase.
+# enable() turns collection on, instrument() wraps methods of a class or module.
+
+enabled = False
+timers = {}  # name -> [calls, total seconds, max seconds]
+counters = {}  # name -> value
+lock = threading.Lock()  # the compactor records from its own thread
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def record(name, elapsed):
+    with lock:
+        stats = timers.get(name)
+        if stats is None:
+            timers[name] = [1, elapsed, elapsed]
+        else:
+            stats[0] += 1
+            stats[1] += elapsed
+            if elapsed > stats[2]:
+                stats[2] = elapsed
+
+
+def count(name, value=1):
+    if enabled:
+        with lock:
+            counters[name] = counters.get(name, 0) + value
+
+# Class for timing a block: with timer('clean.scan'): ... or start() / stop()
+
+
+class Timer:
+    def __init__(self, name):
+        self.name = name
+        self.started = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        return self
+
+    def stop(self):
+        if self.started is not None:
+            record(self.name, time.perf_counter() - self.started)
+            self.started = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class NullTimer:
+    def start(self):
+        return self
+
+    def stop(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+def timer(name):
+    return Timer(name) if enabled else NULL_TIMER
+
+
+def timed(name, func):  # func recording its time under name
+    @wraps(func)
+    def inner(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            record(name, time.perf_counter() - start)
+    return inner
+
+
+def instrument(owner, names, prefix):  # wrap methods of a class or functions of a module
+    for name in names:
+        attr = vars(owner)[name]
+        if isinstance(attr, (classmethod, staticmethod)):
+            wrapped = type(attr)(timed(f'{prefix}.{name}', attr.__func__))
+        else:
+            wrapped = timed(f'{prefix}.{name}', attr)
+        setattr(owner, name, wrapped)
+
+# Export
+
+
+def snapshot():
+    with lock:
+        return {'timers': {name: {'calls': calls, 'total_seconds': total, 'max_seconds': longest}
+                           for name, (calls, total, longest) in sorted(timers.items())},
+                'counters': dict(sorted(counters.items()))}
+
+
+def label(value):  # label value of the text format, backslash, quote and newline escaped
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus():  # text exposition format, e.g. for the node exporter textfile collector
+    data = snapshot()
+    lines = []
+    for metric, key, kind in (('remindme_operation_calls_total', 'calls', 'counter'),
+                              ('remindme_operation_seconds_total', 'total_seconds', 'counter'),
+                              ('remindme_operation_seconds_max', 'max_seconds', 'gauge')):
+        lines.append(f'# TYPE {metric} {kind}')
+        lines.extend(f'{metric}{{operation="{label(name)}"}} {stats[key]:.9g}'
+                     for name, stats in data['timers'].items())
+    lines.append('# TYPE remindme_events_total counter')
+    lines.extend(f'remindme_events_total{{name="{label(name)}"}} {value}'
+                 for name, value in data['counters'].items())
+    return '\n'.join(lines) + '\n'
+
+
+def export(path, fmt=None):  # fmt 'json' or 'prometheus', default from the file extension
+    fmt = fmt or ('json' if str(path).endswith('.json') else 'prometheus')
+    text = json.dumps(snapshot(), indent=2) + '\n' if fmt == 'json' else prometheus()
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(text)
@@ -0,0 +1,191 @@
+import os
+import pickle
+import shutil
+import threading
+import time
+try:
+    from .manifest import default_path
+    from .transfer import move_file
+except ImportError:  # started as a script: python main.py
+    from manifest import default_path
+    from transfer import move_file
+
+# Move journal of the cleaner, kept in the user cache next to the manifest.
+# Every batch of changes is appended and synced before it is done and marked done
+# after it, so a run stopped at any point (crash, power loss, Ctrl+C) can be finished
+# or rolled back. Records are pickled one after another:
+#   ('run', root, started)             first record of a run
+#   ('move', [(source, destination)])  up to BATCH files
+#   ('unpack', [(archive, folder, destination of the archive)])
+#   ('dedup', [(duplicate, kept)], link)
+#   ('rmdir', [folder])
+#   ('done', index)                    record number index is done, not synced
+#   ('end',)                           the run finished
+# Only one fsync per batch is paid, a few hundred for a million files.
+
+BATCH = 4096  # moves in one record
+
+
+def read(path):  # -> ([records], {indexes done}, ended); a torn last record is ignored
+    records = []
+    done = set()
+    ended = False
+    try:
+        with open(path, 'rb') as file:
+            while True:
+                try:
+                    record = pickle.load(file)
+                except (EOFError, pickle.UnpicklingError, ValueError, AttributeError):
+                    break
+                if record[0] == 'done':
+                    done.add(record[1])
+                elif record[0] == 'end':
+                    ended = True
+                else:
+                    records.append(record)
+    except FileNotFoundError:
+        pass
+    return records, done, ended
+
+# Class for writing the journal of one run
+
+
+class MoveLog:
+    def __init__(self, root, path=None):
+        self.root = os.path.abspath(root)
+        self.path = path or default_path(root, '.moves')
+        self.file = None
+        self.count = 0  # records written, the next one gets this index
+        self.lock = threading.Lock()  # moves are marked done from threads of the pool
+
+    def open(self):  # -> records of an unfinished run, which this run continues
+        records, done, ended = read(self.path)
+        if records and not ended:
+            resume(records, done)
+            self.count = len(records)
+            self.file = open(self.path, 'ab')
+            return records
+        return []
+
+    def write(self, record):  # -> index of the record, on disk when this returns
+        with self.lock:
+            if self.file is None:  # created on the first change, a run without any keeps the last journal
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self.file = open(self.path, 'wb')
+                pickle.dump(('run', self.root, time.time()), self.file, protocol=pickle.HIGHEST_PROTOCOL)
+                self.count = 1
+            pickle.dump(record, self.file, protocol=pickle.HIGHEST_PROTOCOL)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.count += 1
+            return self.count - 1
+
+    def done(self, index):  # a lost mark only makes resume check the batch again
+        with self.lock:
+            pickle.dump(('done', index), self.file, protocol=pickle.HIGHEST_PROTOCOL)
+            self.file.flush()
+
+    def close(self, finished=True):  # finished False keeps the run open for resume
+        if self.file is None:
+            return
+        if finished:
+            self.write(('end',))
+        self.file.close()
+        self.file = None
+
+
+def resume(records, done):  # bring batches which were not marked done to a known state
+    # moves are finished; half unpacked archives are removed, the archive is still in
+    # place and unpacked again by the run; rmdir and dedup are safe to repeat.
+    # Files after the last batch were never planned, the walk of the run finds them;
+    # it lists only the files left in the source folders, the moved ones are gone
+    for index, record in enumerate(records):
+        if index in done:
+            continue
+        if record[0] == 'move':
+            for source, destination in record[1]:
+                if os.path.lexists(source) and not os.path.lexists(destination):
+                    os.makedirs(os.path.dirname(destination), exist_ok=True)
+                    move_file(source, destination)
+        elif record[0] == 'unpack':
+            for archive, folder, destination in record[1]:
+                if os.path.lexists(archive):
+                    shutil.rmtree(folder, ignore_errors=True)
+
+
+def revert(kind, change, link, created):  # -> True undone, False nothing to undo, or why it cannot be undone
+    if kind == 'rmdir':
+        if os.path.isdir(change):
+            return False
+        os.makedirs(change)
+        return True
+    if kind == 'dedup':
+        duplicate, kept = change
+        if link:  # linked names still have the same content
+            return False
+        if os.path.lexists(duplicate) or not os.path.isfile(kept):
+            return f'Cannot restore duplicate {duplicate}'
+        shutil.copy2(kept, duplicate)
+        return True
+    source, destination = change[0], change[-1]
+    if kind == 'unpack':
+        shutil.rmtree(change[1], ignore_errors=True)
+    if not os.path.lexists(destination):
+        return False
+    if os.path.lexists(source):  # the old name was taken again since
+        return f'Cannot move back {destination}: {source} exists'
+    os.makedirs(os.path.dirname(source), exist_ok=True)
+    move_file(destination, source)
+    created.add(os.path.dirname(destination))
+    return True
+
+
+def undo(root, path=None):  # -> (changes undone, [why a change could not be undone])
+    # the journal is removed when everything was undone, otherwise it keeps only the
+    # changes still to undo, so the next undo tries them again
+    path = path or default_path(root, '.moves')
+    records, done, ended = read(path)
+    undone = 0
+    failed = []
+    left = []  # records with the changes not undone, newest first
+    created = set()  # folders the run created, removed when empty again
+    for record in reversed(records):
+        kind = record[0]
+        if kind not in ('move', 'unpack', 'dedup', 'rmdir'):
+            continue
+        kept = []
+        for change in reversed(record[1]):
+            try:
+                result = revert(kind, change, kind == 'dedup' and record[2], created)
+            except OSError as e:
+                result = f'Error during undo: {e}'
+            if result is True:
+                undone += 1
+            elif result:
+                failed.append(result)
+                kept.append(change)
+        if kept:
+            left.append((kind, kept[::-1], *record[2:]))
+    root = os.path.abspath(root)
+    for folder in sorted(created, key=len, reverse=True):  # extension folders, then category folders
+        for empty in (folder, os.path.dirname(folder)):
+            if os.path.abspath(empty) != root:
+                try:
+                    os.rmdir(empty)
+                except OSError:
+                    pass
+    if left:
+        rewrite(path, records[:1] + left[::-1] + [('end',)])
+    elif records:
+        os.remove(path)
+    return undone, failed
+
+
+def rewrite(path, records):  # the journal is replaced as a whole, a crash keeps the old one
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as file:
+        for record in records:
+            pickle.dump(record, file, protocol=pickle.HIGHEST_PROTOCOL)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
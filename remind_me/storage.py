@@ -0,0 +1,281 @@
+from collections.abc import MutableMapping
+from pathlib import Path
+import weakref
+
+# SQLite storage engine for the contact book.
+# Works as AddressBook.data: records are fetched from the file on access, so the
+# book opens in constant time and does not have to fit into memory.
+# Every change is committed at once. A change is written only if the row still has
+# the version the record was read with, otherwise the change is applied again to
+# the row another process wrote.
+
+SQLITE_SUFFIXES = ('.db', '.sqlite', '.sqlite3')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    birthday TEXT,
+    birthday_md TEXT,
+    email TEXT,
+    address TEXT,
+    modified REAL NOT NULL DEFAULT 0,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS phones (
+    record_id INTEGER NOT NULL REFERENCES records(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    phone TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS notes (
+    id INTEGER PRIMARY KEY,
+    record_id INTEGER NOT NULL REFERENCES records(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tags (
+    note_id INTEGER NOT NULL REFERENCES notes(id) ON DELETE CASCADE,
+    record_id INTEGER NOT NULL,
+    tag TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS records_email ON records(email);
+CREATE INDEX IF NOT EXISTS records_birthday_md ON records(birthday_md);
+CREATE INDEX IF NOT EXISTS phones_phone ON phones(phone);
+CREATE INDEX IF NOT EXISTS phones_record ON phones(record_id);
+CREATE INDEX IF NOT EXISTS notes_record ON notes(record_id);
+CREATE INDEX IF NOT EXISTS tags_tag ON tags(tag);
+CREATE INDEX IF NOT EXISTS records_birthday_order ON records(COALESCE(birthday_md, '13-00'), name);
+CREATE INDEX IF NOT EXISTS records_modified_order ON records(-modified, name);
+'''
+ORDERS = {  # sort -> columns of the keyset, the same order as AddressBook.sort_key
+    'name': ('name',),
+    'birthday': ("COALESCE(birthday_md, '13-00')", 'name'),
+    'modified': ('-modified', 'name'),
+}
+
+
+def is_sqlite(filename) -> bool:
+    return Path(filename).suffix.lower() in SQLITE_SUFFIXES
+
+# Class for records stored in SQLite file, same mapping API as the dict of records
+
+
+class SQLiteStorage(MutableMapping):
+    def __init__(self, filename, book, record_cls):
+        self.filename = filename
+        self.book = book
+        self.record_cls = record_cls
+        import sqlite3  # only books kept in SQLite pay for the import
+        self.loaded = weakref.WeakValueDictionary()  # records handed out, name -> Record
+        self.end = None  # (position, id) where the last page in book order ended
+        self.db = sqlite3.connect(filename, timeout=30)
+        self.db.create_function('pylower', 1, str.lower, deterministic=True)
+        self.db.execute('PRAGMA foreign_keys = ON')
+        self.db.execute('PRAGMA journal_mode = WAL')
+        self.db.execute('PRAGMA synchronous = NORMAL')  # commit of every change does not wait for fsync
+        columns = [row[1] for row in self.db.execute('PRAGMA table_info(records)')]
+        if columns and 'modified' not in columns:  # file created before records kept time of change
+            self.db.execute(
+                'ALTER TABLE records ADD COLUMN modified REAL NOT NULL DEFAULT 0')
+        if columns and 'version' not in columns:
+            self.db.execute(
+                'ALTER TABLE records ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+        self.db.executescript(SCHEMA)  # after the columns its indexes need
+
+# Mapping methods, reads go to the file lazily
+    def __getitem__(self, name):
+        record = self.loaded.get(name)
+        if record is None:
+            record = self.read(name)
+            if record is None:
+                raise KeyError(name)
+            self.loaded[name] = record
+        return record
+
+    def __setitem__(self, name, record):
+        self.put(record)
+
+    def __delitem__(self, name):
+        if not self.db.execute('DELETE FROM records WHERE name = ?', (name,)).rowcount:
+            raise KeyError(name)
+        self.loaded.pop(name, None)
+
+    def __contains__(self, name):
+        return self.db.execute('SELECT 1 FROM records WHERE name = ?', (name,)).fetchone() is not None
+
+    def __iter__(self):
+        for (name,) in self.db.execute('SELECT name FROM records ORDER BY id'):  # cursor, not a list
+            yield name
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM records').fetchone()[0]
+
+    def read(self, name):  # record as it is in the file now, None if there is no such
+        row = self.db.execute(
+            'SELECT id, birthday, email, address, modified, version FROM records WHERE name = ?', (name,)).fetchone()
+        return self.build(name, *row) if row is not None else None
+
+    def build(self, name, record_id, birthday, email, address, modified, version):
+        phones = [phone for (phone,) in self.db.execute(
+            'SELECT phone FROM phones WHERE record_id = ? ORDER BY position', (record_id,))]
+        record = self.record_cls(
+            name, phones[0] if phones else None, birthday, email, None, address)
+        for phone in phones[1:]:
+            record.add_phone(phone)
+        for (text,) in self.db.execute(
+                'SELECT text FROM notes WHERE record_id = ? ORDER BY position', (record_id,)):
+            record.add_note(text)
+        record.modified = modified
+        record.version = version
+        record.book = self.book
+        return record
+
+    def put(self, record, base=None):  # insert or rewrite all rows of the record
+        # with base only the row of that version is rewritten, False if it was changed by another process
+        name = record.name.value
+        birthday = record.birthday.value
+        values = (birthday.isoformat() if birthday else None, birthday.strftime('%m-%d') if birthday else None,
+                  record.email.value, record.address.value, record.modified, record.version)
+        if base is None:
+            self.db.execute(
+                'INSERT INTO records (birthday, birthday_md, email, address, modified, version, name) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT(name) DO UPDATE SET birthday = excluded.birthday, birthday_md = excluded.birthday_md, '
+                'email = excluded.email, address = excluded.address, modified = excluded.modified, '
+                'version = excluded.version', (*values, name))
+        elif not self.db.execute(
+                'UPDATE records SET birthday = ?, birthday_md = ?, email = ?, address = ?, modified = ?, version = ? '
+                'WHERE name = ? AND version = ?', (*values, name, base)).rowcount:
+            return False
+        record_id = self.db.execute(
+            'SELECT id FROM records WHERE name = ?', (name,)).fetchone()[0]
+        self.db.execute('DELETE FROM phones WHERE record_id = ?', (record_id,))
+        self.db.execute('DELETE FROM notes WHERE record_id = ?', (record_id,))
+        self.db.executemany('INSERT INTO phones (record_id, position, phone) VALUES (?, ?, ?)',
+                            ((record_id, i, phone.value) for i, phone in enumerate(record.phones)))
+        for i, note in enumerate(record.notes):
+            note_id = self.db.execute('INSERT INTO notes (record_id, position, text) VALUES (?, ?, ?)',
+                                      (record_id, i, note.value)).lastrowid
+            self.db.executemany('INSERT INTO tags (note_id, record_id, tag) VALUES (?, ?, ?)',
+                                ((note_id, record_id, tag) for tag in set(note.tags)))
+        self.loaded[name] = record
+        return True
+
+# Journal protocol: changes of loaded records are written through
+    def append(self, entry):
+        op, name, args, base, modified = entry
+        record = self.loaded.get(name)
+        if op not in ('add', 'add_records', 'delete') and record is not None:
+            while not self.put(record, base):  # changed by another process, apply the change to its row
+                current = self.read(name)
+                if current is None:  # deleted by another process
+                    self.loaded.pop(name, None)
+                    break
+                current.book = None  # the change applied again is not journaled
+                getattr(current, op)(*args)
+                current.modified = modified
+                for slot in record.STATE + ('version',):  # the caller keeps its record object
+                    setattr(record, slot, getattr(current, slot))
+                base = record.version - 1
+                self.book.conflicts.add(name)
+        if op != 'add_records':  # bulk add is committed at save
+            self.db.commit()
+
+    def flush(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+# Indexed lookups
+    def names(self, query, params):
+        return [self[name] for (name,) in self.db.execute(query, params).fetchall()]
+
+    def search(self, query):  # same matching rules as AddressBook.search
+        query = query.lower()
+        return self.names(
+            'SELECT name FROM records r WHERE instr(lower(r.name), :q) '
+            'OR EXISTS (SELECT 1 FROM phones p WHERE p.record_id = r.id AND instr(p.phone, :q)) '
+            'OR EXISTS (SELECT 1 FROM notes n WHERE n.record_id = r.id AND instr(pylower(n.text), :q)) '
+            'ORDER BY r.id', {'q': query})
+
+    def find_by_phone(self, phone):
+        return self.names('SELECT DISTINCT r.name FROM records r JOIN phones p ON p.record_id = r.id '
+                          'WHERE p.phone = ? ORDER BY r.id', (phone,))
+
+    def find_by_email(self, email):
+        return self.names('SELECT name FROM records WHERE email = ? ORDER BY id', (email,))
+
+    def find_tags(self, tags, match_all=False):
+        tags = list(set(tags))
+        if not tags:
+            return []
+        marks = ', '.join('?' * len(tags))
+        rows = self.db.execute(
+            f'SELECT r.name, n.position FROM notes n JOIN records r ON r.id = n.record_id '
+            f'WHERE n.id IN (SELECT note_id FROM tags WHERE tag IN ({marks}) GROUP BY note_id '
+            f'HAVING COUNT(DISTINCT tag) >= ?) ORDER BY r.name, n.position',
+            (*tags, len(tags) if match_all else 1)).fetchall()
+        pairs = []
+        for name, position in rows:
+            record = self[name]
+            pairs.append((record, record.notes[position]))
+        return pairs
+
+    def tag_counts(self):
+        return dict(self.db.execute('SELECT tag, COUNT(DISTINCT note_id) FROM tags GROUP BY tag'))
+
+    def page(self, sort, after, size, skip=0):  # keyset page, cursors are AddressBook.sort_key values
+        # every page is an index range scan after the cursor; skip (a jump to a page) is
+        # turned into a cursor once, the pages after it are read from that cursor
+        if sort is None:  # cursor is a position, the id the last page ended at stands for it
+            position = (after or 0) + skip
+            if not position:
+                last = 0
+            elif self.end is not None and self.end[0] == position:
+                last = self.end[1]
+            else:
+                row = self.db.execute('SELECT id FROM records ORDER BY id LIMIT 1 OFFSET ?', (position - 1,)).fetchone()
+                if row is None:
+                    return []
+                last = row[0]
+            rows = self.db.execute('SELECT id, name FROM records WHERE id > ? ORDER BY id LIMIT ?',
+                                   (last, size)).fetchall()
+            if rows:
+                self.end = (position + len(rows), rows[-1][0])
+            return [self[name] for record_id, name in rows]
+        if sort not in ORDERS:
+            raise ValueError(f'Unknown sort key {sort}')
+        if sort == 'name':
+            after = (after or '',)
+        elif sort == 'birthday':
+            month, day, name = after or (0, 0, '')
+            after = (f'{month:02d}-{day:02d}', name)
+        else:
+            after = after or (float('-inf'), '')
+        columns = ORDERS[sort]
+        order = ', '.join(columns)
+        if len(columns) == 1:
+            where, values = f'{columns[0]} > ?', lambda after: after
+        else:  # the first column bounds the range, a row value alone is not searched in an expression index
+            where = f'{columns[0]} >= ? AND ({order}) > (?, ?)'
+            values = lambda after: (after[0], *after)  # noqa: E731
+        if skip:
+            after = self.db.execute(f'SELECT {order} FROM records WHERE {where} ORDER BY {order} '
+                                    f'LIMIT 1 OFFSET ?', (*values(after), skip - 1)).fetchone()
+            if after is None:
+                return []
+        return self.names(f'SELECT name FROM records WHERE {where} ORDER BY {order} LIMIT ?',
+                          (*values(after), size))
+
+    def born_between(self, windows):  # records with birthday inside (month, day) ranges
+        records = []
+        for (start_month, start_day), (end_month, end_day) in windows:
+            records.extend(self.names('SELECT name FROM records WHERE birthday_md BETWEEN ? AND ? ORDER BY birthday_md',
+                                      (f'{start_month:02d}-{start_day:02d}', f'{end_month:02d}-{end_day:02d}')))
+        return records
+
+    def born_on(self, month, day):
+        return self.names('SELECT name FROM records WHERE birthday_md = ? ORDER BY id',
+                          (f'{month:02d}-{day:02d}',))
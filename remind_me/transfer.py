@@ -0,0 +1,96 @@
+from stat import S_ISLNK, S_ISREG
+import errno
+import os
+import shutil
+try:
+    from . import metrics
+except ImportError:  # started as a script: python main.py
+    import metrics
+
+# Moves of the cleaner between file systems. Rename fails with EXDEV when e.g. a category
+# folder is a mount of its own; then the file is copied by the kernel (no copy through
+# Python buffers) into a hidden file next to the destination, synced and renamed into
+# place, and only then the source is removed. The mover runs moves in a pool of threads,
+# so big files are copied in parallel.
+
+COPY_CHUNK = 1024 ** 3  # bytes asked from the kernel per call
+NO_KERNEL_COPY = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EPERM, errno.EBADF}
+SYNC_FOLDERS = os.name == 'posix'  # folders cannot be opened for fsync on Windows
+
+
+def copy_data(source, destination, size):  # copy_file_range, else sendfile, else read and write
+    copied = 0
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while copied < size:
+                done = os.copy_file_range(source, destination, COPY_CHUNK, copied, copied)
+                if not done:
+                    break
+                copied += done
+            return
+        except OSError as e:  # older kernels copy only within one file system
+            if copied or e.errno not in NO_KERNEL_COPY:
+                raise
+    if hasattr(os, 'sendfile'):
+        try:
+            while copied < size:
+                done = os.sendfile(destination, source, copied, COPY_CHUNK)
+                if not done:
+                    break
+                copied += done
+            return
+        except OSError as e:
+            if copied or e.errno not in NO_KERNEL_COPY:
+                raise
+    os.lseek(source, 0, os.SEEK_SET)
+    os.lseek(destination, 0, os.SEEK_SET)
+    with open(source, 'rb', closefd=False) as reader, open(destination, 'wb', closefd=False) as writer:
+        shutil.copyfileobj(reader, writer, COPY_CHUNK // 1024)
+
+
+def copy_file(source, destination):  # contents, mode, times, extended attributes and owner if allowed
+    stat = os.lstat(source)
+    if S_ISLNK(stat.st_mode):
+        if os.path.lexists(destination):  # left by a stopped run
+            os.unlink(destination)
+        os.symlink(os.readlink(source), destination)
+        return
+    if not S_ISREG(stat.st_mode):
+        raise OSError(errno.EXDEV, 'cannot move a special file between file systems', source)
+    with open(source, 'rb') as reader, open(destination, 'wb') as writer:
+        copy_data(reader.fileno(), writer.fileno(), stat.st_size)
+        if hasattr(os, 'chown'):  # POSIX only
+            try:
+                os.chown(writer.fileno(), stat.st_uid, stat.st_gid)
+            except OSError:  # only root may give files away
+                pass
+        shutil.copystat(source, destination)  # after chown, which clears setuid bits
+        os.fsync(writer.fileno())
+
+
+def move_file(source, destination):  # os.replace which also works between file systems
+    try:
+        os.replace(source, destination)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    folder, name = os.path.split(destination)
+    temporary = os.path.join(folder, f'.{name}.part')  # same name on a retry, so no leftovers pile up
+    try:
+        copy_file(source, temporary)
+        os.replace(temporary, destination)
+    except BaseException:
+        try:
+            os.unlink(temporary)
+        except OSError:
+            pass
+        raise
+    if SYNC_FOLDERS:
+        descriptor = os.open(folder, os.O_RDONLY)
+        try:  # the new name is on disk before the old one goes
+            os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
+    os.unlink(source)
+    metrics.count('clean.copied_between_devices')
@@ -0,0 +1,281 @@
+from collections import deque
+from stat import S_ISDIR
+import ctypes
+import os
+import select
+import struct
+import time
+try:
+    from . import cleaner, metrics
+    from .manifest import mtime
+except ImportError:  # started as a script: python main.py
+    import cleaner
+    import metrics
+    from manifest import mtime
+
+# Watch mode of the folder sorter: files are sorted as they arrive.
+# Changes come from Linux inotify, elsewhere (or when it runs out of watches) from
+# polling folder mtimes. A file is sorted when its size and mtime did not change for
+# SETTLE seconds and no event came for it meanwhile, so files still being written
+# stay where they are. Files ready at one tick are sorted as one batch.
+# What the watcher does is given to callback(event) as cleaner.Event:
+#   move     path -> target, detail: the extension
+#   unpack   path (archive) -> target (folder), detail: where the archive went
+#   error    path, target or None, detail: what failed
+#   polling  path: the folder inotify could not watch, detail: why; polling is used from now on
+
+SETTLE = 0.5  # seconds a file has to stay unchanged
+TICK = 0.1  # seconds events are collected before pending files are checked
+POLL = 1.0  # seconds between two polls of folder mtimes
+
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ONLYDIR = 0x1000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_ONLYDIR
+EVENT = struct.Struct('iIII')  # wd, mask, cookie, length of the name after it
+
+# Class for changes from the kernel, one watch per folder
+
+
+class Inotify:
+    def __init__(self):
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        if not hasattr(self.libc, 'inotify_init1'):
+            raise OSError('inotify is not available')
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.folders = {}  # watch descriptor -> folder
+
+    def add(self, folder):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(folder), MASK)
+        if wd < 0:  # ENOSPC when fs.inotify.max_user_watches is reached
+            raise OSError(ctypes.get_errno(), f'inotify_add_watch failed for {folder}')
+        self.folders[wd] = folder
+
+    def changes(self, timeout):  # [(path, is folder)] of events within timeout
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self.fd, 1024 * 1024)
+        except BlockingIOError:
+            return []
+        changes = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT.unpack_from(data, offset)
+            name = data[offset + EVENT.size:offset + EVENT.size + length].rstrip(b'\0')
+            offset += EVENT.size + length
+            if mask & IN_Q_OVERFLOW:  # events were lost, everything is walked again
+                changes.extend((folder, True) for folder in list(self.folders.values()))
+            elif mask & IN_IGNORED:  # folder was removed or moved away
+                self.folders.pop(wd, None)
+            elif wd in self.folders and name:
+                changes.append((os.path.join(self.folders[wd], os.fsdecode(name)), bool(mask & IN_ISDIR)))
+        return changes
+
+    def close(self):
+        os.close(self.fd)
+
+# Class for changes found by polling, only folders whose mtime changed are listed
+
+
+class Poller:
+    def __init__(self, interval=POLL):
+        self.interval = interval
+        self.mtimes = {}  # folder -> mtime when it was listed
+        self.polled = time.monotonic()
+
+    def add(self, folder):  # its files were already reported
+        self.mtimes[folder] = mtime(folder)
+
+    def changes(self, timeout):
+        wait = self.polled + self.interval - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(wait, 0))
+        self.polled = time.monotonic()
+        changes = []
+        for folder, known in list(self.mtimes.items()):
+            current = mtime(folder)
+            if current is None:
+                del self.mtimes[folder]
+            elif current != known:
+                self.mtimes[folder] = current
+                try:
+                    with os.scandir(folder) as entries:
+                        for entry in entries:
+                            if not entry.is_dir(follow_symlinks=False):
+                                changes.append((entry.path, False))
+                            elif entry.path not in self.mtimes:
+                                changes.append((entry.path, True))
+                except OSError:
+                    continue
+        return changes
+
+    def close(self):
+        pass
+
+# Class for the watch loop
+
+
+class Watcher:
+    def __init__(self, root, workers=None, archive_workers=None, max_unpacked=cleaner.MAX_UNPACKED,
+                 archive_timeout=cleaner.ARCHIVE_TIMEOUT, settle=SETTLE, polling=False, callback=None):
+        self.root = os.fspath(root)
+        self.callback = callback or (lambda event: None)
+        self.settle = settle
+        self.archive_workers = archive_workers
+        self.max_unpacked = max_unpacked
+        self.archive_timeout = archive_timeout
+        self.source = None
+        if not polling:
+            try:
+                self.source = Inotify()
+            except (OSError, TypeError):  # not Linux
+                pass
+        if self.source is None:
+            self.source = Poller()
+        self.pending = {}  # path -> [(size, mtime) when last checked, time of the last change, first seen]
+        self.due = deque()  # (time of the change, path) in order of changes
+        self.mover = cleaner.Mover(workers)
+        self.archive_mover = cleaner.Mover(1)
+        self.mtimes = {}  # target folder -> mtime after the last batch, names are listed again if it changed
+        self.sorted = 0
+
+    def add(self, folder):  # watch the folder and its subfolders, files in them become pending -> Events
+        stack = [folder]
+        while stack:
+            folder = stack.pop()
+            try:
+                self.source.add(folder)  # before listing, so files created meanwhile are not missed
+            except OSError as e:
+                if isinstance(self.source, Poller):
+                    raise
+                yield cleaner.Event('polling', folder, None, str(e))
+                self.source.close()
+                self.source = Poller()
+                stack = [self.root]
+                continue
+            try:
+                with os.scandir(folder) as entries:
+                    for entry in entries:
+                        if not entry.is_dir(follow_symlinks=False):
+                            self.seen(entry.path)
+                        elif entry.name not in cleaner.SKIPPED:
+                            stack.append(entry.path)
+            except OSError:  # removed meanwhile
+                continue
+
+    def seen(self, path):  # the file was created or changed
+        now = time.monotonic()
+        try:
+            stat = os.lstat(path)
+        except OSError:
+            self.pending.pop(path, None)
+            return
+        signature = (stat.st_size, stat.st_mtime_ns)
+        item = self.pending.get(path)
+        if item is None:
+            self.pending[path] = [signature, now, now]
+        elif item[0] != signature:
+            item[0] = signature
+            item[1] = now
+        else:  # e.g. listed again by the poller, the file itself did not change
+            return
+        self.due.append((now, path))
+
+    def ready(self):  # pending files which did not change for settle seconds
+        now = time.monotonic()
+        ready = []
+        while self.due and now - self.due[0][0] >= self.settle:
+            changed, path = self.due.popleft()
+            item = self.pending.get(path)
+            if item is None or item[1] != changed:  # changed again later, its newer entry decides
+                continue
+            try:
+                stat = os.lstat(path)
+            except OSError:
+                del self.pending[path]
+                continue
+            if S_ISDIR(stat.st_mode):
+                del self.pending[path]
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if signature == item[0]:
+                ready.append(path)
+            else:  # still being written without events, e.g. on a network mount
+                item[0] = signature
+                item[1] = now
+                self.due.append((now, path))
+        return ready
+
+    def sort(self, paths):  # -> Event per file
+        for mover in (self.mover, self.archive_mover):
+            for target in list(mover.taken):  # changed by somebody else since the last batch
+                if mtime(target) != self.mtimes.get(target):
+                    del mover.taken[target]
+        archives = []
+        for path in paths:
+            name = os.path.basename(path)
+            extension = cleaner.get_extension(name)
+            if extension in cleaner.ARCHIVES:
+                archives.append((path, extension))
+                continue
+            target = os.path.join(self.root, cleaner.TARGETS.get(extension, cleaner.NOT_DEFINED))
+            try:
+                destination = self.mover.move(path, target, cleaner.normalize(name))
+            except OSError as e:
+                yield cleaner.Event('error', path, None, f'move: {e.strerror or e}')
+                continue
+            yield cleaner.Event('move', path, destination, extension)
+        for error in self.mover.flush():
+            yield cleaner.Event('error', error.filename, error.filename2, f'move: {error.strerror or error}')
+        yield from cleaner.unpack(archives, self.root, self.archive_mover, self.archive_workers,
+                                  self.max_unpacked, self.archive_timeout)
+        self.mtimes = {target: mtime(target)
+                       for mover in (self.mover, self.archive_mover) for target in mover.taken}
+        now = time.monotonic()
+        for path in paths:  # latency from the first event of the file to its move
+            first_seen = self.pending.pop(path)[2]
+            if metrics.enabled:
+                metrics.record('watch.latency', now - first_seen)
+        self.sorted += len(paths)
+        metrics.count('watch.files', len(paths))
+
+    def run(self, stop=None):  # until stop is set or Ctrl+C
+        try:
+            for event in self.add(self.root):
+                self.callback(event)
+            while stop is None or not stop.is_set():
+                for path, folder in self.source.changes(TICK):
+                    if not folder:
+                        self.seen(path)
+                    elif os.path.basename(path) not in cleaner.SKIPPED:
+                        for event in self.add(path):
+                            self.callback(event)
+                ready = self.ready()
+                if ready:
+                    with metrics.timer('watch.batch'):
+                        for event in self.sort(ready):
+                            self.callback(event)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.source.close()
+            self.mover.close()
+        return self.sorted
+
+
+def watch(folder, workers=None, archive_workers=None, max_unpacked=cleaner.MAX_UNPACKED,
+          archive_timeout=cleaner.ARCHIVE_TIMEOUT, settle=SETTLE, polling=False, callback=None):  # -> files sorted
+    return Watcher(folder, workers, archive_workers, max_unpacked, archive_timeout, settle, polling,
+                   callback).run()
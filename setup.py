@@ -4,6 +4,6 @@ setup(name='remind_me',
     version='1.0.0',
     description='contact_assistant, sort_direcrory_function',
     author='Svitlana Shulha, Roman Gryshko, Oksana Horishna',
-    packages=find_namespace_packages(),
+    packages=find_namespace_packages(include=['remind_me', 'remind_me.*']),
     entry_points={'console_scripts': ['contact=remind_me.main:run']}
     ) 
@@ -0,0 +1,67 @@
+import io
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+from remind_me import batch
+from remind_me.main import AddressBook, Record
+
+ROOT = Path(__file__).resolve().parent.parent
+
+COMMANDS = [
+    {'op': 'add', 'name': 'Alice', 'phone': '0501234567', 'email': 'alice@mail.com', 'note': 'call #work'},
+    {'op': 'add-phone', 'name': 'Alice', 'phone': '0671112233'},
+    {'op': 'add-phone', 'name': 'Bob', 'phone': '0671112233'},
+    {'op': 'edit-email', 'name': 'Alice', 'email': 'not an email'},
+    {'op': 'add-note', 'name': 'Alice'},
+    {'op': 'fly', 'name': 'Alice'},
+    {'op': 'find', 'query': 'ali'},
+]
+
+
+def lines(commands):
+    return [json.dumps(command) + '\n' for command in commands]
+
+
+def test_results_and_errors_per_line():
+    book = AddressBook()
+    out = io.StringIO()
+    saves = []
+    done, failed = batch.run(book, Record, lines(COMMANDS) + ['\n', 'not json\n', '[1, 2]\n'], out, checkpoint=3,
+                             save=lambda: saves.append(len(book.data)))
+    assert (done, failed) == (3, 6)
+    results = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [result['line'] for result in results] == [1, 2, 3, 4, 5, 6, 7, 9, 10]  # the empty line gets no result
+    assert [result['ok'] for result in results] == [True, True, False, False, False, False, True, False, False]
+    assert results[0] == {'line': 1, 'op': 'add', 'result': 'Alice', 'ok': True}
+    assert results[1]['result'] == ['0501234567', '0671112233']
+    assert results[2]['error'] == "Contact 'Bob' not found."
+    assert results[3]['error'] == 'Email is not valid'
+    assert results[4]['error'] == 'Missing argument note'
+    assert results[5]['error'].startswith('Unknown op fly')
+    assert results[6]['result'] == ['Alice']
+    assert 'op' not in results[7] and results[7]['error']
+    assert len(saves) == 4  # every 3 commands and at the end
+    assert book.data['Alice'].email.value == 'alice@mail.com'
+
+
+def batch_command(book, commands, *args):
+    return subprocess.run([sys.executable, '-m', 'remind_me.main', '--book', str(book), 'batch', *args], cwd=ROOT,
+                          input=''.join(lines(commands)), capture_output=True, text=True, timeout=60)
+
+
+def test_command_exit_code_and_saved_book(tmp_path):
+    book = tmp_path / 'contacts.pkl'
+    result = batch_command(book, COMMANDS[:2])
+    assert result.returncode == 0
+    assert [json.loads(line)['ok'] for line in result.stdout.splitlines()] == [True, True]
+    assert result.stderr == '2 commands done, 0 failed\n'
+    results = tmp_path / 'results.jsonl'
+    result = batch_command(book, COMMANDS[2:], '--results', str(results))
+    assert result.returncode == 1
+    assert result.stdout == '' and result.stderr == '1 commands done, 4 failed\n'
+    assert len(results.read_text(encoding='utf-8').splitlines()) == 5
+    loaded = AddressBook()
+    loaded.restore_from_file(str(book))
+    assert [phone.value for phone in loaded.data['Alice'].phones] == ['0501234567', '0671112233']
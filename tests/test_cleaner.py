@@ -0,0 +1,208 @@
+import io
+import os
+import tarfile
+import time
+import zipfile
+
+import pytest
+
+from remind_me import cleaner
+
+
+def make_tree(root, files):
+    for path in files:
+        path = root / path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(path.name.encode())
+
+
+def tree(root):
+    return sorted(str(path.relative_to(root)) for path in root.rglob('*') if path.is_file())
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_failed_move_is_retried_by_next_run(tmp_path, monkeypatch, workers):
+    root = tmp_path / 'root'
+    make_tree(root, ['src/sub/a.jpg', 'src/b.txt'])
+    manifest = str(tmp_path / 'manifest.pkl')
+    move_file = cleaner.move_file
+
+    def failing(source, destination):
+        if source.endswith('a.jpg'):
+            raise OSError(13, 'Permission denied', source, destination)
+        move_file(source, destination)
+
+    monkeypatch.setattr(cleaner, 'move_file', failing)
+    summary = cleaner.clean(str(root), workers=workers, manifest=manifest)
+    assert summary['errors'] >= 1
+    assert 'src/sub/a.jpg' in tree(root)
+    monkeypatch.setattr(cleaner, 'move_file', move_file)
+    skipped = []
+    summary = cleaner.clean(str(root), workers=workers, manifest=manifest,
+                            callback=lambda event: event.kind == 'skip' and skipped.append(event.path))
+    assert summary['errors'] == 0
+    assert tree(root) == sorted(['images/JPG/a.jpg', 'documents/TXT/b.txt'])
+    assert skipped == []
+    cleaner.clean(str(root), workers=workers, manifest=manifest,
+                  callback=lambda event: event.kind == 'skip' and skipped.append(event.path))
+    assert str(root) in skipped  # nothing failed, the manifest trusts the folders again
+
+
+def test_undo_restores_sorted_folder(tmp_path):
+    root = tmp_path / 'root'
+    files = ['src/a.jpg', 'src/deep/b.txt', 'c.mp3']
+    make_tree(root, files)
+    journal = str(tmp_path / 'moves')
+    cleaner.clean(str(root), journal=journal)
+    assert tree(root) != sorted(files)
+    undone, failed = cleaner.undo(str(root), journal)
+    assert failed == []
+    assert undone >= len(files)
+    assert tree(root) == sorted(files)
+    assert not os.path.exists(journal)
+
+
+def test_undo_returns_what_it_could_not_undo(tmp_path, capsys):
+    root = tmp_path / 'root'
+    make_tree(root, ['src/a.jpg', 'src/b.txt'])
+    journal = str(tmp_path / 'moves')
+    cleaner.clean(str(root), journal=journal)
+    make_tree(root, ['src/a.jpg'])  # the old name is taken again
+    undone, failed = cleaner.undo(str(root), journal)
+    assert len(failed) == 1 and failed[0].startswith('Cannot move back')
+    assert 'src/b.txt' in tree(root)
+    assert capsys.readouterr().out == ''
+    os.remove(root / 'src/a.jpg')  # the journal kept the move which failed
+    assert cleaner.undo(str(root), journal) == (1, [])
+    assert tree(root) == ['src/a.jpg', 'src/b.txt']
+    assert not os.path.exists(journal)
+
+
+def test_interrupted_run_is_finished_first(tmp_path):
+    root = tmp_path / 'root'
+    make_tree(root, ['src/a.jpg', 'src/b.txt'])
+    journal = str(tmp_path / 'moves')
+    log = cleaner.MoveLog(str(root), journal)
+    log.write(('move', [(str(root / 'src/a.jpg'), str(root / 'images/JPG/a.jpg'))]))
+    log.close(finished=False)  # stopped before the move was done
+    events = []
+    cleaner.clean(str(root), journal=journal, callback=events.append)
+    assert events[0].kind == 'resume'
+    assert tree(root) == sorted(['images/JPG/a.jpg', 'documents/TXT/b.txt'])
+    undone, failed = cleaner.undo(str(root), journal)  # the resumed run is undone as a whole
+    assert failed == []
+    assert tree(root) == sorted(['src/a.jpg', 'src/b.txt'])
+
+
+def make_zip(path, files):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with zipfile.ZipFile(path, 'w') as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+
+
+def unpack_errors(root, **options):
+    events = []
+    summary = cleaner.clean(str(root), callback=events.append, **options)
+    return summary, [event.detail for event in events if event.kind == 'error']
+
+
+def test_archive_over_the_size_limit_is_not_unpacked(tmp_path):
+    root = tmp_path / 'root'
+    make_zip(root / 'big.zip', {'a.txt': b'a' * 600, 'b.txt': b'b' * 600})
+    make_zip(root / 'small.zip', {'a.txt': b'a' * 600})
+    summary, errors = unpack_errors(root, max_unpacked=1000, archive_workers=1)
+    assert errors == ['unpack: unpacks to more than 1000 bytes']
+    assert summary['archives'] == 2 and summary['errors'] == 1
+    assert tree(root) == ['archives/ZIP/big.zip', 'archives/ZIP/small.zip', 'archives/ZIP/small/a.txt']
+
+
+def test_archive_taking_too_long_is_stopped(tmp_path, monkeypatch):
+    root = tmp_path / 'root'
+    make_zip(root / 'slow.zip', {'a.txt': b'a'})
+    monkeypatch.setattr(zipfile.ZipFile, 'extract', lambda *args: time.sleep(5))
+    start = time.monotonic()
+    summary, errors = unpack_errors(root, archive_timeout=0.2, archive_workers=1)
+    assert time.monotonic() - start < 4
+    assert errors == ['unpack: unpacking took too long']
+    assert tree(root) == ['archives/ZIP/slow.zip']
+
+
+@pytest.mark.skipif(not cleaner.TAR_FILTER, reason='tarfile without extraction filters')
+@pytest.mark.parametrize('name, kind', [('../evil.txt', tarfile.REGTYPE), ('link', tarfile.SYMTYPE)])
+def test_tar_members_outside_the_folder_are_refused(tmp_path, name, kind):
+    root = tmp_path / 'root' / 'inner'
+    root.mkdir(parents=True)
+    with tarfile.open(root / 'bad.tar', 'w') as archive:
+        member = tarfile.TarInfo(name)
+        member.type = kind
+        if kind == tarfile.SYMTYPE:
+            member.linkname = '../../../evil.txt'
+            archive.addfile(member)
+        else:
+            member.size = 4
+            archive.addfile(member, io.BytesIO(b'evil'))
+    summary, errors = unpack_errors(root, archive_workers=1)
+    assert len(errors) == 1 and errors[0].startswith('unpack: ')
+    assert tree(tmp_path) == ['root/inner/archives/TAR/bad.tar']
+
+
+@pytest.mark.skipif(not cleaner.TAR_FILTER, reason='tarfile without extraction filters')
+def test_absolute_tar_member_stays_in_the_folder(tmp_path):
+    root = tmp_path / 'root'
+    root.mkdir()
+    with tarfile.open(root / 'abs.tar', 'w') as archive:
+        member = tarfile.TarInfo(str(tmp_path / 'evil.txt'))
+        member.size = 4
+        archive.addfile(member, io.BytesIO(b'evil'))
+    summary, errors = unpack_errors(root, archive_workers=1)
+    assert errors == []
+    assert not (tmp_path / 'evil.txt').exists()
+    assert tree(root) == ['archives/TAR/abs.tar', f'archives/TAR/abs/{str(tmp_path / "evil.txt").lstrip("/")}']
+
+
+def test_broken_archives_are_kept(tmp_path):
+    root = tmp_path / 'root'
+    root.mkdir()
+    (root / 'broken.zip').write_bytes(b'not a zip')
+    (root / 'broken.tar').write_bytes(b'not a tar either')
+    make_zip(root / 'good.zip', {'a.txt': b'a'})
+    summary, errors = unpack_errors(root, archive_workers=2)
+    assert summary['errors'] == 2 and all(error.startswith('unpack: ') for error in errors)
+    assert tree(root) == ['archives/TAR/broken.tar', 'archives/ZIP/broken.zip', 'archives/ZIP/good.zip',
+                          'archives/ZIP/good/a.txt']
+
+
+def make_copies(root):
+    large = os.urandom(3 * cleaner.BLOCK)
+    root.mkdir()
+    (root / 'old.txt').write_bytes(b'same text')
+    cleaner.clean(str(root))  # sorted by an earlier run
+    files = {'src/a/new.txt': b'same text', 'src/b/new.txt': b'same text', 'src/other.txt': b'else text',
+             'src/large.pdf': large, 'src/large_copy.pdf': large,
+             'src/large_changed.pdf': large[:cleaner.BLOCK] + b'x' * cleaner.BLOCK + large[2 * cleaner.BLOCK:]}
+    for path, data in files.items():
+        (root / path).parent.mkdir(parents=True, exist_ok=True)
+        (root / path).write_bytes(data)
+
+
+@pytest.mark.parametrize('link', [False, True])
+def test_duplicates_are_removed_or_linked(tmp_path, link):
+    root = tmp_path / 'root'
+    make_copies(root)
+    events = []
+    summary = cleaner.clean(str(root), dedup='link' if link else 'delete', callback=events.append)
+    duplicates = sorted((os.path.relpath(event.path, root), os.path.relpath(event.target, root))
+                        for event in events if event.kind == 'duplicate')
+    assert summary['duplicates'] == 3
+    assert duplicates == [('documents/PDF/large_copy.pdf', 'documents/PDF/large.pdf'),
+                          ('documents/TXT/new.txt', 'documents/TXT/old.txt'),  # sorted before, it is kept
+                          ('documents/TXT/new_1.txt', 'documents/TXT/old.txt')]
+    txt = root / 'documents' / 'TXT'
+    if link:
+        assert len(tree(root)) == 7
+        assert os.path.samefile(txt / 'old.txt', txt / 'new_1.txt')
+        assert os.stat(txt / 'old.txt').st_nlink == 3
+    else:
+        assert tree(root) == ['documents/PDF/large.pdf', 'documents/PDF/large_changed.pdf',
+                              'documents/TXT/old.txt', 'documents/TXT/other.txt']
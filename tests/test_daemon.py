@@ -0,0 +1,144 @@
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from remind_me import daemon
+from remind_me.main import AddressBook, Record
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def add(name):
+    return {'op': 'add', 'name': name, 'email': f'{name.lower()}@mail.com'}
+
+
+async def exchange(path, frames):  # raw frames pipelined, then every answer frame read
+    reader, writer = await asyncio.open_unix_connection(path)
+    for frame in frames:
+        writer.write(frame)
+    await writer.drain()
+    writer.write_eof()
+    answers = []
+    while True:
+        try:
+            header = await reader.readexactly(daemon.HEADER.size)
+        except asyncio.IncompleteReadError:
+            break
+        size, = daemon.HEADER.unpack(header)
+        answers.append(json.loads(await reader.readexactly(size)))
+    writer.close()
+    return answers
+
+
+def serve_in_process(path, frames):  # -> (answers, number of saves)
+    saves = []
+    book = AddressBook()
+    server = daemon.Daemon(book, Record, lambda: saves.append(len(book.data)))
+
+    async def run():
+        async with await asyncio.start_unix_server(server.serve_client, path):
+            return await exchange(path, frames)
+
+    return asyncio.run(run()), saves
+
+
+def test_framing_and_order(tmp_path):
+    frames = [daemon.encode(add('Alice')), daemon.encode(['not', 'an', 'object']), daemon.encode(add('Alice')),
+              daemon.encode({'op': 'get', 'name': 'Alice'}), daemon.encode({'op': 'get', 'name': 'Bob'})]
+    answers, saves = serve_in_process(str(tmp_path / 's.sock'), frames)
+    assert [answer['ok'] for answer in answers] == [True, False, False, True, False]
+    assert answers[0]['result'] == 'Alice'
+    assert 'already exists' in answers[2]['error']
+    assert answers[3]['result']['email'] == 'alice@mail.com'
+    assert answers[4]['error'] == "Contact 'Bob' not found."
+
+
+def test_changes_share_flushes(tmp_path):
+    frames = [daemon.encode(add(f'Name{chr(97 + i // 26)}{chr(97 + i % 26)}')) for i in range(200)]
+    answers, saves = serve_in_process(str(tmp_path / 's.sock'), frames)
+    assert all(answer['ok'] for answer in answers)
+    assert 1 <= len(saves) < 10  # pipelined changes wait for one flush together
+    assert saves[-1] == 200  # the last answer came after all changes were saved
+
+
+def test_export_in_frames(tmp_path, monkeypatch):
+    monkeypatch.setattr('remind_me.exporter.CHUNK_SIZE', 2)
+    frames = [daemon.encode(add(name)) for name in ('Alice', 'Bob', 'Carol', 'Dave', 'Eve')]
+    frames += [daemon.encode({'op': 'export', 'format': 'jsonl', 'fields': ['name']}),
+               daemon.encode({'op': 'export', 'format': 'xml'})]
+    answers, saves = serve_in_process(str(tmp_path / 's.sock'), frames)
+    chunks = [answer['chunk'] for answer in answers[5:-2]]
+    assert len(chunks) == 3
+    assert [json.loads(line)['name'] for line in ''.join(chunks).splitlines()] == ['Alice', 'Bob', 'Carol', 'Dave',
+                                                                                  'Eve']
+    assert answers[-2] == {'ok': True, 'result': None}
+    assert answers[-1]['ok'] is False and 'Unknown format' in answers[-1]['error']
+
+
+def contact(book, *args, stdin=None, check=True):  # the contact command in its own process
+    return subprocess.run([sys.executable, '-m', 'remind_me.main', '--book', str(book), *args], cwd=ROOT,
+                          input=stdin, capture_output=True, text=True, timeout=60, check=check)
+
+
+@pytest.fixture
+def served(tmp_path):
+    book = tmp_path / 'contacts.pkl'
+    seed = AddressBook()
+    seed.add_record(Record('Alice', '0501234567', '1990-01-02', 'alice@mail.com', 'call back #work'))
+    seed.save_to_file(str(book))
+    server = subprocess.Popen([sys.executable, '-m', 'remind_me.main', '--book', str(book), 'serve'], cwd=ROOT,
+                              stderr=subprocess.PIPE)
+    path = daemon.socket_path(book)
+    deadline = time.monotonic() + 30
+    while daemon.connect(path) is None:
+        assert server.poll() is None, server.stderr.read()
+        assert time.monotonic() < deadline, 'daemon did not start'
+        time.sleep(0.05)
+    yield book, server
+    if server.poll() is None:
+        server.send_signal(signal.SIGTERM)
+        server.wait(30)
+
+
+def load(book):
+    loaded = AddressBook()
+    loaded.restore_from_file(str(book))
+    return loaded
+
+
+def test_clients_go_through_daemon_and_changes_persist(served, tmp_path):
+    book, server = served
+    rows = tmp_path / 'people.csv'
+    rows.write_text('name,phone,email\nBob,0671112233,bob@mail.com\nBad1,123,bad\n', encoding='utf-8')
+    result = contact(book, 'import', str(rows))
+    assert 'imported 1 contacts' in result.stdout and 'rejected 1 rows' in result.stdout
+    menu = '\n'.join([
+        '1', 'Carol', 'Kyiv', '0931234567', 'carol@mail.com', '2000-05-06', 'met at work', 'work',  # add
+        '3', '2', 'Bob', 'bob@work.com', '5',  # edit email
+        '7', '1', 'Alice', 'buy flowers', 'home', '9',  # add note
+        '5', 'Alise',  # find with a typo
+        '6', '400',  # birthdays
+        '9', ''])
+    result = contact(book, stdin=menu)
+    assert 'Contact added successfully' in result.stdout
+    assert 'did you mean' in result.stdout and 'Alice' in result.stdout
+    assert 'To Carols birthday' in result.stdout
+    export = tmp_path / 'out.jsonl'
+    contact(book, 'export', str(export), '--fields', 'name,email')
+    exported = {row['name']: row['email'] for row in map(json.loads, export.read_text(encoding='utf-8').splitlines())}
+    assert exported == {'Alice': 'alice@mail.com', 'Bob': 'bob@work.com', 'Carol': 'carol@mail.com'}
+    server.send_signal(signal.SIGTERM)  # the daemon saves and removes its socket
+    assert server.wait(30) == 0
+    assert not os.path.exists(daemon.socket_path(book))
+    loaded = load(book)
+    assert sorted(loaded.data) == ['Alice', 'Bob', 'Carol']
+    assert loaded.data['Bob'].email.value == 'bob@work.com'
+    assert [note.value for note in loaded.data['Alice'].notes] == ['call back #work', 'buy flowers #home']
+    assert loaded.data['Carol'].phones[0].value == '0931234567'
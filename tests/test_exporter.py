@@ -0,0 +1,99 @@
+import json
+import subprocess
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+
+import pytest
+
+from remind_me import exporter, importer
+from remind_me.main import AddressBook, Record
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def make_book():
+    soon = date.today() + timedelta(days=3)
+    book = AddressBook()
+    alice = Record('Alice', '0501234567', '1990-01-02', 'alice@mail.com', 'call back #work', 'Main st, 1; Kyiv')
+    alice.add_phone('0671112233')
+    alice.add_note('bring a\\b, c; d', 'home')
+    book.add_record(alice)
+    book.add_record(Record('Bob', None, f'1992-{soon.month:02d}-{soon.day:02d}', 'bob@mail.com', 'lunch #work'))
+    book.add_record(Record('Carol', '0931234567', None, 'carol@mail.com'))
+    return book
+
+
+def text(book, fmt, **options):
+    return ''.join(exporter.export(book, fmt, **options))
+
+
+def names(book, **options):
+    return [json.loads(line)['name'] for line in text(book, 'jsonl', fields=['name'], **options).splitlines()]
+
+
+def test_fields_are_projected_in_order():
+    rows = [json.loads(line) for line in text(make_book(), 'jsonl', fields=['email', 'name']).splitlines()]
+    assert [list(row) for row in rows] == [['email', 'name']] * 3
+    assert rows[0] == {'email': 'alice@mail.com', 'name': 'Alice'}
+    assert text(make_book(), 'csv', fields=['name', 'phones']).splitlines()[:2] == [
+        'name,phones', 'Alice,0501234567;0671112233']
+
+
+def test_filters():
+    book = make_book()
+    assert names(book) == ['Alice', 'Bob', 'Carol']
+    assert names(book, tag='work') == ['Alice', 'Bob']
+    assert names(book, tag='home') == ['Alice']
+    assert names(book, query='CAROL') == ['Carol']
+    assert names(book, days=7) == ['Bob']
+    assert names(book, tag='work', days=7) == ['Bob']
+    assert names(book, tag='work', query='alice') == ['Alice']
+
+
+def test_vcard_writer():
+    cards = text(make_book(), 'vcf')
+    assert cards.count('BEGIN:VCARD') == 3 and cards.endswith('END:VCARD\r\n')
+    assert 'TEL;TYPE=CELL:0671112233\r\n' in cards
+    assert 'ADR:;;Main st\\, 1\\; Kyiv;;;;\r\n' in cards
+    assert 'NOTE:call back #work\\nbring a\\\\b\\, c\\; d #home\r\n' in cards
+
+
+def test_chunks(monkeypatch):
+    monkeypatch.setattr(exporter, 'CHUNK_SIZE', 2)
+    for fmt in exporter.FORMATS:
+        chunks = [chunk for chunk in exporter.export(make_book(), fmt) if chunk]
+        assert len(chunks) == 2
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'vcf'])
+def test_round_trip_through_importer(tmp_path, fmt):
+    book = make_book()
+    path = tmp_path / f'contacts.{fmt}'
+    exporter.export_to_file(book, str(path), fmt)
+    imported = AddressBook()
+    assert importer.import_file(imported, Record, str(path)) == (3, 0, None)
+    assert text(imported, 'jsonl') == text(book, 'jsonl')
+
+
+def test_bad_format_or_fields():
+    with pytest.raises(ValueError, match='Unknown format xml'):
+        exporter.writer('xml')
+    with pytest.raises(ValueError, match='Unknown fields: age'):
+        exporter.writer('csv', ['name', 'age'])
+
+
+def test_command_rejects_bad_arguments(tmp_path):
+    book = tmp_path / 'contacts.pkl'
+    make_book().save_to_file(str(book))
+    for args in (['out.vcard'], ['out.csv', '--fields', 'name,age']):
+        result = subprocess.run([sys.executable, '-m', 'remind_me.main', '--book', str(book), 'export',
+                                 str(tmp_path / args[0]), *args[1:]], cwd=ROOT, capture_output=True, text=True,
+                                timeout=60)
+        assert result.returncode == 1
+        assert result.stderr.startswith('contact export: Unknown') and result.stderr.count('\n') == 1
+        assert not (tmp_path / args[0]).exists()
+    result = subprocess.run([sys.executable, '-m', 'remind_me.main', '--book', str(book), 'export', '-',
+                             '--format', 'jsonl', '--fields', 'name', '--tag', 'work'], cwd=ROOT,
+                            capture_output=True, text=True, timeout=60, check=True)
+    assert result.stdout.splitlines() == ['{"name": "Alice"}', '{"name": "Bob"}']
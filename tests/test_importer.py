@@ -0,0 +1,91 @@
+import csv
+
+from remind_me import importer
+from remind_me.main import AddressBook, Record
+
+ROWS = ('name,phone,birthday,email,address,note\n'
+        'Alice,+38 (050) 123-45-67; 0671112233,1990-01-02,alice@mail.com,Kyiv,"call back #work\nbuy cake"\n'
+        'Bob,123,1991-02-03,bob@mail.com,,\n'
+        'Carol,0931234567,not a date,carol@mail.com,,\n'
+        'Dave,,,dave@mail.com\n'
+        'Eve,0501234567,,no email,,\n')
+
+
+def rejects(path):
+    with open(path, newline='', encoding='utf-8', errors='surrogateescape') as file:
+        return {row['name']: row['reason'] for row in csv.DictReader(file)}
+
+
+def test_csv_rows_and_rejects(tmp_path):
+    rows = tmp_path / 'people.csv'
+    rows.write_text(ROWS, encoding='utf-8')
+    book = AddressBook()
+    imported, rejected, rejects_path = importer.import_file(book, Record, str(rows), chunk_size=2)
+    assert (imported, rejected) == (2, 3)
+    assert rejects_path == f'{rows}.rejects.csv'
+    assert rejects(rejects_path) == {'Bob': 'Phone is not valid', 'Carol': 'Date should be in the format YYYY-MM-DD',
+                                     'Eve': 'Email is not valid'}
+    alice = book.data['Alice']
+    assert [phone.value for phone in alice.phones] == ['0501234567', '0671112233']
+    assert [note.value for note in alice.notes] == ['call back #work', 'buy cake']
+    assert str(alice.birthday.value) == '1990-01-02' and alice.address.value == 'Kyiv'
+    assert book.data['Dave'].phones == [] and book.data['Dave'].birthday.value is None
+    assert [record for record, note in book.find_tags(['work'])] == [alice]
+
+
+def test_vcard_cards(tmp_path):
+    cards = tmp_path / 'people.vcf'
+    cards.write_text('BEGIN:VCARD\r\nVERSION:3.0\r\nFN:Alice\r\nTEL;TYPE=CELL:tel:+380501234567\r\n'
+                     'item1.EMAIL:alice@mail.com\r\nBDAY:19900102\r\nADR:;;Main st\\, 1;Kyiv;;;\r\n'
+                     'NOTE:first line\\nsecond \r\n line\r\nEND:VCARD\r\n'
+                     'BEGIN:VCARD\r\nFN:Bob\r\nEMAIL:bob\r\nEND:VCARD\r\n', encoding='utf-8')
+    book = AddressBook()
+    imported, rejected, rejects_path = importer.import_file(book, Record, str(cards))
+    assert (imported, rejected) == (1, 1)
+    assert rejects(rejects_path) == {'Bob': 'Email is not valid'}
+    alice = book.data['Alice']
+    assert [phone.value for phone in alice.phones] == ['0501234567']
+    assert str(alice.birthday.value) == '1990-01-02'
+    assert alice.address.value == 'Main st, 1, Kyiv'
+    assert [note.value for note in alice.notes] == ['first line', 'second line']
+
+
+def test_duplicates_are_merged(tmp_path):
+    filename = str(tmp_path / 'contacts.pkl')
+    book = AddressBook()
+    book.add_record(Record('Alice', '0501234567', None, 'alice@mail.com', 'call back'))
+    book.save_to_file(filename)
+    rows = tmp_path / 'people.csv'
+    rows.write_text('name,phone,birthday,email,address,note\n'
+                    'Alice,0671112233,1990-01-02,other@mail.com,Kyiv,call back\n'
+                    'Alice,0501234567; 0931234567,1980-05-06,alice@mail.com,Lviv,buy cake\n', encoding='utf-8')
+    assert importer.import_file(book, Record, str(rows)) == (2, 0, None)
+    book.save_to_file(filename)
+    loaded = AddressBook()
+    loaded.restore_from_file(filename)
+    for alice in (book.data['Alice'], loaded.data['Alice']):
+        assert [phone.value for phone in alice.phones] == ['0501234567', '0671112233', '0931234567']
+        assert [note.value for note in alice.notes] == ['call back', 'buy cake']
+        assert alice.email.value == 'alice@mail.com'  # filled fields are kept
+        assert str(alice.birthday.value) == '1990-01-02' and alice.address.value == 'Kyiv'
+    assert len(loaded.data) == 1
+
+
+def test_rows_which_are_not_utf8_are_rejected(tmp_path):
+    rows = tmp_path / 'people.csv'
+    rows.write_bytes(b'name,email,address\nAlice,alice@mail.com,Kyiv\n'
+                     b'Bob,bob@mail.com,K\xefev\nCarol,carol@mail.com,\n')
+    book = AddressBook()
+    imported, rejected, rejects_path = importer.import_file(book, Record, str(rows))
+    assert (imported, rejected) == (2, 1)
+    assert sorted(book.data) == ['Alice', 'Carol']
+    assert rejects(rejects_path) == {'Bob': 'Text is not UTF-8'}
+    assert b'K\xefev' in open(rejects_path, 'rb').read()  # the row is written as it was
+
+
+def test_process_pool_keeps_order(tmp_path):
+    rows = tmp_path / 'people.csv'
+    rows.write_text(ROWS, encoding='utf-8')
+    book = AddressBook()
+    assert importer.import_file(book, Record, str(rows), workers=2, chunk_size=1)[:2] == (2, 3)
+    assert list(book.data) == ['Alice', 'Dave']
@@ -0,0 +1,149 @@
+from datetime import date
+
+import pytest
+
+from remind_me import indexes
+from remind_me.main import AddressBook, Record
+import random
+
+
+def contact(name, phone=None, birthday=None, note=None):
+    return Record(name, phone, birthday, f'{name.split()[0].lower()}@mail.com', note)
+
+
+@pytest.fixture
+def book():
+    book = AddressBook()
+    book.add_record(contact('Anna Kovalenko', '0501234567', '1990-03-02', 'call about #work'))
+    book.add_record(contact('Bohdan Ivanenko', '0679876543', '1985-12-31'))
+    book.add_record(contact('Iryna Annenko', None, '2000-02-29', 'trip #home'))
+    return book
+
+
+def names(records):
+    return [record.name.value for record in records]
+
+
+def scanned(book, query):  # linear search, the reference for the index
+    query = query.lower()
+    return names(record for record in book.data.values() if book.matches(record, query))
+
+
+@pytest.mark.parametrize('query', ['ann', 'enko', '0501', '#work', 'trip', 'zzz', 'an'])
+def test_search_same_with_and_without_index(book, query):
+    book.reindex()
+    book.search_index.scans = 0
+    assert names(book.search(query)) == scanned(book, query)  # by scanning
+    book.search_index.scans = indexes.SCANS_BEFORE_BUILD
+    assert names(book.search(query)) == scanned(book, query)  # by the index
+    assert not book.search_index.stale
+
+
+def test_search_index_follows_changes(book):
+    book.search_index.scans = indexes.SCANS_BEFORE_BUILD
+    book.search('ann')
+    book.find('Anna Kovalenko').edit_note('call', 'meet Olena')
+    book.delete('Iryna Annenko')
+    book.add_record(contact('Olena Annivska', note='#work'))
+    assert names(book.search('ann')) == ['Anna Kovalenko', 'Olena Annivska']
+    assert names(book.search('call')) == []
+    assert names(book.search('olena')) == ['Anna Kovalenko', 'Olena Annivska']
+    book.add_record(contact('Iryna Annenko'))  # deleted and added again, now after the others
+    assert names(book.search('ann')) == ['Anna Kovalenko', 'Olena Annivska', 'Iryna Annenko']
+
+
+def tagged(pairs):
+    return [(record.name.value, note.value) for record, note in pairs]
+
+
+def test_tags_all_or_any(book):
+    book.find('Anna Kovalenko').add_note('urgent call', 'work')
+    book.find('Anna Kovalenko').add_tag('urgent', 'home')
+    assert tagged(book.find_tags(['work', 'home'], match_all=True)) == [('Anna Kovalenko', 'urgent call #work#home')]
+    assert tagged(book.find_tags(['work', 'home'])) == [('Anna Kovalenko', 'call about #work'),
+                                                         ('Anna Kovalenko', 'urgent call #work#home'),
+                                                         ('Iryna Annenko', 'trip #home')]
+    assert book.find_tags(['work', 'none'], match_all=True) == []
+    assert book.find_tags([]) == []
+    assert book.tag_counts() == {'work': 2, 'home': 2}
+
+
+def test_tags_follow_note_changes(book):
+    assert book.tag_counts() == {'work': 1, 'home': 1}
+    anna = book.find('Anna Kovalenko')
+    anna.edit_note('call', 'call later', 'family')
+    assert book.find_tags(['work']) == []
+    assert tagged(book.find_tags(['family'])) == [('Anna Kovalenko', 'call later #family')]
+    book.find('Iryna Annenko').remove_tag('trip', 'home')
+    anna.delete_note('call')
+    assert book.tag_counts() == {}
+    assert book.find_tags(['home', 'family', 'work']) == []
+
+
+def test_search_scans_before_building(book):
+    book.reindex()
+    for _ in range(indexes.SCANS_BEFORE_BUILD):
+        book.search('ann')
+    assert book.search_index.stale
+    book.search('ann')
+    assert not book.search_index.stale
+
+
+def test_built_indexes_match_updated_ones():
+    rnd = random.Random(3)
+    book = AddressBook()
+    book.add_records([contact(''.join(rnd.choice('abcdefgh') for _ in range(6)).capitalize() + f' {letter}',
+                              birthday=f'{rnd.randint(1950, 2010)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}')
+                      for letter in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ' * 20])
+    built = AddressBook()
+    built.data = book.data
+    built.reindex()
+    for index in (built.birthday_index, built.name_index, built.search_index, built.tag_index):
+        built.fresh(index)
+    updated = {'birthday': indexes.BirthdayIndex(), 'name': indexes.NameIndex()}
+    for record in book.data.values():
+        for index in updated.values():
+            index.update(record)
+    assert built.birthday_index.keys == updated['birthday'].keys
+    assert built.birthday_index.by_name == updated['birthday'].by_name
+    assert built.name_index.names == updated['name'].names == sorted(book.data)
+
+
+def test_birthdays_within(book):
+    book.reindex()
+    found = book.birthdays_within(3, date(2027, 2, 27))  # Feb 29 is celebrated on Mar 1 in common years
+    assert [(days, record.name.value) for days, record in found] == [(2, 'Iryna Annenko'), (3, 'Anna Kovalenko')]
+    found = book.birthdays_within(2, date(2026, 12, 30))
+    assert names(record for days, record in found) == ['Bohdan Ivanenko']
+
+
+def test_name_pages_sorted(book):
+    book.reindex()
+    book.add_record(contact('Andriy Bobo'))
+    pages = list(book.pages(2, sort='name'))
+    assert [names(page) for page in pages] == [['Andriy Bobo', 'Anna Kovalenko'], ['Bohdan Ivanenko', 'Iryna Annenko']]
+
+
+def test_fuzzy_two_edits():
+    index = indexes.FuzzyIndex()
+    index.add('Alexander Petrenko')
+    index.add('Olena Shevchenko')
+    assert index.find('Alaxandar') == [(2, 'Alexander Petrenko')]
+    assert index.find('alexandr petrneko') == [(2, 'Alexander Petrenko')]
+    assert index.find('Shefchinko') == [(2, 'Olena Shevchenko')]
+    assert index.find('Alaxzndar') == []  # three edits
+
+
+def test_fuzzy_finds_every_word_within_bound():
+    rng = random.Random(7)
+    letters = 'abcde'
+    words = {''.join(rng.choice(letters) for _ in range(rng.randint(1, 8))) for _ in range(400)}
+    index = indexes.FuzzyIndex()
+    for word in words:
+        index.add(word)
+    for _ in range(150):
+        query = ''.join(rng.choice(letters) for _ in range(rng.randint(1, 9)))
+        edits = indexes.max_edits(query)
+        distances = {word: indexes.distance(query, word) for word in words}
+        expected = {word: found for word, found in distances.items() if found <= edits}
+        assert index.within(query, edits) == expected
@@ -0,0 +1,143 @@
+import pickle
+import threading
+
+import pytest
+
+from remind_me import journal
+from remind_me.main import AddressBook, Record
+
+
+def load(filename):
+    book = AddressBook()
+    book.restore_from_file(str(filename))
+    return book
+
+
+def add(book, name, filename):
+    book.add_record(Record(name, None, None, f'{name.lower()}@mail.com'))
+    book.save_to_file(str(filename))
+
+
+@pytest.fixture
+def filename(tmp_path):
+    filename = tmp_path / 'contacts.pkl'
+    add(AddressBook(), 'Base', filename)
+    return filename
+
+
+def test_changes_replayed(filename):
+    book = load(filename)
+    add(book, 'Alice', filename)
+    book.find('Alice').add_note('call back')
+    book.save_to_file(str(filename))
+    book.delete('Base')
+    book.save_to_file(str(filename))
+    reloaded = load(filename)
+    assert sorted(reloaded.data) == ['Alice']
+    assert reloaded.find('Alice').notes[0].value == 'call back'
+
+
+def test_compact_then_new_session_keeps_changes(filename):
+    book = load(filename)
+    add(book, 'Bob', filename)
+    AddressBook.compact_file(str(filename), book.storage.seal())
+    assert journal.segments(filename) == []
+
+    book = load(filename)
+    add(book, 'Alice', filename)
+    assert sorted(load(filename).data) == ['Alice', 'Base', 'Bob']
+
+
+def test_change_after_background_compaction_kept(filename):
+    book = load(filename)
+    add(book, 'Bob', filename)
+    book.compact()
+    book.compactor.join()
+    add(book, 'Alice', filename)
+    assert sorted(load(filename).data) == ['Alice', 'Base', 'Bob']
+
+    book = load(filename)  # and once more after the snapshot folded both
+    book.compact()
+    book.compactor.join()
+    assert sorted(load(filename).data) == ['Alice', 'Base', 'Bob']
+
+
+def test_concurrent_sessions_merged(filename):
+    first, second = load(filename), load(filename)
+    add(first, 'Alice', filename)
+    add(second, 'Bob', filename)
+    assert sorted(load(filename).data) == ['Alice', 'Base', 'Bob']
+
+
+def test_bulk_added_name_changed_by_other_session(filename):
+    first, second = load(filename), load(filename)
+    add(second, 'Alice', filename)
+    first.add_records([Record('Alice', '0501234567', None, 'other@mail.com')])
+    first.save_to_file(str(filename))
+    assert first.find('Alice').email.value == load(filename).find('Alice').email.value
+
+
+def test_torn_last_entry_ignored(filename):
+    book = load(filename)
+    add(book, 'Alice', filename)
+    (seq, path), = journal.segments(filename)
+    with open(path, 'ab') as file:
+        file.write(b'\x80\x04\x95garbage')
+    assert sorted(load(filename).data) == ['Alice', 'Base']
+
+
+def test_snapshot_without_header_loaded(filename):  # written before the header frame existed
+    book = load(filename)
+    with open(filename, 'wb') as file:
+        pickle.dump(book.data, file)
+        pickle.dump(7, file)
+    book = load(filename)
+    assert sorted(book.data) == ['Base'] and book.covered == 7
+    add(book, 'Alice', filename)
+    assert journal.segments(filename)[0][0] == 8
+    assert sorted(load(filename).data) == ['Alice', 'Base']
+
+
+def test_replay_keeps_time_of_change(filename, monkeypatch):
+    book = load(filename)
+    book.find('Base').add_note('call back')
+    changed = book.find('Base').modified
+    book.save_to_file(str(filename))
+    monkeypatch.setattr('time.time', lambda: changed + 3600)
+    assert load(filename).find('Base').modified == changed
+
+
+def test_entries_without_time_of_change(filename):
+    segment = journal.Journal(str(filename))
+    segment.append(('add_note', 'Base', ('old entry',), 0))  # written before entries had the time
+    segment.flush()
+    segment.seal()
+    assert load(filename).find('Base').notes[0].value == 'old entry'
+
+
+def saved(book, filename):  # save in a thread, a save waiting for its own lock would hang the tests
+    saver = threading.Thread(target=book.save_to_file, args=(str(filename),), daemon=True)
+    saver.start()
+    saver.join(10)
+    assert not saver.is_alive(), 'save_to_file deadlocked'
+
+
+@pytest.mark.parametrize('content', [b'', b'\x80\x05torn'])
+def test_first_save_over_empty_or_torn_file(tmp_path, content):
+    filename = tmp_path / 'contacts.pkl'
+    filename.write_bytes(content)
+    book = AddressBook()
+    book.add_record(Record('Alice', None, None, 'alice@mail.com'))
+    saved(book, filename)
+    assert sorted(load(filename).data) == ['Alice']
+
+
+def test_first_saves_of_two_new_sessions_merged(tmp_path):
+    filename = tmp_path / 'contacts.pkl'
+    first, second = AddressBook(), AddressBook()
+    first.add_record(Record('Alice', None, None, 'alice@mail.com'))
+    second.add_record(Record('Bob', None, None, 'bob@mail.com'))
+    saved(first, filename)
+    saved(second, filename)  # the file exists now, its records are added to it
+    assert sorted(second.data) == ['Alice', 'Bob']
+    assert sorted(load(filename).data) == ['Alice', 'Bob']
@@ -0,0 +1,10 @@
+from remind_me import metrics
+
+
+def test_prometheus_escapes_label_values(monkeypatch):
+    monkeypatch.setattr(metrics, 'timers', {'menu.a"b\\c\nd': [1, 0.5, 0.5]})
+    monkeypatch.setattr(metrics, 'counters', {'clean."moved"': 2})
+    text = metrics.prometheus()
+    assert 'remindme_operation_calls_total{operation="menu.a\\"b\\\\c\\nd"} 1\n' in text
+    assert 'remindme_events_total{name="clean.\\"moved\\""} 2\n' in text
+    assert all(line.startswith(('# TYPE ', 'remindme_')) for line in text.splitlines())
@@ -0,0 +1,101 @@
+import pytest
+
+from remind_me import storage
+from remind_me.main import AddressBook, Record
+
+SORTS = [None, 'name', 'birthday', 'modified']
+
+
+def make_book():
+    book = AddressBook()
+    for i in range(23):
+        name = 'Name' + 'abcdefghijklmnopqrstuvw'[(i * 7) % 23]
+        birthday = None if i % 5 == 0 else f'1990-{i % 12 + 1:02d}-{i % 3 + 1:02d}'
+        record = Record(name, None, birthday, f'{name.lower()}@mail.com')
+        book.add_record(record)
+        record.modified = 1000.0 + i % 4  # equal times are ordered by name
+    return book
+
+
+@pytest.fixture
+def books(tmp_path):
+    memory = make_book()
+    filename = str(tmp_path / 'contacts.db')
+    make_book().save_to_file(filename)
+    sqlite = AddressBook()
+    sqlite.restore_from_file(filename)
+    assert isinstance(sqlite.data, storage.SQLiteStorage)
+    return memory, sqlite
+
+
+def walk(book, sort, size, page=0):
+    return [[record.name.value for record in records] for records in book.pages(size, sort=sort, page=page)]
+
+
+@pytest.mark.parametrize('sort', SORTS)
+@pytest.mark.parametrize('size', [1, 4, 23, 50])
+def test_pages_follow_sort(books, sort, size):
+    memory, sqlite = books
+    names = [name for page in walk(memory, sort, size) for name in page]
+    if sort is None:
+        expected = list(memory.data)
+    else:
+        expected = [record.name.value for record in sorted(memory.data.values(),
+                                                           key=lambda record: AddressBook.sort_key(sort, record))]
+    assert names == expected
+    assert walk(sqlite, sort, size) == walk(memory, sort, size)
+
+
+@pytest.mark.parametrize('sort', SORTS)
+def test_jump_to_page(books, sort):
+    memory, sqlite = books
+    assert walk(sqlite, sort, 4, page=2) == walk(memory, sort, 4)[2:]
+    assert walk(sqlite, sort, 4, page=9) == []
+
+
+def test_book_order_continues_after_changes(books):
+    memory, sqlite = books
+    pages = sqlite.pages(5)
+    first = [record.name.value for record in next(pages)]
+    sqlite.delete(first[-1])  # the next page starts after the last record shown, not at a position
+    rest = [record.name.value for records in pages for record in records]
+    assert first + rest == list(memory.data)
+
+
+def make_notes(book):
+    book.find('Namea').add_note('Зустріч у Києві', 'work')
+    book.find('Namea').add_note('call back', 'home')
+    book.find('Nameb').add_note('lunch', 'work')
+    book.find('Nameb').add_tag('lunch', 'urgent')
+    book.find('Namec').add_note('ЗУСТРІЧ with ÉLODIE')
+
+
+def tagged(pairs):
+    return [(record.name.value, note.value) for record, note in pairs]
+
+
+def test_tags_same_in_sqlite(books):
+    for book in books:
+        make_notes(book)
+    memory, sqlite = books
+    for tags in (['work'], ['work', 'urgent'], ['home', 'urgent'], ['none'], []):
+        for match_all in (False, True):
+            assert tagged(sqlite.find_tags(tags, match_all)) == tagged(memory.find_tags(tags, match_all))
+    assert tagged(sqlite.find_tags(['work', 'urgent'], match_all=True)) == [('Nameb', 'lunch #work#urgent')]
+    assert sqlite.tag_counts() == memory.tag_counts() == {'work': 2, 'home': 1, 'urgent': 1}
+    for book in books:
+        book.find('Nameb').edit_note('lunch', 'dinner')  # its tags go with the old text
+        book.find('Namea').delete_note('call')
+    assert tagged(sqlite.find_tags(['work', 'urgent', 'home'])) == [('Namea', 'Зустріч у Києві #work')]
+    assert sqlite.tag_counts() == memory.tag_counts() == {'work': 1}
+
+
+def test_sqlite_search_folds_non_ascii_case(books):
+    for book in books:
+        make_notes(book)
+    memory, sqlite = books
+    for query in ('зустріч', 'ЗУСТРІЧ', 'києві', 'élodie', 'NAMEC', '#WORK'):
+        found = [record.name.value for record in sqlite.search(query)]
+        assert found == [record.name.value for record in memory.search(query)]
+        assert found
+    assert [record.name.value for record in sqlite.search('зустріч')] == ['Namea', 'Namec']
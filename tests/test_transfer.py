@@ -0,0 +1,97 @@
+from pathlib import Path
+import errno
+import os
+import shutil
+import tempfile
+
+import pytest
+
+from remind_me import transfer
+
+
+def make_file(path, data=b'x' * 100000):
+    path.write_bytes(data)
+    os.chmod(path, 0o640)
+    os.utime(path, (1000000000, 1000000000))
+    return data
+
+
+def check_moved(source, destination, data):
+    assert not source.exists()
+    assert destination.read_bytes() == data
+    assert destination.stat().st_mode & 0o777 == 0o640
+    assert destination.stat().st_mtime == 1000000000
+    assert [path.name for path in destination.parent.iterdir()] == [destination.name]  # no .part left
+
+
+def other_file_system(tmp_path):
+    for folder in ('/dev/shm', os.environ.get('CROSS_DEVICE_DIR')):
+        if folder and os.path.isdir(folder) and os.stat(folder).st_dev != tmp_path.stat().st_dev:
+            return folder
+    pytest.skip('no folder on another file system')
+
+
+def test_move_between_file_systems(tmp_path):
+    folder = other_file_system(tmp_path)
+    source = tmp_path / 'video.mp4'
+    data = make_file(source)
+    target = Path(tempfile.mkdtemp(dir=folder))
+    try:
+        transfer.move_file(str(source), str(target / 'video.mp4'))
+        check_moved(source, target / 'video.mp4', data)
+    finally:
+        shutil.rmtree(target)
+
+
+@pytest.fixture
+def cross_device(monkeypatch):  # rename of the source fails as between two file systems
+    replace = os.replace
+
+    def failing(source, destination):
+        if not os.path.basename(source).startswith('.'):
+            raise OSError(errno.EXDEV, 'Invalid cross-device link', source, destination)
+        replace(source, destination)
+
+    monkeypatch.setattr(transfer.os, 'replace', failing)
+
+
+@pytest.mark.parametrize('kernel_copy', [True, False])
+def test_copied_when_rename_fails(tmp_path, monkeypatch, cross_device, kernel_copy):
+    if not kernel_copy:
+        monkeypatch.delattr(transfer.os, 'copy_file_range', raising=False)
+        monkeypatch.delattr(transfer.os, 'sendfile', raising=False)
+    source = tmp_path / 'a.bin'
+    data = make_file(source)
+    (tmp_path / 'target').mkdir()
+    destination = tmp_path / 'target' / 'a.bin'
+    transfer.move_file(str(source), str(destination))
+    check_moved(source, destination, data)
+
+
+def test_copied_without_posix_calls(tmp_path, monkeypatch, cross_device):
+    monkeypatch.delattr(transfer.os, 'chown', raising=False)
+    monkeypatch.setattr(transfer, 'SYNC_FOLDERS', False)
+    opened = []
+    monkeypatch.setattr(transfer.os, 'open', lambda *args: opened.append(args))
+    source = tmp_path / 'a.bin'
+    data = make_file(source)
+    (tmp_path / 'target').mkdir()
+    destination = tmp_path / 'target' / 'a.bin'
+    transfer.move_file(str(source), str(destination))
+    monkeypatch.undo()
+    check_moved(source, destination, data)
+    assert opened == []
+
+
+def test_failed_copy_keeps_source(tmp_path, monkeypatch, cross_device):
+    def broken(source, destination, size):
+        raise OSError(errno.ENOSPC, 'No space left on device')
+
+    monkeypatch.setattr(transfer, 'copy_data', broken)
+    source = tmp_path / 'a.bin'
+    data = make_file(source)
+    (tmp_path / 'target').mkdir()
+    with pytest.raises(OSError):
+        transfer.move_file(str(source), str(tmp_path / 'target' / 'a.bin'))
+    assert source.read_bytes() == data
+    assert list((tmp_path / 'target').iterdir()) == []
@@ -0,0 +1,109 @@
+import os
+import threading
+import time
+import zipfile
+
+import pytest
+
+from remind_me import watcher
+
+SETTLE = 0.2
+
+
+def write(path, data=b'x'):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.02)
+
+
+def test_file_is_ready_after_it_settled(tmp_path):
+    path = tmp_path / 'a.txt'
+    write(path)
+    watch = watcher.Watcher(tmp_path, settle=SETTLE, polling=True)
+    watch.seen(str(path))
+    assert watch.ready() == []
+    time.sleep(SETTLE * 0.75)
+    write(path, b'more')  # still being written
+    watch.seen(str(path))
+    time.sleep(SETTLE * 0.3)
+    assert watch.ready() == []  # settle starts again at the last change
+    time.sleep(SETTLE * 0.75)
+    assert watch.ready() == [str(path)]
+    assert watch.ready() == []
+
+
+def test_file_changed_without_an_event_waits(tmp_path):
+    path = tmp_path / 'a.txt'
+    write(path)
+    watch = watcher.Watcher(tmp_path, settle=SETTLE, polling=True)
+    watch.seen(str(path))
+    time.sleep(SETTLE)
+    os.utime(path, ns=(0, 0))  # e.g. written on a network mount
+    assert watch.ready() == []
+    time.sleep(SETTLE)
+    assert watch.ready() == [str(path)]
+
+
+def test_removed_files_and_folders_are_dropped(tmp_path):
+    path = tmp_path / 'a.txt'
+    write(path)
+    (tmp_path / 'folder').mkdir()
+    watch = watcher.Watcher(tmp_path, settle=SETTLE, polling=True)
+    watch.seen(str(path))
+    watch.seen(str(tmp_path / 'folder'))
+    path.unlink()
+    time.sleep(SETTLE)
+    assert watch.ready() == []
+    assert watch.pending == {}
+
+
+def test_run_sorts_arriving_files_and_reports_events(tmp_path, capsys):
+    events = []
+    watch = watcher.Watcher(tmp_path, settle=SETTLE, polling=True, callback=events.append)
+    watch.source.interval = 0.05
+    write(tmp_path / 'old.txt')
+    stop = threading.Event()
+    thread = threading.Thread(target=watch.run, args=(stop,))
+    thread.start()
+    try:
+        write(tmp_path / 'new' / 'b.jpg')
+        with zipfile.ZipFile(tmp_path / 'c.zip', 'w') as archive:
+            archive.writestr('inside.txt', 'text')
+        wait_for(lambda: len(events) == 3)
+    finally:
+        stop.set()
+        thread.join()
+    assert watch.sorted == 3
+    moves = sorted((event.kind, os.path.relpath(event.target, tmp_path)) for event in events)
+    assert moves == [('move', os.path.join('documents', 'TXT', 'old.txt')),
+                     ('move', os.path.join('images', 'JPG', 'b.jpg')),
+                     ('unpack', os.path.join('archives', 'ZIP', 'c'))]
+    assert (tmp_path / 'archives' / 'ZIP' / 'c' / 'inside.txt').read_text() == 'text'
+    assert capsys.readouterr().out == ''
+
+
+def test_switch_to_polling_when_inotify_fails(tmp_path, monkeypatch):
+    write(tmp_path / 'sub' / 'a.txt')
+    watch = watcher.Watcher(tmp_path, settle=SETTLE)
+    if isinstance(watch.source, watcher.Poller):
+        pytest.skip('inotify is not available')
+
+    def full(folder):
+        raise OSError(28, 'No space left on device')
+
+    monkeypatch.setattr(watch.source, 'add', full)
+    events = list(watch.add(str(tmp_path)))
+    assert [(event.kind, event.path) for event in events] == [('polling', str(tmp_path))]
+    assert isinstance(watch.source, watcher.Poller)
+    assert sorted(watch.source.mtimes) == [str(tmp_path), str(tmp_path / 'sub')]
+    assert list(watch.pending) == [str(tmp_path / 'sub' / 'a.txt')]
+    time.sleep(0.01)
+    write(tmp_path / 'sub' / 'b.txt')
+    watch.source.polled = 0  # the next poll is due
+    assert (str(tmp_path / 'sub' / 'b.txt'), False) in watch.source.changes(0)